@@ -0,0 +1,78 @@
+"""
+Start-up benchmark: time to import the simulator and resolve a backend,
+each measured in a fresh interpreter.
+
+Backends that do not run compiled kernels (sequential, numpy) do not
+import Numba at all (tests/test_lazy_imports.py checks that); the script
+exits with status 1 if their start-up exceeds --budget seconds, so a slow
+regression in the lazy kernel/backend registry shows up here.
+
+    python bench_import_time.py [--repeat 5] [--budget 0.5]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+from traffic_sim.backends import BACKENDS
+
+# Backends whose start-up is held to --budget
+NUMBA_FREE_BACKENDS = ("sequential", "numpy")
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+from traffic_sim.experiments.runner import run_single
+from traffic_sim.backends import get_backend
+get_backend({name!r})
+elapsed = time.perf_counter() - t0
+print(json.dumps({{
+    "seconds": elapsed,
+    "numba": "numba" in sys.modules,
+    "numba_cuda": "numba.cuda" in sys.modules,
+}}))
+"""
+
+
+def measure(name: str, repeat: int) -> Dict[str, object]:
+    """Median start-up time of one backend over repeat fresh interpreters."""
+    times: List[float] = []
+    sample: Dict[str, object] = {}
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE.format(name=name)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        sample = json.loads(out.strip().splitlines()[-1])
+        times.append(float(sample["seconds"]))
+    return {
+        "seconds": statistics.median(times),
+        "numba": sample["numba"],
+        "numba_cuda": sample["numba_cuda"],
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=0.5,
+                        help="max start-up time [s] of the Numba-free backends")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'backend':<12} {'start-up [s]':>12}  numba  numba.cuda")
+    for name in BACKENDS:
+        r = measure(name, args.repeat)
+        print(f"{name:<12} {r['seconds']:>12.3f}  {str(r['numba']):<5}  {r['numba_cuda']}")
+        if name in NUMBA_FREE_BACKENDS and r["seconds"] > args.budget:
+            print(f"  FAIL: backend '{name}' start-up above {args.budget} s")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Adaptive time stepping: in free flow the steps grow towards dt_max, so a
+run takes far fewer steps than with fixed dt, and every chosen step stays
+in [dt_min, dt_max] except the documented Poisson jump over an empty world.
+"""
+import pytest
+
+from traffic_sim.backends import get_backend
+from traffic_sim.config import SimulationConfig
+
+DT_MIN, DT_MAX = 0.05, 1.0
+
+
+def run_recording_dt(config: SimulationConfig):
+    """Run config and return its world and every (dt, num_vehicles) choose_dt picked."""
+    backend = get_backend(config.backend)(config)
+    world = backend.world
+    choose_dt = world.choose_dt
+    chosen = []
+
+    def recording_choose_dt(dt_min: float, dt_max: float) -> float:
+        dt = choose_dt(dt_min, dt_max)
+        chosen.append((dt, world.num_vehicles))
+        return dt
+
+    world.choose_dt = recording_choose_dt
+    backend.run()
+    return world, chosen
+
+
+@pytest.mark.parametrize("backend", ["sequential", "numpy", "openmp"])
+def test_adaptive_dt_cuts_steps_in_free_flow(backend):
+    config = SimulationConfig(
+        total_time=120.0,
+        spawn_rate=0.1,
+        random_seed=3,
+        backend=backend,
+        adaptive_dt=True,
+        dt_min=DT_MIN,
+        dt_max=DT_MAX,
+    )
+    world, chosen = run_recording_dt(config)
+
+    fixed_steps = int(config.total_time / config.dt)
+    assert world.metrics_raw.finished_count > 0
+    assert world.steps_executed == len(chosen)
+    assert world.steps_executed < fixed_steps / 2
+    assert all(DT_MIN <= dt <= DT_MAX for dt, _ in chosen)
+    assert world.time == pytest.approx(config.total_time)
+
+
+def test_poisson_empty_world_jumps_past_dt_max():
+    config = SimulationConfig(
+        total_time=300.0,
+        spawn_rate=0.01,
+        random_seed=3,
+        arrival_process="poisson",
+        adaptive_dt=True,
+        dt_min=DT_MIN,
+        dt_max=DT_MAX,
+    )
+    world, chosen = run_recording_dt(config)
+
+    jumps = [(dt, n) for dt, n in chosen if dt > DT_MAX]
+    assert world.metrics_raw.finished_count > 0
+    assert jumps
+    assert all(n == 0 for _, n in jumps)
+    assert all(dt >= DT_MIN for dt, _ in chosen)
+
+
+def test_choose_dt_rejects_bad_bounds():
+    world = get_backend("sequential")(SimulationConfig()).world
+    with pytest.raises(ValueError):
+        world.choose_dt(0.01, DT_MAX)
+    with pytest.raises(ValueError):
+        world.choose_dt(0.5, 0.2)
@@ -0,0 +1,168 @@
+"""
+The CPU backends must agree bit for bit for the same seed: the numpy,
+openmp and ensemble runs are checked against the sequential one, in both
+precisions, on a single intersection and a 2 x 2 grid, with random turns
+and OD routing, for both arrival processes.
+"""
+import numba
+import numpy as np
+import pytest
+
+from traffic_sim.backends import get_backend
+from traffic_sim.config import SimulationConfig
+from traffic_sim.experiments.runner import check_precision_equivalence, run_ensemble
+
+SEED = 7
+NUM_THREADS = min(4, numba.config.NUMBA_NUM_THREADS)
+SUMMARY_FIELDS = ("vehicles_completed", "avg_travel_time", "avg_stops_per_vehicle", "throughput_veh_per_min")
+
+_reference_runs = {}
+
+
+def make_config(tmp_path_factory, **overrides) -> SimulationConfig:
+    params = dict(
+        total_time=60.0,
+        spawn_rate=0.8,
+        max_vehicles=400,
+        random_seed=SEED,
+        num_threads=NUM_THREADS,
+        cache_dir=str(tmp_path_factory.getbasetemp() / "cache"),
+    )
+    params.update(overrides)
+    return SimulationConfig(**params)  # type: ignore[arg-type]
+
+
+def run_backend(config: SimulationConfig):
+    """The backend of config after running it, and its result."""
+    backend = get_backend(config.backend)(config)
+    return backend, backend.run()
+
+
+def reference_run(config: SimulationConfig):
+    """Sequential run of config (cached across the parametrized cases)."""
+    cfg_dict = config.to_dict()
+    cfg_dict["backend"] = "sequential"
+    cfg_dict["num_threads"] = 1
+    key = tuple(sorted(cfg_dict.items()))
+    if key not in _reference_runs:
+        _reference_runs[key] = run_backend(SimulationConfig(**cfg_dict))  # type: ignore[arg-type]
+    return _reference_runs[key]
+
+
+def assert_same_world(world, ref) -> None:
+    """The vehicles in the lanes of world and ref and their finished metrics are equal."""
+    assert world.positions.dtype == ref.positions.dtype
+    assert world.num_vehicles == ref.num_vehicles
+    assert world.metrics_raw.total_spawned == ref.metrics_raw.total_spawned
+    np.testing.assert_array_equal(world.counts, ref.counts)
+    for lane_idx in range(len(world.counts)):
+        occupied = (world.heads[lane_idx] + np.arange(world.counts[lane_idx])) % world.capacity
+        ref_occupied = (ref.heads[lane_idx] + np.arange(ref.counts[lane_idx])) % ref.capacity
+        for name in ("positions", "speeds", "stops", "spawn_times", "vehicle_ids"):
+            np.testing.assert_array_equal(
+                getattr(world, name)[lane_idx, occupied],
+                getattr(ref, name)[lane_idx, ref_occupied],
+                err_msg=f"{name} of lane {lane_idx}",
+            )
+    assert world.metrics_raw.finished_count == ref.metrics_raw.finished_count
+    assert world.metrics_raw.stops.total == ref.metrics_raw.stops.total
+
+
+def assert_same_summary(result, ref) -> None:
+    # Finished vehicles may be summed in another order (lane by lane in the
+    # compiled time loop), so the averages only agree up to rounding
+    assert result.vehicles_completed == ref.vehicles_completed
+    for name in SUMMARY_FIELDS[1:]:
+        assert getattr(result, name) == pytest.approx(getattr(ref, name), rel=1e-12), name
+
+
+@pytest.mark.parametrize("arrival_process", ["bernoulli", "poisson"])
+@pytest.mark.parametrize("od_routing", [False, True])
+@pytest.mark.parametrize("grid", [(1, 1), (2, 2)])
+@pytest.mark.parametrize("precision", ["float64", "float32"])
+@pytest.mark.parametrize("backend", ["numpy", "openmp"])
+def test_backend_matches_sequential(tmp_path_factory, backend, precision, grid, od_routing, arrival_process):
+    config = make_config(
+        tmp_path_factory,
+        backend=backend,
+        precision=precision,
+        grid_rows=grid[0],
+        grid_cols=grid[1],
+        od_routing=od_routing,
+        arrival_process=arrival_process,
+    )
+    ref_backend, ref_result = reference_run(config)
+    run, result = run_backend(config)
+
+    assert ref_result.vehicles_completed > 0
+    assert_same_world(run.world, ref_backend.world)
+    assert_same_summary(result, ref_result)
+
+
+@pytest.mark.parametrize("od_routing", [False, True])
+@pytest.mark.parametrize("grid", [(1, 1), (2, 2)])
+@pytest.mark.parametrize("precision", ["float64", "float32"])
+def test_ensemble_matches_sequential(tmp_path_factory, precision, grid, od_routing):
+    config = make_config(
+        tmp_path_factory,
+        precision=precision,
+        grid_rows=grid[0],
+        grid_cols=grid[1],
+        od_routing=od_routing,
+    )
+    seeds = [SEED, SEED + 1]
+    results = run_ensemble(config, seeds)
+
+    for seed, result in zip(seeds, results):
+        cfg_dict = config.to_dict()
+        cfg_dict["random_seed"] = seed
+        _, ref_result = reference_run(SimulationConfig(**cfg_dict))  # type: ignore[arg-type]
+        assert result.config["random_seed"] == seed
+        assert_same_summary(result, ref_result)
+        assert set(ref_result.extra_stats) <= set(result.extra_stats)
+        for name in ("total_spawned", "vehicles_in_world_end", "steps_executed", "steps_skipped"):
+            assert result.extra_stats[name] == ref_result.extra_stats[name], name
+
+
+def test_ensemble_rejects_poisson(tmp_path_factory):
+    with pytest.raises(ValueError):
+        run_ensemble(make_config(tmp_path_factory, arrival_process="poisson"), [SEED])
+
+
+@pytest.mark.parametrize("grid", [(1, 1), (2, 2)])
+@pytest.mark.parametrize("precision", ["float64", "float32"])
+def test_intra_lane_scan_matches_sequential(tmp_path_factory, precision, grid):
+    # Saturated lanes, split across threads from 4 vehicles on
+    config = make_config(
+        tmp_path_factory,
+        backend="openmp",
+        spawn_rate=3.0,
+        precision=precision,
+        grid_rows=grid[0],
+        grid_cols=grid[1],
+    )
+    ref_backend, ref_result = reference_run(config)
+    run = get_backend(config.backend)(config)
+    run.world.intra_lane_min_vehicles = 4
+    result = run.run()
+
+    assert run.world.counts.max() >= 4 * NUM_THREADS
+    assert_same_world(run.world, ref_backend.world)
+    assert_same_summary(result, ref_result)
+
+
+@pytest.mark.parametrize("adaptive_dt", [False, True])
+@pytest.mark.parametrize("backend", ["sequential", "numpy", "openmp"])
+def test_float32_summary_matches_float64(tmp_path_factory, backend, adaptive_dt):
+    config = make_config(tmp_path_factory, backend=backend, adaptive_dt=adaptive_dt, total_time=120.0)
+    diffs = check_precision_equivalence(config)
+
+    assert set(diffs) == set(SUMMARY_FIELDS)
+    assert all(d <= 5e-2 for d in diffs.values())
+
+
+def test_precision_equivalence_raises_past_rtol(tmp_path_factory):
+    config = make_config(tmp_path_factory, backend="numpy")
+    with pytest.raises(RuntimeError):
+        # No difference is negative
+        check_precision_equivalence(config, rtol=-1.0)
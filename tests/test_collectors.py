@@ -0,0 +1,158 @@
+"""
+Streaming metric aggregates: StreamingStats merges exactly in count, sum,
+min and max (and in the variance up to rounding), whatever the split and
+order of the stream; QuantileSketch answers within its relative accuracy
+and merges by adding bucket counts.
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+from traffic_sim.metrics.collectors import QuantileSketch, StreamingStats
+
+
+def stats_of(values) -> StreamingStats:
+    stats = StreamingStats()
+    stats.add_many(np.asarray(values, dtype=np.float64))
+    return stats
+
+
+def chunks_of(values: np.ndarray, sizes) -> list:
+    return np.split(values, np.cumsum(sizes)[:-1])
+
+
+def test_merged_chunks_match_one_stream():
+    rng = np.random.default_rng(0)
+    # Quarters below 2^40 sum exactly in any order
+    values = rng.integers(0, 4000, size=1000) / 4.0
+    chunks = chunks_of(values, [1, 250, 0, 400, 349])
+    whole = stats_of(values)
+
+    for order in itertools.permutations(range(len(chunks))):
+        merged = StreamingStats.merged(stats_of(chunks[i]) for i in order)
+        assert merged.count == whole.count == len(values)
+        assert merged.total == whole.total == values.sum()
+        assert merged.min == values.min() and merged.max == values.max()
+        assert merged.mean == np.mean(values)
+        assert merged.variance == pytest.approx(np.var(values), rel=1e-12)
+        assert merged.std == pytest.approx(np.std(values), rel=1e-12)
+
+
+def test_batches_added_in_turn_match_np_var():
+    rng = np.random.default_rng(1)
+    values = rng.lognormal(3.0, 0.5, size=5000)
+    stats = StreamingStats()
+    for chunk in chunks_of(values, [7, 993, 2000, 2000]):
+        stats.add_many(chunk)
+
+    assert stats.count == len(values)
+    assert stats.total == pytest.approx(values.sum(), rel=1e-14)
+    assert stats.mean == pytest.approx(np.mean(values), rel=1e-14)
+    assert stats.variance == pytest.approx(np.var(values), rel=1e-12)
+    assert (stats.min, stats.max) == (values.min(), values.max())
+
+
+def test_empty_stats():
+    empty = StreamingStats()
+    assert (empty.count, empty.mean, empty.variance, empty.std) == (0, 0.0, 0.0, 0.0)
+    assert empty.to_dict("x") == {"x_std": 0.0, "x_min": 0.0, "x_max": 0.0}
+
+    empty.add_many(np.array([]))
+    assert empty == StreamingStats()
+
+    stats = stats_of([1.0, 2.0])
+    stats.merge(StreamingStats())
+    assert stats == stats_of([1.0, 2.0])
+    assert StreamingStats.merged([StreamingStats(), stats]) == stats
+    assert StreamingStats.merged([]) == StreamingStats()
+
+
+def test_single_sample():
+    stats = stats_of([4.5])
+    assert (stats.count, stats.total, stats.mean) == (1, 4.5, 4.5)
+    assert (stats.variance, stats.min, stats.max) == (0.0, 4.5, 4.5)
+
+    stats.merge(stats_of([6.5]))
+    assert stats.mean == 5.5
+    assert stats.variance == pytest.approx(1.0)
+    assert stats.to_dict("x") == {"x_std": pytest.approx(1.0), "x_min": 4.5, "x_max": 6.5}
+
+
+def sketch_of(values, **params) -> QuantileSketch:
+    sketch = QuantileSketch(**params)
+    sketch.add_many(np.asarray(values, dtype=np.float64))
+    return sketch
+
+
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.05])
+def test_sketch_quantiles_within_relative_accuracy(relative_accuracy):
+    rng = np.random.default_rng(2)
+    values = rng.lognormal(3.0, 1.0, size=20000)
+    sketch = sketch_of(values, relative_accuracy=relative_accuracy)
+
+    assert sketch.count == len(values)
+    for q in (0.0, 0.5, 0.9, 0.99, 1.0):
+        # The sketch answers for the sample at rank floor(q * (n - 1))
+        exact = np.quantile(values, q, method="lower")
+        assert sketch.quantile(q) == pytest.approx(exact, rel=relative_accuracy), q
+    assert set(sketch.to_dict("tt")) == {"tt_p50", "tt_p90", "tt_p95", "tt_p99"}
+
+
+def test_merged_sketches_equal_sketch_of_all_values():
+    rng = np.random.default_rng(3)
+    values = np.concatenate([np.zeros(50), rng.lognormal(2.0, 1.5, size=3000)])
+    rng.shuffle(values)
+    parts = np.split(values, [1000, 1001, 2500])
+
+    merged = QuantileSketch()
+    for part in parts:
+        merged.merge(sketch_of(part))
+    whole = sketch_of(values)
+
+    assert merged.zero_count == whole.zero_count == 50
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+    for q in (0.01, 0.5, 0.9, 0.99):
+        assert merged.quantile(q) == whole.quantile(q)
+
+
+def test_bucket_counts_add_like_merge():
+    rng = np.random.default_rng(4)
+    a = sketch_of(rng.lognormal(2.0, 1.0, size=500))
+    b = sketch_of(np.concatenate([np.zeros(3), rng.lognormal(1.0, 1.0, size=700)]))
+
+    by_counts = sketch_of([])
+    by_counts.add_bucket_counts(a.counts, a.zero_count)
+    by_counts.add_bucket_counts(b.counts, b.zero_count)
+    a.merge(b)
+
+    assert by_counts.zero_count == a.zero_count == 3
+    np.testing.assert_array_equal(by_counts.counts, a.counts)
+
+
+def test_sketch_merge_needs_the_same_parameters():
+    with pytest.raises(ValueError):
+        QuantileSketch().merge(QuantileSketch(relative_accuracy=0.02))
+    with pytest.raises(ValueError):
+        QuantileSketch().merge(QuantileSketch(max_value=1e3))
+
+
+def test_values_outside_the_bucket_range():
+    sketch = sketch_of([0.0, -2.0, 5e-4, 1e9, 1e12], min_value=1e-3, max_value=1e6)
+
+    # Below min_value (and negative) in the zero bucket, which reads as 0
+    assert sketch.zero_count == 3
+    assert sketch.quantile(0.0) == 0.0 and sketch.quantile(0.5) == 0.0
+    # Above max_value clamped into the last bucket
+    assert sketch.counts[-1] == 2
+    assert sketch.quantile(1.0) == pytest.approx(1e6, rel=sketch.relative_accuracy)
+
+
+def test_empty_sketch_and_invalid_arguments():
+    sketch = QuantileSketch()
+    assert sketch.count == 0
+    assert sketch.quantile(0.5) == 0.0
+    with pytest.raises(ValueError):
+        sketch.quantile(1.5)
+    with pytest.raises(ValueError):
+        QuantileSketch(relative_accuracy=0.0)
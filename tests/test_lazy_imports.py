@@ -0,0 +1,47 @@
+"""
+Start-up imports, each checked in a fresh interpreter: the sequential and
+numpy backends never import Numba, not even to build an OD routing table,
+and only the cuda backend imports numba.cuda (see model.kernels).
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys
+from traffic_sim.backends import get_backend
+from traffic_sim.config import SimulationConfig
+config = SimulationConfig(**json.loads(sys.argv[1]))
+get_backend(config.backend)(config)
+print(json.dumps({"numba": "numba" in sys.modules, "numba_cuda": "numba.cuda" in sys.modules}))
+"""
+
+
+def imported_modules(config: dict) -> dict:
+    """Which of numba / numba.cuda building a backend for config imports."""
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE, json.dumps(config)],
+        cwd=REPO_ROOT, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize(
+    "overrides",
+    [{}, {"od_routing": True, "grid_rows": 2, "grid_cols": 2}],
+    ids=["default", "od_routing"],
+)
+@pytest.mark.parametrize("backend", ["sequential", "numpy"])
+def test_backend_without_numba(tmp_path, backend, overrides):
+    # An empty cache_dir, so that the routing table is built
+    config = {"backend": backend, "cache_dir": str(tmp_path), **overrides}
+    assert imported_modules(config) == {"numba": False, "numba_cuda": False}
+
+
+def test_openmp_backend_without_numba_cuda():
+    assert imported_modules({"backend": "openmp"})["numba_cuda"] is False
@@ -0,0 +1,218 @@
+"""
+Road networks loaded from CSV/GeoJSON edge lists: parsing, turn
+classification, the compiled-array cache, the error paths, and a run on a
+loaded copy of the grid.
+"""
+import csv
+import json
+import os
+
+import numpy as np
+import pytest
+
+from traffic_sim.backends import get_backend
+from traffic_sim.config import SimulationConfig
+from traffic_sim.io import network_loader
+from traffic_sim.io.network_loader import file_hash, load_network
+from traffic_sim.model.road_network import LINK_ARRAYS, RoadNetwork
+from traffic_sim.model.vehicles import TURN_CHOICES, Direction
+
+CSV_FIELDS = ["from_node", "to_node", "from_x", "from_y", "to_x", "to_y"]
+
+# A crossing at C: one edge arriving from the south and one edge leaving
+# towards every side, plus a second edge to the east that is further off
+# the exact right turn. Edges are (from, to, from_xy, to_xy).
+CROSSING = [
+    ("S", "C", (0.0, -100.0), (0.0, 0.0)),
+    ("C", "N", (0.0, 0.0), (0.0, 100.0)),
+    ("C", "E", (0.0, 0.0), (100.0, 0.0)),
+    ("C", "W", (0.0, 0.0), (-100.0, 0.0)),
+    ("C", "S", (0.0, 0.0), (0.0, -100.0)),
+    ("C", "E2", (0.0, 0.0), (100.0, 30.0)),
+]
+
+
+def write_csv(path, edges, extra=None) -> str:
+    """Write (from, to, from_xy, to_xy) edges, with extra columns per edge if given."""
+    extra = extra or [{} for _ in edges]
+    fields = CSV_FIELDS + sorted({k for e in extra for k in e})
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for (a, b, (ax, ay), (bx, by)), more in zip(edges, extra):
+            writer.writerow(dict(from_node=a, to_node=b, from_x=ax, from_y=ay, to_x=bx, to_y=by, **more))
+    return str(path)
+
+
+def write_geojson(path, edges, node_ids=True) -> str:
+    """Write edges as LineStrings with a midpoint, naming the nodes only if node_ids."""
+    features = []
+    for a, b, start, end in edges:
+        mid = [(start[0] + end[0]) / 2.0, (start[1] + end[1]) / 2.0]
+        props = {"from_node": a, "to_node": b} if node_ids else {}
+        features.append({
+            "type": "Feature",
+            "properties": props,
+            "geometry": {"type": "LineString", "coordinates": [list(start), mid, list(end)]},
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+    return str(path)
+
+
+def grid_edges(rows: int, cols: int):
+    """
+    Edges and stop_line columns of the rows x cols RoadNetwork grid: link
+    (intersection, heading) is the edge arriving at the intersection in
+    that heading, 100 m long with its stop line 55 m before its end.
+    """
+    steps = {Direction.NORTH: (-1, 0), Direction.EAST: (0, 1), Direction.SOUTH: (1, 0), Direction.WEST: (0, -1)}
+    edges, extra = [], []
+    for i in range(rows * cols):
+        r, c = divmod(i, cols)
+        for d in Direction:
+            ur, uc = r - steps[d][0], c - steps[d][1]
+            inside = 0 <= ur < rows and 0 <= uc < cols
+            upstream = f"{ur},{uc}" if inside else f"source {i} {d.name}"
+            edges.append((upstream, f"{r},{c}", (100.0 * uc, -100.0 * ur), (100.0 * c, -100.0 * r)))
+            extra.append({"stop_line": 55.0})
+    return edges, extra
+
+
+def first_seen_labels(values: np.ndarray) -> np.ndarray:
+    """values relabelled 0, 1, ... in order of first appearance."""
+    labels = {}
+    return np.array([labels.setdefault(v, len(labels)) for v in values.tolist()])
+
+
+def downstream_of(net: RoadNetwork, link: int):
+    """{turn name: downstream link} of link."""
+    lo, hi = net.downstream_ptr[link], net.downstream_ptr[link + 1]
+    return {TURN_CHOICES[t]: int(l) for l, t in zip(net.downstream_link[lo:hi], net.downstream_turn[lo:hi])}
+
+
+def test_csv_and_geojson_compile_to_the_same_links(tmp_path):
+    from_csv = load_network(write_csv(tmp_path / "crossing.csv", CROSSING), str(tmp_path / "cache"))
+    from_geojson = load_network(write_geojson(tmp_path / "crossing.geojson", CROSSING), str(tmp_path / "cache"))
+    unnamed = load_network(
+        write_geojson(tmp_path / "unnamed.json", CROSSING, node_ids=False), str(tmp_path / "cache")
+    )
+
+    assert from_csv.num_links == len(CROSSING)
+    for net in (from_geojson, unnamed):
+        for name in LINK_ARRAYS:
+            np.testing.assert_array_equal(getattr(net, name), getattr(from_csv, name), err_msg=name)
+    np.testing.assert_allclose(from_csv.link_length[:5], 100.0)
+    np.testing.assert_allclose(from_csv.link_stop_line, from_csv.link_length - network_loader.STOP_LINE_FROM_END)
+
+
+def test_turns_follow_the_change_of_heading(tmp_path):
+    net = load_network(write_csv(tmp_path / "crossing.csv", CROSSING), str(tmp_path / "cache"))
+
+    np.testing.assert_array_equal(
+        net.link_direction,
+        [Direction.NORTH, Direction.NORTH, Direction.EAST, Direction.WEST, Direction.SOUTH, Direction.EAST],
+    )
+    # S->C continues straight to N, right to E (closer to 90 degrees than
+    # E2), left to W; the U-turn back to S is not taken
+    assert downstream_of(net, 0) == {"straight": 1, "right": 2, "left": 3}
+    # Every edge leaving C ends at an exit
+    for link in range(1, len(CROSSING)):
+        assert downstream_of(net, link) == {}
+
+
+def test_stop_line_column_sets_the_stop_line(tmp_path):
+    extra = [{"stop_line": 20.0}] + [{"stop_line": ""} for _ in CROSSING[1:]]
+    net = load_network(write_csv(tmp_path / "crossing.csv", CROSSING, extra), str(tmp_path / "cache"))
+
+    assert net.link_stop_line[0] == pytest.approx(80.0)
+    assert net.link_stop_line[1] == pytest.approx(100.0 - network_loader.STOP_LINE_FROM_END)
+
+
+def test_cache_hit_skips_parsing_and_changed_file_misses(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    path = write_csv(tmp_path / "crossing.csv", CROSSING)
+    compiled = load_network(path, cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+
+    def no_parsing(path):
+        raise AssertionError("cached network was parsed again")
+
+    monkeypatch.setattr(network_loader, "_read_csv", no_parsing)
+    cached = load_network(path, cache_dir)
+    for name in LINK_ARRAYS:
+        np.testing.assert_array_equal(getattr(cached, name), getattr(compiled, name), err_msg=name)
+    monkeypatch.undo()
+
+    hash_before = file_hash(path, "csv")
+    write_csv(tmp_path / "crossing.csv", CROSSING, [{"length": 150.0} for _ in CROSSING])
+    assert file_hash(path, "csv") != hash_before
+    assert file_hash(path, "csv") != file_hash(path, "geojson")
+    changed = load_network(path, cache_dir)
+    np.testing.assert_allclose(changed.link_length, 150.0)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+@pytest.mark.parametrize(
+    "name, content, message",
+    [
+        ("net.txt", "", "Unknown network file type"),
+        ("net.csv", "from_node,to_node,from_x,from_y\n", "missing CSV columns"),
+        ("net.csv", "from_node,to_node,from_x,from_y,to_x,to_y\nA,B,0,0,x,10\n", "malformed edge row"),
+        ("net.csv", "from_node,to_node,from_x,from_y,to_x,to_y\nA,B,0,0\n", "malformed edge row"),
+        ("net.csv", "from_node,to_node,from_x,from_y,to_x,to_y\n,B,0,0,0,100\n", "empty node id"),
+        (
+            "net.csv",
+            "from_node,to_node,from_x,from_y,to_x,to_y\nA,B,0,0,0,100\nB,C,0,150,0,250\n",
+            "node 'B' is at",
+        ),
+        ("net.csv", "from_node,to_node,from_x,from_y,to_x,to_y\nA,B,0,0,0,4\n", "must be longer"),
+        ("net.csv", "from_node,to_node,from_x,from_y,to_x,to_y\n", "no edges"),
+        ("net.geojson", '{"type": "Feature"}', "not a GeoJSON FeatureCollection"),
+        (
+            "net.geojson",
+            json.dumps({"type": "FeatureCollection", "features": [
+                {"type": "Feature", "properties": {"from_node": "A"},
+                 "geometry": {"type": "LineString", "coordinates": [[0, 0], [0, 100]]}},
+            ]}),
+            "only one of from_node and to_node",
+        ),
+        (
+            "net.geojson",
+            json.dumps({"type": "FeatureCollection", "features": [
+                {"type": "Feature", "properties": {},
+                 "geometry": {"type": "Point", "coordinates": [0, 0]}},
+            ]}),
+            "LineString",
+        ),
+    ],
+)
+def test_invalid_files_raise(tmp_path, name, content, message):
+    path = tmp_path / name
+    path.write_text(content, encoding="utf-8")
+    with pytest.raises(ValueError, match=message):
+        load_network(str(path), str(tmp_path / "cache"))
+
+
+def test_loaded_grid_runs_like_the_grid(tmp_path):
+    edges, extra = grid_edges(2, 2)
+    path = write_csv(tmp_path / "grid.csv", edges, extra)
+    loaded = load_network(path, str(tmp_path / "cache"))
+    grid = RoadNetwork(rows=2, cols=2)
+
+    for name in LINK_ARRAYS:
+        if name != "link_signal":
+            np.testing.assert_array_equal(getattr(loaded, name), getattr(grid, name), err_msg=name)
+    # Node ids are numbered in order of appearance, sources included
+    np.testing.assert_array_equal(first_seen_labels(loaded.link_signal), first_seen_labels(grid.link_signal))
+
+    common = dict(total_time=120.0, spawn_rate=0.5, random_seed=4, cache_dir=str(tmp_path / "cache"))
+    from_file = get_backend("numpy")(SimulationConfig(network_file=path, **common))
+    from_grid = get_backend("numpy")(SimulationConfig(grid_rows=2, grid_cols=2, **common))
+    result, ref = from_file.run(), from_grid.run()
+
+    assert ref.vehicles_completed > 0
+    for name in ("vehicles_completed", "avg_travel_time", "avg_stops_per_vehicle", "throughput_veh_per_min"):
+        assert getattr(result, name) == getattr(ref, name), name
+    np.testing.assert_array_equal(from_file.world.counts, from_grid.world.counts)
+    np.testing.assert_array_equal(from_file.world.positions, from_grid.world.positions)
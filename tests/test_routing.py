@@ -0,0 +1,167 @@
+"""
+OD routing tables: following the next hops from every link reaches each
+reachable destination on a shortest route (checked against a plain
+Dijkstra over the downstream links), and tables are cached on disk under
+the network's content hash.
+"""
+import heapq
+import os
+
+import numpy as np
+import pytest
+
+from traffic_sim.model import disk_cache, routing
+from traffic_sim.model.road_network import LINK_ARRAYS, RoadNetwork
+from traffic_sim.model.routing import build_routing_table, compute_routing_table
+from traffic_sim.model.vehicles import TURN_CHOICES, Direction
+
+
+def with_lengths(net: RoadNetwork, link_length: np.ndarray) -> RoadNetwork:
+    arrays = {name: getattr(net, name) for name in LINK_ARRAYS}
+    arrays["link_length"] = link_length
+    arrays["link_stop_line"] = link_length / 2.0
+    return RoadNetwork.from_links(**arrays)
+
+
+def uneven_grid(rows: int, cols: int, seed: int = 0) -> RoadNetwork:
+    grid = RoadNetwork(rows=rows, cols=cols)
+    lengths = np.random.default_rng(seed).uniform(50.0, 300.0, grid.num_links)
+    return with_lengths(grid, lengths)
+
+
+def downstream(net: RoadNetwork, link: int):
+    lo, hi = net.downstream_ptr[link], net.downstream_ptr[link + 1]
+    return list(zip(net.downstream_link[lo:hi].tolist(), net.downstream_turn[lo:hi].tolist()))
+
+
+def route_lengths(net: RoadNetwork, start: int):
+    """Length of the links entered on a shortest route from the end of start to the end of every link."""
+    dist = {start: 0.0}
+    heap = [(0.0, start)]
+    while heap:
+        d, link = heapq.heappop(heap)
+        if d > dist[link]:
+            continue
+        for nxt, _ in downstream(net, link):
+            nd = d + net.link_length[nxt]
+            if nd < dist.get(nxt, np.inf):
+                dist[nxt] = nd
+                heapq.heappush(heap, (nd, nxt))
+    return dist
+
+
+def test_grid_routes_by_hand():
+    net = RoadNetwork(rows=2, cols=2)
+    table = compute_routing_table(net)
+    straight, right, left = (TURN_CHOICES.index(t) for t in ("straight", "right", "left"))
+
+    def link(intersection: int, heading: Direction) -> int:
+        return intersection * len(Direction) + int(heading)
+
+    def turn(dest: int, at: int) -> int:
+        return int(table.next_turn[list(table.destinations).index(dest), at])
+
+    # Intersection 1 is east of 0, 2 south of 0, 3 south of 1; a turn at
+    # the end of a link enters the neighbouring intersection in the new
+    # heading. Eastbound through 0 to leave eastwards after 1: straight
+    # on, then straight off the grid
+    assert turn(link(1, Direction.EAST), link(0, Direction.EAST)) == straight
+    assert turn(link(1, Direction.EAST), link(1, Direction.EAST)) == straight
+    # Eastbound through 0 to leave southwards after 3: straight into 1,
+    # then right into 3
+    assert turn(link(3, Direction.SOUTH), link(0, Direction.EAST)) == straight
+    assert turn(link(3, Direction.SOUTH), link(1, Direction.EAST)) == right
+    # Northbound through 2 to leave westwards after 0: left and straight
+    # both leave the grid, so right into 3, left into 1, left into 0
+    assert turn(link(0, Direction.WEST), link(2, Direction.NORTH)) == right
+    assert turn(link(0, Direction.WEST), link(3, Direction.EAST)) == left
+    assert turn(link(0, Direction.WEST), link(1, Direction.NORTH)) == left
+    # No route back from the exits of 0 to the east exit of 1
+    assert turn(link(1, Direction.EAST), link(0, Direction.WEST)) == -1
+
+
+@pytest.mark.parametrize(
+    "net",
+    [RoadNetwork(rows=2, cols=2), uneven_grid(3, 3), uneven_grid(2, 4, seed=1)],
+    ids=["grid2x2", "uneven3x3", "uneven2x4"],
+)
+def test_next_hops_follow_shortest_routes(net):
+    table = compute_routing_table(net)
+    assert table.num_destinations > 0
+
+    for i, dest in enumerate(table.destinations.tolist()):
+        exit_turn = table.next_turn[i, dest]
+        assert exit_turn >= 0 and exit_turn not in [t for _, t in downstream(net, dest)]
+        for start in range(net.num_links):
+            best = route_lengths(net, start)
+            if dest not in best:
+                assert table.next_turn[i, start] == -1
+                continue
+
+            link, length = start, 0.0
+            for _ in range(net.num_links):
+                if link == dest:
+                    break
+                turn = table.next_turn[i, link]
+                (link,) = [nxt for nxt, t in downstream(net, link) if t == turn]
+                length += net.link_length[link]
+            assert link == dest
+            assert length == pytest.approx(best[dest], rel=1e-12)
+
+
+def test_python_table_matches_kernel():
+    for net in (RoadNetwork(rows=3, cols=2), uneven_grid(3, 3, seed=2)):
+        kernel, python = compute_routing_table(net), compute_routing_table(net, compiled=False)
+        np.testing.assert_array_equal(python.destinations, kernel.destinations)
+        np.testing.assert_array_equal(python.next_turn, kernel.next_turn)
+
+
+def test_routing_cache_round_trip(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path)
+    net = uneven_grid(2, 2)
+    built = build_routing_table(net, cache_dir)
+    files = os.listdir(cache_dir)
+    assert files == [os.path.basename(disk_cache.cache_path(
+        cache_dir, "routes", routing.ROUTING_CACHE_VERSION, net.content_hash()
+    ))]
+
+    def no_compute(*args, **kwargs):
+        raise AssertionError("cached table was computed again")
+
+    monkeypatch.setattr(routing, "compute_routing_table", no_compute)
+    cached = build_routing_table(uneven_grid(2, 2), cache_dir)
+    np.testing.assert_array_equal(cached.destinations, built.destinations)
+    np.testing.assert_array_equal(cached.next_turn, built.next_turn)
+    monkeypatch.undo()
+
+    # Another network misses and gets a file of its own
+    changed = uneven_grid(2, 2, seed=5)
+    assert changed.content_hash() != net.content_hash()
+    build_routing_table(changed, cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+
+    # An unreadable file is rebuilt and overwritten
+    path = os.path.join(cache_dir, files[0])
+    with open(path, "wb") as f:
+        f.write(b"not a zip file")
+    rebuilt = build_routing_table(net, cache_dir)
+    np.testing.assert_array_equal(rebuilt.next_turn, built.next_turn)
+    assert disk_cache.load_arrays(path) is not None
+
+
+def test_failed_save_leaves_no_partial_file(tmp_path, monkeypatch):
+    path = disk_cache.cache_path(str(tmp_path), "routes", 1, "key")
+    disk_cache.save_arrays(path, {"a": np.arange(3)})
+
+    def failing_savez(f, **arrays):
+        f.write(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(np, "savez", failing_savez)
+    with pytest.raises(OSError):
+        disk_cache.save_arrays(path, {"a": np.arange(5)})
+    monkeypatch.undo()
+
+    # The old entry is untouched and the temporary file is gone
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+    np.testing.assert_array_equal(disk_cache.load_arrays(path)["a"], np.arange(3))
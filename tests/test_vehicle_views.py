@@ -0,0 +1,63 @@
+"""
+Vehicle views of the ring buffers: get_vehicle(id) finds every vehicle of
+the vehicles snapshot, on lanes whose occupied slots wrap around and after
+transfers between links, and returns None for ids not in the world.
+"""
+import numpy as np
+import pytest
+
+from traffic_sim.backends import get_backend
+from traffic_sim.config import SimulationConfig
+
+DT = 0.1
+
+
+def make_world(**overrides):
+    params = dict(spawn_rate=1.0, max_vehicles=400, lane_capacity=12, random_seed=5)
+    params.update(overrides)
+    return get_backend("numpy")(SimulationConfig(**params)).world  # type: ignore[arg-type]
+
+
+def lanes_of_ids(world) -> dict:
+    """{vehicle id: lane index} of every vehicle in the world."""
+    return {
+        int(vid): lane_idx
+        for lane_idx in range(len(world.counts))
+        for vid in world.vehicle_ids[lane_idx, world._lane_slots(lane_idx)]
+    }
+
+
+@pytest.mark.parametrize("grid", [(1, 1), (2, 2)])
+def test_get_vehicle_finds_every_vehicle(grid):
+    world = make_world(grid_rows=grid[0], grid_cols=grid[1])
+    spawn_lanes = {}
+    wrapped = False
+    for _ in range(40):
+        world.run_steps(25, DT)
+        for vid, lane_idx in lanes_of_ids(world).items():
+            spawn_lanes.setdefault(vid, lane_idx)
+        wrapped |= bool(np.any(world.heads + world.counts > world.capacity))
+
+        vehicles = world.vehicles
+        assert len(vehicles) == world.num_vehicles
+        for v in vehicles:
+            assert world.get_vehicle(v.id) == v
+
+    # Saturated: lanes filled up to their capacity and wrapped around
+    assert wrapped
+    assert int(world.counts.max()) == world.capacity
+
+    here = lanes_of_ids(world)
+    finished = [vid for vid in spawn_lanes if vid not in here]
+    assert finished
+    for vid in finished:
+        assert world.get_vehicle(vid) is None
+    for vid in (-1, world._next_vehicle_id, world._next_vehicle_id + 100):
+        assert world.get_vehicle(vid) is None
+
+    transferred = [vid for vid, lane_idx in here.items() if lane_idx != spawn_lanes[vid]]
+    assert world.has_transfers == bool(transferred)
+    for vid in transferred:
+        v = world.get_vehicle(vid)
+        assert v is not None and v.id == vid
+        assert v.direction_code == int(world.directions_order[here[vid]])
@@ -0,0 +1,103 @@
+"""
+Kernel warm-up: WorldState.warmup and EnsembleWorldState.warmup compile on
+a throwaway world, so the clock, the RNG streams, the vehicles and the
+metrics are left untouched and a warmed run is bit-identical to a cold one.
+"""
+import pickle
+
+import numpy as np
+import pytest
+
+from traffic_sim.backends import get_backend
+from traffic_sim.config import SimulationConfig
+from traffic_sim.experiments.runner import run_ensemble
+from traffic_sim.model.ensemble_state import EnsembleWorldState
+from traffic_sim.model.road_network import RoadNetwork
+from traffic_sim.model.traffic_lights import TrafficLightConfig, TrafficLightsController
+
+DT = 0.1
+COLUMNS = ("positions", "speeds", "stops", "spawn_times", "turns", "vehicle_ids", "heads", "counts")
+
+
+def snapshot(world, next_id: str) -> dict:
+    """Everything warmup must leave alone, in comparable form."""
+    state = {
+        "time": world.time,
+        "next_id": np.copy(getattr(world, next_id)),
+        "num_vehicles": np.copy(world.num_vehicles),
+        "spawn_uniforms": pickle.dumps(world.spawn_uniforms),
+        "metrics_raw": pickle.dumps(world.metrics_raw),
+    }
+    state.update({name: getattr(world, name).copy() for name in COLUMNS})
+    return state
+
+
+def assert_same_snapshot(state: dict, ref: dict) -> None:
+    assert state.keys() == ref.keys()
+    for name, value in ref.items():
+        np.testing.assert_array_equal(state[name], value, err_msg=name)
+
+
+def make_world(**overrides):
+    params = dict(spawn_rate=0.8, max_vehicles=300, random_seed=9, backend="openmp")
+    params.update(overrides)
+    return get_backend("openmp")(SimulationConfig(**params)).world  # type: ignore[arg-type]
+
+
+def make_ensemble(precision: str) -> EnsembleWorldState:
+    return EnsembleWorldState(
+        road_network=RoadNetwork(),
+        lights=TrafficLightsController(TrafficLightConfig(green_ns=30.0, green_ew=30.0, all_red=2.0)),
+        spawn_rate=0.8,
+        max_vehicles=300,
+        seeds=[9, 10, 11],
+        precision=precision,
+    )
+
+
+@pytest.mark.parametrize("precision", ["float64", "float32"])
+@pytest.mark.parametrize("arrival_process", ["bernoulli", "poisson"])
+def test_world_warmup_leaves_the_world_untouched(arrival_process, precision):
+    warmed = make_world(arrival_process=arrival_process, precision=precision)
+    cold = make_world(arrival_process=arrival_process, precision=precision)
+
+    before = snapshot(warmed, "_next_vehicle_id")
+    assert warmed.warmup(DT) >= 0.0
+    assert_same_snapshot(snapshot(warmed, "_next_vehicle_id"), before)
+
+    # Again with vehicles on the lanes
+    for world in (warmed, cold):
+        world.run_steps(300, DT)
+    before = snapshot(warmed, "_next_vehicle_id")
+    assert warmed.num_vehicles > 0
+    warmed.warmup(DT)
+    assert_same_snapshot(snapshot(warmed, "_next_vehicle_id"), before)
+
+    for world in (warmed, cold):
+        world.run_steps(300, DT)
+    assert_same_snapshot(snapshot(warmed, "_next_vehicle_id"), snapshot(cold, "_next_vehicle_id"))
+
+
+@pytest.mark.parametrize("precision", ["float64", "float32"])
+def test_ensemble_warmup_leaves_the_ensemble_untouched(precision):
+    warmed, cold = make_ensemble(precision), make_ensemble(precision)
+    for ensemble in (warmed, cold):
+        ensemble.run_steps(300, DT)
+
+    before = snapshot(warmed, "next_vehicle_ids")
+    assert warmed.num_vehicles.sum() > 0
+    assert warmed.warmup(DT) >= 0.0
+    assert_same_snapshot(snapshot(warmed, "next_vehicle_ids"), before)
+
+    for ensemble in (warmed, cold):
+        ensemble.run_steps(300, DT)
+    assert_same_snapshot(snapshot(warmed, "next_vehicle_ids"), snapshot(cold, "next_vehicle_ids"))
+
+
+def test_compile_time_is_reported_apart_from_the_run():
+    config = SimulationConfig(total_time=10.0, backend="openmp")
+    result = get_backend("openmp")(config).run()
+    assert result.extra_stats["compile_time_seconds"] >= 0.0
+
+    for result in run_ensemble(config, [1, 2]):
+        assert result.extra_stats["compile_time_seconds"] >= 0.0
@@ -1,25 +1,28 @@
+from importlib import import_module
 from typing import Dict, Type
 
 from traffic_sim.backends.base_backend import SimulationBackend
-from traffic_sim.backends.backend_sequential import SequentialBackend
-from traffic_sim.backends.backend_openmp import OpenMPBackend
-from traffic_sim.backends.backend_cuda import CUDABackend
 
 # IMPORTANT
-# MPIBackend is intentionally NOT loaded here
+# MPIBackend is intentionally NOT listed here
 # run_mpi.py will import it directly when needed
 
-BACKENDS: Dict[str, Type[SimulationBackend]] = {
-    SequentialBackend.name: SequentialBackend,
-    OpenMPBackend.name: OpenMPBackend,
-    CUDABackend.name: CUDABackend
+# Backend name -> "module:class". A backend module is only imported when
+# get_backend asks for it, so a sequential run never loads Numba and only
+# the cuda backend loads numba.cuda.
+BACKENDS: Dict[str, str] = {
+    "sequential": "traffic_sim.backends.backend_sequential:SequentialBackend",
+    "numpy": "traffic_sim.backends.backend_numpy:NumpyBackend",
+    "openmp": "traffic_sim.backends.backend_openmp:OpenMPBackend",
+    "cuda": "traffic_sim.backends.backend_cuda:CUDABackend",
 }
 
 
 def get_backend(name: str) -> Type[SimulationBackend]:
     try:
-        return BACKENDS[name]
+        module_name, class_name = BACKENDS[name].split(":")
     except KeyError:
         raise ValueError(
             f"Unknown backend '{name}'. Available: {', '.join(BACKENDS.keys())}"
         )
+    return getattr(import_module(module_name), class_name)
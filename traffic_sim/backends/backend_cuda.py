@@ -2,9 +2,10 @@ from dataclasses import asdict
 
 from traffic_sim.backends.base_backend import SimulationBackend
 from traffic_sim.config import SimulationConfig
+from traffic_sim.io.network_loader import build_road_network
 from traffic_sim.metrics.types import SimulationResult
 from traffic_sim.metrics.timers import Timer
-from traffic_sim.model.road_network import RoadNetwork
+from traffic_sim.model.routing import build_routing_table
 from traffic_sim.model.traffic_lights import TrafficLightsController, TrafficLightConfig
 from traffic_sim.model.world_state import WorldState
 
@@ -12,6 +13,9 @@ from traffic_sim.model.world_state import WorldState
 class CUDABackend(SimulationBackend):
     """
     CUDA-like backend using Numba CUDA to update vehicle movement on the GPU.
+    Vehicle state is kept in device arrays for the whole run and copied
+    back once at the end. With gpu_device_loop the time loop itself runs
+    on the GPU as well (see WorldState.run_steps_cuda).
 
     NOTE: This backend requires a CUDA-capable GPU and a proper CUDA setup.
     On machines without CUDA it will raise a CudaSupportError when run.
@@ -22,11 +26,7 @@ class CUDABackend(SimulationBackend):
     def __init__(self, config: SimulationConfig):
         super().__init__(config)
 
-        self.road_network = RoadNetwork(
-            lane_length=100.0,
-            stop_line_from_center=5.0,
-            intersection_width=10.0,
-        )
+        self.road_network = build_road_network(self.config)
 
         lights_cfg = TrafficLightConfig(
             green_ns=30.0,
@@ -43,7 +43,15 @@ class CUDABackend(SimulationBackend):
             random_seed=self.config.random_seed,
             max_speed=13.9,
             safe_gap=5.0,
+            arrival_process=self.config.arrival_process,
+            precision=self.config.precision,
+            lane_capacity=self.config.lane_capacity,
+            routing=(
+                build_routing_table(self.road_network, self.config.cache_dir)
+                if self.config.od_routing else None
+            ),
         )
+        self.world.gpu_block_size = self.config.gpu_block_size
 
     def run(self) -> SimulationResult:
         cfg: SimulationConfig = self.config
@@ -52,18 +60,35 @@ class CUDABackend(SimulationBackend):
 
         steps = int(total_time / dt)
 
-        # Optional warm-up step to trigger CUDA JIT compilation (not measured)
-        if steps > 0:
-            self.world.step_cuda(dt)
+        if cfg.gpu_device_loop and (cfg.adaptive_dt or cfg.arrival_process != "bernoulli"):
+            raise ValueError(
+                "gpu_device_loop requires a fixed dt and the 'bernoulli' arrival process"
+            )
+
+        # Compile (or load from the disk cache) before timing; the world
+        # state is not advanced
+        compile_time = self.world.warmup(dt, use_cuda=True)
 
         with Timer() as t:
-            for _ in range(steps - 1):
-                self.world.step_cuda(dt)
+            if cfg.adaptive_dt:
+                self.world.run_adaptive(total_time, cfg.dt_min, cfg.dt_max, self.world.step_cuda)
+            elif cfg.gpu_device_loop:
+                self.world.run_steps_cuda(steps, dt)
+            else:
+                done = 0
+                while done < steps:
+                    done += self.world.skip_idle_steps(dt, steps - done)
+                    if done < steps:
+                        self.world.step_cuda(dt)
+                        done += 1
+            # Vehicle state stays on the device during the run
+            self.world.sync_host()
 
         vehicles_completed, avg_travel, avg_stops, throughput = \
             self.world.get_metrics_summary(total_time)
 
         debug_stats = self.world.get_debug_stats()
+        debug_stats["compile_time_seconds"] = compile_time
 
         return SimulationResult(
             backend=self.name,
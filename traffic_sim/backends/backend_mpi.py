@@ -4,11 +4,12 @@ from mpi4py import MPI
 
 from traffic_sim.backends.base_backend import SimulationBackend
 from traffic_sim.config import SimulationConfig
+from traffic_sim.io.network_loader import build_road_network
 from traffic_sim.metrics.types import SimulationResult
 from traffic_sim.metrics.timers import Timer
-from traffic_sim.model.road_network import RoadNetwork
+from traffic_sim.model.routing import build_routing_table
 from traffic_sim.model.traffic_lights import TrafficLightsController, TrafficLightConfig
-from traffic_sim.model.world_state import WorldState
+from traffic_sim.model.world_state import SimulationMetricsRaw, WorldState
 from traffic_sim.model.vehicles import Direction
 
 
@@ -44,11 +45,12 @@ class MPIBackend(SimulationBackend):
         # They will effectively simulate an empty world (no vehicles).
         self.active_directions = active_dirs
 
-        self.road_network = RoadNetwork(
-            lane_length=100.0,
-            stop_line_from_center=5.0,
-            intersection_width=10.0,
-        )
+        self.road_network = build_road_network(self.config)
+
+        # Vehicles turning onto a link of another rank's direction would
+        # have to be sent there; ranks do not exchange vehicles
+        if self.size > 1 and len(self.road_network.downstream_link) > 0:
+            raise ValueError("MPI runs on networks with link-to-link transfers need a single rank")
 
         lights_cfg = TrafficLightConfig(
             green_ns=30.0,
@@ -66,6 +68,13 @@ class MPIBackend(SimulationBackend):
             max_speed=13.9,
             safe_gap=5.0,
             active_directions=self.active_directions,
+            arrival_process=self.config.arrival_process,
+            precision=self.config.precision,
+            lane_capacity=self.config.lane_capacity,
+            routing=(
+                build_routing_table(self.road_network, self.config.cache_dir)
+                if self.config.od_routing else None
+            ),
         )
 
     def run(self) -> SimulationResult:
@@ -76,42 +85,44 @@ class MPIBackend(SimulationBackend):
 
         # Sequential update per rank; domain decomposition is across ranks.
         with Timer() as t:
-            for _ in range(steps):
-                self.world.step(dt)
+            if cfg.adaptive_dt:
+                self.world.run_adaptive(total_time, cfg.dt_min, cfg.dt_max, self.world.step)
+            else:
+                done = 0
+                while done < steps:
+                    done += self.world.skip_idle_steps(dt, steps - done)
+                    if done < steps:
+                        self.world.step(dt)
+                        done += 1
 
         # Local metrics (per rank)
         raw = self.world.metrics_raw
         local_finished = raw.finished_count
-        local_sum_travel = float(sum(raw.finished_travel_times))
-        local_sum_stops = float(sum(raw.finished_stops))
         local_spawned = raw.total_spawned
 
         # Local wall time
         local_wall = t.elapsed
 
-        # Reduce metrics to rank 0
+        # Gather the per-rank aggregates on rank 0 and merge them there
         comm = self.comm
-        global_finished = comm.reduce(local_finished, op=MPI.SUM, root=0)
-        global_sum_travel = comm.reduce(local_sum_travel, op=MPI.SUM, root=0)
-        global_sum_stops = comm.reduce(local_sum_stops, op=MPI.SUM, root=0)
-        global_spawned = comm.reduce(local_spawned, op=MPI.SUM, root=0)
+        all_raw = comm.gather(raw, root=0)
         global_wall = comm.reduce(local_wall, op=MPI.MAX, root=0)  # max wall time across ranks
 
-        if self.rank == 0 and global_finished > 0:
-            avg_travel = global_sum_travel / global_finished
-            avg_stops = global_sum_stops / global_finished
-            throughput = global_finished / (total_time / 60.0)
+        if self.rank == 0:
+            merged = SimulationMetricsRaw()
+            for part in all_raw:
+                merged.merge(part)
+            summary = merged.compute_summary(total_time)
+            global_data = (*summary, merged.total_spawned, global_wall,
+                           merged.distribution_stats())
         else:
-            avg_travel = 0.0
-            avg_stops = 0.0
-            throughput = 0.0
+            global_data = None
 
         # Broadcast global metrics and wall time to all ranks
-        global_data = (global_finished, avg_travel, avg_stops, throughput,
-                       global_spawned, global_wall)
         global_data = comm.bcast(global_data, root=0)
 
-        vehicles_completed, avg_travel, avg_stops, throughput, global_spawned, wall_time = global_data
+        (vehicles_completed, avg_travel, avg_stops, throughput,
+         global_spawned, wall_time, distribution) = global_data
 
         debug_stats = {
             "num_ranks": self.size,
@@ -119,6 +130,9 @@ class MPIBackend(SimulationBackend):
             "local_spawned": local_spawned,
             "local_finished": local_finished,
             "global_spawned": global_spawned,
+            "local_steps_executed": self.world.steps_executed,
+            "local_steps_skipped": self.world.steps_skipped,
+            **distribution,
         }
 
         return SimulationResult(
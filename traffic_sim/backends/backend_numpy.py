@@ -0,0 +1,84 @@
+from dataclasses import asdict
+
+from traffic_sim.backends.base_backend import SimulationBackend
+from traffic_sim.config import SimulationConfig
+from traffic_sim.io.network_loader import build_road_network
+from traffic_sim.metrics.types import SimulationResult
+from traffic_sim.metrics.timers import Timer
+from traffic_sim.model.routing import build_routing_table
+from traffic_sim.model.traffic_lights import TrafficLightsController, TrafficLightConfig
+from traffic_sim.model.world_state import WorldState
+
+
+class NumpyBackend(SimulationBackend):
+    """
+    Vectorized NumPy implementation of the simulation.
+    Each lane is updated with a prefix-min scan instead of a Python loop.
+    Results match SequentialBackend exactly and no JIT compilation is needed.
+    """
+
+    name = "numpy"
+
+    def __init__(self, config: SimulationConfig):
+        super().__init__(config)
+
+        self.road_network = build_road_network(self.config)
+
+        lights_cfg = TrafficLightConfig(
+            green_ns=30.0,
+            green_ew=30.0,
+            all_red=2.0,
+        )
+        self.lights = TrafficLightsController(lights_cfg)
+
+        self.world = WorldState(
+            road_network=self.road_network,
+            lights=self.lights,
+            spawn_rate=self.config.spawn_rate,
+            max_vehicles=self.config.max_vehicles,
+            random_seed=self.config.random_seed,
+            max_speed=13.9,
+            safe_gap=5.0,
+            arrival_process=self.config.arrival_process,
+            precision=self.config.precision,
+            lane_capacity=self.config.lane_capacity,
+            routing=(
+                build_routing_table(self.road_network, self.config.cache_dir, compiled=False)
+                if self.config.od_routing else None
+            ),
+        )
+
+    def run(self) -> SimulationResult:
+        cfg: SimulationConfig = self.config
+        total_time = cfg.total_time
+        dt = cfg.dt
+
+        steps = int(total_time / dt)
+
+        with Timer() as t:
+            if cfg.adaptive_dt:
+                self.world.run_adaptive(total_time, cfg.dt_min, cfg.dt_max, self.world.step_numpy)
+            else:
+                done = 0
+                while done < steps:
+                    done += self.world.skip_idle_steps(dt, steps - done)
+                    if done < steps:
+                        self.world.step_numpy(dt)
+                        done += 1
+
+        vehicles_completed, avg_travel, avg_stops, throughput = \
+            self.world.get_metrics_summary(total_time)
+
+        debug_stats = self.world.get_debug_stats()
+
+        return SimulationResult(
+            backend=self.name,
+            config=asdict(cfg),
+            wall_time_seconds=t.elapsed,
+            total_simulated_time=total_time,
+            vehicles_completed=vehicles_completed,
+            avg_travel_time=avg_travel,
+            avg_stops_per_vehicle=avg_stops,
+            throughput_veh_per_min=throughput,
+            extra_stats=debug_stats,
+        )
@@ -4,9 +4,10 @@ from numba import set_num_threads
 
 from traffic_sim.backends.base_backend import SimulationBackend
 from traffic_sim.config import SimulationConfig
+from traffic_sim.io.network_loader import build_road_network
 from traffic_sim.metrics.types import SimulationResult
 from traffic_sim.metrics.timers import Timer
-from traffic_sim.model.road_network import RoadNetwork
+from traffic_sim.model.routing import build_routing_table
 from traffic_sim.model.traffic_lights import TrafficLightsController, TrafficLightConfig
 from traffic_sim.model.world_state import WorldState
 
@@ -14,8 +15,8 @@ from traffic_sim.model.world_state import WorldState
 class OpenMPBackend(SimulationBackend):
     """
     OpenMP-like backend using Numba's parallel CPU execution.
-    It uses the same WorldState model, but calls step_openmp()
-    which updates vehicle movement via a Numba @njit(parallel=True) kernel.
+    It uses the same WorldState model, but calls run_steps() which runs
+    the time loop in a Numba @njit(parallel=True) kernel.
     """
 
     name = "openmp"
@@ -27,11 +28,7 @@ class OpenMPBackend(SimulationBackend):
         if self.config.num_threads > 0:
             set_num_threads(self.config.num_threads)
 
-        self.road_network = RoadNetwork(
-            lane_length=100.0,
-            stop_line_from_center=5.0,
-            intersection_width=10.0,
-        )
+        self.road_network = build_road_network(self.config)
 
         lights_cfg = TrafficLightConfig(
             green_ns=30.0,
@@ -48,6 +45,13 @@ class OpenMPBackend(SimulationBackend):
             random_seed=self.config.random_seed,
             max_speed=13.9,
             safe_gap=5.0,
+            arrival_process=self.config.arrival_process,
+            precision=self.config.precision,
+            lane_capacity=self.config.lane_capacity,
+            routing=(
+                build_routing_table(self.road_network, self.config.cache_dir)
+                if self.config.od_routing else None
+            ),
         )
 
 
@@ -58,18 +62,22 @@ class OpenMPBackend(SimulationBackend):
 
         steps = int(total_time / dt)
 
-        # Warm-up step to trigger Numba JIT compilation (not measured)
-        if steps > 0:
-            self.world.step_openmp(dt)
+        # Compile (or load from the disk cache) before timing; the world
+        # state is not advanced
+        compile_time = self.world.warmup(dt)
 
+        # The whole time loop runs inside the compiled kernel
         with Timer() as t:
-            for _ in range(steps - 1):
-                self.world.step_openmp(dt)
+            if cfg.adaptive_dt:
+                self.world.run_adaptive(total_time, cfg.dt_min, cfg.dt_max, self.world.step_openmp)
+            else:
+                self.world.run_steps(steps, dt)
 
         vehicles_completed, avg_travel, avg_stops, throughput = \
             self.world.get_metrics_summary(total_time)
 
         debug_stats = self.world.get_debug_stats()
+        debug_stats["compile_time_seconds"] = compile_time
 
         return SimulationResult(
             backend=self.name,
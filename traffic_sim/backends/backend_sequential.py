@@ -2,9 +2,10 @@ from dataclasses import asdict
 
 from traffic_sim.backends.base_backend import SimulationBackend
 from traffic_sim.config import SimulationConfig
+from traffic_sim.io.network_loader import build_road_network
 from traffic_sim.metrics.types import SimulationResult
 from traffic_sim.metrics.timers import Timer
-from traffic_sim.model.road_network import RoadNetwork
+from traffic_sim.model.routing import build_routing_table
 from traffic_sim.model.traffic_lights import TrafficLightsController, TrafficLightConfig
 from traffic_sim.model.world_state import WorldState
 
@@ -20,11 +21,7 @@ class SequentialBackend(SimulationBackend):
     def __init__(self, config: SimulationConfig):
         super().__init__(config)
 
-        self.road_network = RoadNetwork(
-            lane_length=100.0,
-            stop_line_from_center=5.0,
-            intersection_width=10.0,
-        )
+        self.road_network = build_road_network(self.config)
 
         lights_cfg = TrafficLightConfig(
             green_ns=30.0,
@@ -41,6 +38,13 @@ class SequentialBackend(SimulationBackend):
             random_seed=self.config.random_seed,
             max_speed=13.9,
             safe_gap=5.0,
+            arrival_process=self.config.arrival_process,
+            precision=self.config.precision,
+            lane_capacity=self.config.lane_capacity,
+            routing=(
+                build_routing_table(self.road_network, self.config.cache_dir, compiled=False)
+                if self.config.od_routing else None
+            ),
         )
 
     def run(self) -> SimulationResult:
@@ -51,8 +55,15 @@ class SequentialBackend(SimulationBackend):
         steps = int(total_time / dt)
 
         with Timer() as t:
-            for _ in range(steps):
-                self.world.step(dt)
+            if cfg.adaptive_dt:
+                self.world.run_adaptive(total_time, cfg.dt_min, cfg.dt_max, self.world.step)
+            else:
+                done = 0
+                while done < steps:
+                    done += self.world.skip_idle_steps(dt, steps - done)
+                    if done < steps:
+                        self.world.step(dt)
+                        done += 1
 
         vehicles_completed, avg_travel, avg_stops, throughput = \
             self.world.get_metrics_summary(total_time)
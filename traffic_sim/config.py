@@ -2,7 +2,7 @@ from dataclasses import dataclass, asdict
 from typing import Literal, Optional
 
 
-BackendName = Literal["sequential", "openmp", "mpi", "cuda"]
+BackendName = Literal["sequential", "numpy", "openmp", "mpi", "cuda"]
 
 
 @dataclass
@@ -11,10 +11,36 @@ class SimulationConfig:
     total_time: float = 300.0
     # time step (seconds)
     dt: float = 0.1
-    # cars/s/direction
+    # adaptive time stepping: every step is picked in [dt_min, dt_max] from
+    # the gaps, the next light change and the next arrival (dt is then not
+    # used); with poisson arrivals an empty world jumps to the next arrival
+    # even past dt_max. dt_min must be at least 0.5 m / max_speed (~0.036 s)
+    adaptive_dt: bool = False
+    dt_min: float = 0.05
+    dt_max: float = 1.0
+    # road network: grid_rows x grid_cols intersections (1 x 1: a single one),
+    # or the CSV/GeoJSON edge list network_file (see io.network_loader)
+    grid_rows: int = 1
+    grid_cols: int = 1
+    network_file: Optional[str] = None
+    # cars/s/lane
     spawn_rate: float = 0.5
     max_vehicles: int = 2000
+    # vehicles one lane can hold (None: max_vehicles); bounds the memory of
+    # large grids, a full lane refuses new vehicles
+    lane_capacity: Optional[int] = None
     random_seed: int = 42
+    # "bernoulli": spawn trial every dt; "poisson": exponential inter-arrival
+    # times, and steps with an empty world are skipped
+    arrival_process: Literal["bernoulli", "poisson"] = "bernoulli"
+    # floating-point type of vehicle positions/speeds; sums stay in float64
+    precision: Literal["float64", "float32"] = "float64"
+    # origin-destination trips: every vehicle gets an exit of the network as
+    # destination and follows its shortest route (random turns otherwise)
+    od_routing: bool = False
+    # on-disk cache of routing tables and compiled network files (None:
+    # $TRAFFIC_SIM_CACHE_DIR or ~/.cache/traffic_sim)
+    cache_dir: Optional[str] = None
 
     backend: BackendName = "sequential"
 
@@ -24,6 +50,13 @@ class SimulationConfig:
     num_processes: int = 1
     # cuda
     gpu_block_size: int = 256
+    # run the whole time loop on the GPU (run_steps_cuda): fastest, but
+    # spawn draws come from a device RNG, so results match the other
+    # backends only statistically; bernoulli arrivals and fixed dt only.
+    # The lanes are split over blocks only when lane_capacity * lanes <=
+    # max_vehicles (the cap cannot bind); otherwise one block (one SM)
+    # runs every lane
+    gpu_device_loop: bool = False
 
     output_dir: str = "results"
     # scenario desc
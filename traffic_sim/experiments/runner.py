@@ -1,8 +1,13 @@
-from typing import Iterable, List
+from dataclasses import asdict
+from typing import Dict, Iterable, List, Sequence
 
 from traffic_sim.backends import get_backend
 from traffic_sim.config import SimulationConfig
+from traffic_sim.io.network_loader import build_road_network
 from traffic_sim.metrics.types import SimulationResult
+from traffic_sim.metrics.timers import Timer
+from traffic_sim.model.routing import build_routing_table
+from traffic_sim.model.traffic_lights import TrafficLightsController, TrafficLightConfig
 
 
 def run_single(config: SimulationConfig) -> SimulationConfig:
@@ -41,3 +46,116 @@ def run_scaling_experiment(
         res = run_single(cfg)
         results.append(res)
     return results
+
+
+def run_ensemble(config: SimulationConfig, seeds: Sequence[int]) -> List[SimulationResult]:
+    """
+    Run one scenario for many seeds at once with EnsembleWorldState.
+
+    Every seed gives the same trajectory as the openmp backend with
+    random_seed set to it, but all replicas advance together in one Numba
+    kernel. Returns one SimulationResult per seed, in order; their config
+    carries that seed, and wall_time_seconds is the time of the whole batch.
+    """
+    if config.arrival_process != "bernoulli":
+        raise ValueError("run_ensemble only supports arrival_process='bernoulli'")
+
+    # Imported here so that runs of the other backends do not load Numba
+    from numba import set_num_threads
+    from traffic_sim.model.ensemble_state import EnsembleWorldState
+
+    if config.num_threads > 0:
+        set_num_threads(config.num_threads)
+
+    road_network = build_road_network(config)
+    lights = TrafficLightsController(TrafficLightConfig(
+        green_ns=30.0,
+        green_ew=30.0,
+        all_red=2.0,
+    ))
+
+    ensemble = EnsembleWorldState(
+        road_network=road_network,
+        lights=lights,
+        spawn_rate=config.spawn_rate,
+        max_vehicles=config.max_vehicles,
+        seeds=seeds,
+        max_speed=13.9,
+        safe_gap=5.0,
+        precision=config.precision,
+        lane_capacity=config.lane_capacity,
+        routing=(
+            build_routing_table(road_network, config.cache_dir)
+            if config.od_routing else None
+        ),
+    )
+    steps = int(config.total_time / config.dt)
+
+    # Compile (or load from the disk cache) before timing
+    compile_time = ensemble.warmup(config.dt)
+    with Timer() as t:
+        ensemble.run_steps(steps, config.dt)
+
+    results: List[SimulationResult] = []
+    for r, seed in enumerate(ensemble.seeds):
+        cfg_dict = asdict(config)
+        cfg_dict["random_seed"] = seed
+
+        vehicles_completed, avg_travel, avg_stops, throughput = \
+            ensemble.get_metrics_summary(r, config.total_time)
+
+        extra_stats = ensemble.get_debug_stats(r)
+        extra_stats["num_replicas"] = ensemble.num_replicas
+        extra_stats["compile_time_seconds"] = compile_time
+
+        results.append(SimulationResult(
+            backend="ensemble",
+            config=cfg_dict,
+            wall_time_seconds=t.elapsed,
+            total_simulated_time=config.total_time,
+            vehicles_completed=vehicles_completed,
+            avg_travel_time=avg_travel,
+            avg_stops_per_vehicle=avg_stops,
+            throughput_veh_per_min=throughput,
+            extra_stats=extra_stats,
+        ))
+    return results
+
+
+def check_precision_equivalence(
+    config: SimulationConfig,
+    rtol: float = 5e-2,
+) -> Dict[str, float]:
+    """
+    Run config with precision "float64" and "float32" and compare the results.
+
+    float32 trajectories are not bit-identical to float64 ones: a rounding
+    difference can move a vehicle across the stop line or the lane end one
+    step earlier or later, and with adaptive_dt the step sizes themselves
+    follow the positions. The summary metrics must still agree within rtol
+    (relative to the float64 value). Returns the relative difference of
+    every compared metric and raises RuntimeError if any exceeds rtol.
+    """
+    results = {}
+    for precision in ("float64", "float32"):
+        cfg_dict = config.to_dict()
+        cfg_dict["precision"] = precision
+        results[precision] = run_single(SimulationConfig(**cfg_dict))  # type: ignore[arg-type]
+
+    ref, low = results["float64"], results["float32"]
+    diffs: Dict[str, float] = {}
+    for name in (
+        "vehicles_completed",
+        "avg_travel_time",
+        "avg_stops_per_vehicle",
+        "throughput_veh_per_min",
+    ):
+        a, b = float(getattr(ref, name)), float(getattr(low, name))
+        diffs[name] = abs(a - b) / abs(a) if a != 0.0 else abs(b)
+
+    failed = {name: d for name, d in diffs.items() if d > rtol}
+    if failed:
+        raise RuntimeError(
+            f"float32 results differ from float64 by more than rtol={rtol}: {failed}"
+        )
+    return diffs
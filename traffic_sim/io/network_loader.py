@@ -0,0 +1,291 @@
+"""
+Road networks from local edge-list files.
+
+A network file lists the directed road segments (edges) between
+intersections (nodes), in one of two formats:
+- CSV (.csv) with a header row and one edge per row: from_node, to_node,
+  from_x, from_y, to_x, to_y and optionally length and stop_line
+- GeoJSON (.geojson, .json): a FeatureCollection of LineString features,
+  one edge each, running from the first to the last point of the line;
+  the properties may give from_node and to_node (both or neither), length
+  and stop_line, otherwise the nodes are the end points and the length is
+  the length of the line
+Coordinates are planar, in metres, with y growing northwards (project
+longitude/latitude data first). Two-way roads are two edges. A node id
+must always be at the same position (within NODE_POSITION_TOLERANCE).
+
+Every edge becomes one link, controlled by the signal of the node it ends
+at, with its stop line stop_line metres (default STOP_LINE_FROM_END)
+before its end. The link's
+Direction is its compass heading on arrival. A vehicle at the end of a
+link continues on an edge leaving that node with the turn given by the
+change of heading: within 45 degrees of 0 straight, of 90 clockwise
+right, of 90 anticlockwise left; sharper turns (U-turns) are not taken.
+Of several edges in one turn class, the one closest to the class heading
+is used.
+
+Parsing is done once per file: the compiled link arrays are cached under
+the hash of the file (see model.disk_cache), so later runs and sweep
+workers only load them.
+"""
+from __future__ import annotations
+
+import csv
+import hashlib
+import json
+import os
+from typing import Dict, Hashable, List, Tuple
+
+import numpy as np
+
+from traffic_sim.config import SimulationConfig
+from traffic_sim.model.disk_cache import cache_path, load_arrays, save_arrays
+from traffic_sim.model.road_network import LINK_ARRAYS, RoadNetwork
+from traffic_sim.model.vehicles import TURN_CHOICES
+
+# Part of the cache file name; bump it when the compiled arrays or the
+# compilation rules change so that old files are not picked up
+NETWORK_CACHE_VERSION = 1
+# Distance of the stop line from the end of a link [m] (the grid uses the
+# same distance from the intersection center)
+STOP_LINE_FROM_END = 5.0
+# Largest distance [m] between two positions given for the same node id
+NODE_POSITION_TOLERANCE = 1e-3
+
+NETWORK_FORMATS: Dict[str, str] = {".csv": "csv", ".geojson": "geojson", ".json": "geojson"}
+CSV_COLUMNS = ("from_node", "to_node", "from_x", "from_y", "to_x", "to_y")
+
+# Heading change (degrees clockwise) of each turn code, and how far from
+# it a heading change still counts as that turn
+_TURN_HEADING = np.array(
+    [{"straight": 0.0, "left": -90.0, "right": 90.0}[t] for t in TURN_CHOICES]
+)
+_TURN_TOLERANCE = 45.0
+
+# Parsed edges: from_nodes, to_nodes, length, heading at the start and at
+# the end of every edge (degrees clockwise from north), stop line distance
+# from the end (NaN: STOP_LINE_FROM_END)
+_Edges = Tuple[List[Hashable], List[Hashable], np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+def build_road_network(config: SimulationConfig) -> RoadNetwork:
+    """
+    Road network of a run: config.network_file if set, otherwise the
+    grid_rows x grid_cols grid.
+    """
+    if config.network_file is not None:
+        return load_network(config.network_file, config.cache_dir)
+    return RoadNetwork(
+        lane_length=100.0,
+        stop_line_from_center=5.0,
+        intersection_width=10.0,
+        rows=config.grid_rows,
+        cols=config.grid_cols,
+    )
+
+
+def load_network(path: str, cache_dir: str | None = None) -> RoadNetwork:
+    """
+    Road network of the edge-list file at path, loaded from cache_dir (see
+    disk_cache.cache_path) when the file was compiled before, otherwise
+    parsed, compiled and saved there.
+    """
+    fmt = _network_format(path)
+    cache_file = cache_path(cache_dir, "network", NETWORK_CACHE_VERSION, file_hash(path, fmt))
+    data = load_arrays(cache_file)
+    if data is not None and set(LINK_ARRAYS) <= data.keys():
+        # Checked when it was compiled
+        return RoadNetwork.from_links(**{name: data[name] for name in LINK_ARRAYS}, check=False)
+
+    edges = _read_csv(path) if fmt == "csv" else _read_geojson(path)
+    net = compile_edges(*edges)
+    save_arrays(cache_file, {name: getattr(net, name) for name in LINK_ARRAYS})
+    return net
+
+
+def file_hash(path: str, salt: str = "") -> str:
+    """SHA-256 (hex) of salt and the bytes of the file at path."""
+    h = hashlib.sha256(salt.encode())
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def compile_edges(
+    from_nodes: List[Hashable],
+    to_nodes: List[Hashable],
+    length: np.ndarray,
+    start_heading: np.ndarray,
+    end_heading: np.ndarray,
+    stop_line: np.ndarray | None = None,
+) -> RoadNetwork:
+    """
+    Compile parsed edges into the flat link arrays of a RoadNetwork (see
+    module docstring). stop_line is the distance of every stop line from
+    the end of its edge (NaN or None: STOP_LINE_FROM_END).
+    """
+    num_links = len(length)
+    if num_links == 0:
+        raise ValueError("the network has no edges")
+    if stop_line is None:
+        stop_line = np.full(num_links, np.nan)
+    stop_line = np.where(np.isnan(stop_line), STOP_LINE_FROM_END, stop_line)
+    if np.any(stop_line < 0.0) or np.any(length <= stop_line):
+        raise ValueError("every edge must be longer than the distance of its stop line from its end")
+
+    # Node ids in order of first appearance
+    node_index: Dict[Hashable, int] = {}
+    src = np.array([node_index.setdefault(n, len(node_index)) for n in from_nodes], dtype=np.int64)
+    dst = np.array([node_index.setdefault(n, len(node_index)) for n in to_nodes], dtype=np.int64)
+    num_nodes = len(node_index)
+    direction = (np.rint(end_heading / 90.0).astype(np.int64) % 4).astype(np.int8)
+
+    # Candidate moves: every link followed by every edge leaving its end node
+    out_order = np.argsort(src, kind="stable")
+    out_ptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=num_nodes), out=out_ptr[1:])
+    n_out = out_ptr[dst + 1] - out_ptr[dst]
+    pair_from = np.repeat(np.arange(num_links), n_out)
+    k = np.arange(len(pair_from)) - np.repeat(np.cumsum(n_out) - n_out, n_out)
+    pair_to = out_order[np.repeat(out_ptr[dst], n_out) + k]
+
+    # Turn class of every move, and how far it is from the class heading
+    delta = (start_heading[pair_to] - end_heading[pair_from] + 180.0) % 360.0 - 180.0
+    offset = np.abs(delta[:, None] - _TURN_HEADING[None, :])
+    turn = np.argmin(offset, axis=1)
+    dev = offset[np.arange(len(turn)), turn]
+    keep = dev <= _TURN_TOLERANCE
+    pair_from, pair_to, turn, dev = pair_from[keep], pair_to[keep], turn[keep], dev[keep]
+
+    # One move per (link, turn): the closest one, the first edge on ties
+    order = np.lexsort((dev, turn, pair_from))
+    pair_from, pair_to, turn = pair_from[order], pair_to[order], turn[order]
+    first = np.ones(len(order), dtype=np.bool_)
+    first[1:] = (pair_from[1:] != pair_from[:-1]) | (turn[1:] != turn[:-1])
+
+    ptr = np.zeros(num_links + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_from[first], minlength=num_links), out=ptr[1:])
+    return RoadNetwork.from_links(
+        link_length=length,
+        link_stop_line=length - stop_line,
+        link_signal=dst,
+        link_direction=direction,
+        downstream_ptr=ptr,
+        downstream_link=pair_to[first],
+        downstream_turn=turn[first].astype(np.int8),
+    )
+
+
+def _network_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        return NETWORK_FORMATS[ext]
+    except KeyError:
+        raise ValueError(
+            f"Unknown network file type '{ext}'. Available: {', '.join(NETWORK_FORMATS.keys())}"
+        )
+
+
+def _heading(dx: np.ndarray, dy: np.ndarray) -> np.ndarray:
+    """Compass heading of (dx, dy), in degrees clockwise from north."""
+    return np.degrees(np.arctan2(dx, dy)) % 360.0
+
+
+def _check_nodes(
+    path: str,
+    from_nodes: List[Hashable],
+    to_nodes: List[Hashable],
+    start_xy: np.ndarray,
+    end_xy: np.ndarray,
+) -> None:
+    """Raise ValueError for an empty node id or one given at two positions."""
+    position: Dict[Hashable, np.ndarray] = {}
+    for nodes, xy in ((from_nodes, start_xy), (to_nodes, end_xy)):
+        for node, p in zip(nodes, xy):
+            if node is None or node == "":
+                raise ValueError(f"{path}: empty node id")
+            first = position.setdefault(node, p)
+            if np.hypot(*(first - p)) > NODE_POSITION_TOLERANCE:
+                raise ValueError(
+                    f"{path}: node {node!r} is at ({first[0]:g}, {first[1]:g}) and ({p[0]:g}, {p[1]:g})"
+                )
+
+
+def _read_csv(path: str) -> _Edges:
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        columns = reader.fieldnames or []
+        missing = [c for c in CSV_COLUMNS if c not in columns]
+        if missing:
+            raise ValueError(f"{path}: missing CSV columns {', '.join(missing)}")
+        optional = [c for c in ("length", "stop_line") if c in columns]
+
+        from_nodes: List[Hashable] = []
+        to_nodes: List[Hashable] = []
+        coords: List[Tuple[float, float, float, float]] = []
+        extra: List[Tuple[float, float]] = []
+        for row in reader:
+            try:
+                coords.append((float(row["from_x"]), float(row["from_y"]), float(row["to_x"]), float(row["to_y"])))
+                values = {c: float(row[c]) if row[c] else np.nan for c in optional}
+            except (TypeError, ValueError):
+                raise ValueError(f"{path}:{reader.line_num}: malformed edge row")
+            from_nodes.append(row["from_node"])
+            to_nodes.append(row["to_node"])
+            extra.append((values.get("length", np.nan), values.get("stop_line", np.nan)))
+
+    xy = np.array(coords, dtype=np.float64).reshape(-1, 4)
+    _check_nodes(path, from_nodes, to_nodes, xy[:, :2], xy[:, 2:])
+    dx, dy = xy[:, 2] - xy[:, 0], xy[:, 3] - xy[:, 1]
+    length, stop_line = np.array(extra, dtype=np.float64).reshape(-1, 2).T
+    length = np.where(np.isnan(length), np.hypot(dx, dy), length)
+    heading = _heading(dx, dy)
+    return from_nodes, to_nodes, length, heading, heading, stop_line
+
+
+def _read_geojson(path: str) -> _Edges:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or data.get("type") != "FeatureCollection":
+        raise ValueError(f"{path}: not a GeoJSON FeatureCollection")
+
+    from_nodes: List[Hashable] = []
+    to_nodes: List[Hashable] = []
+    ends: List[np.ndarray] = []
+    lengths: List[float] = []
+    stop_lines: List[float] = []
+    start_heading: List[float] = []
+    end_heading: List[float] = []
+    for feature in data.get("features", []):
+        geometry = feature.get("geometry") or {}
+        try:
+            points = np.asarray(geometry.get("coordinates", []), dtype=np.float64)
+        except (TypeError, ValueError):
+            points = np.empty(0)
+        if geometry.get("type") != "LineString" or points.ndim != 2 or len(points) < 2:
+            raise ValueError(f"{path}: every feature must be a LineString with at least two points")
+        seg = np.diff(points[:, :2], axis=0)
+        props = feature.get("properties") or {}
+        if ("from_node" in props) != ("to_node" in props):
+            raise ValueError(f"{path}: a feature gives only one of from_node and to_node")
+
+        from_nodes.append(props.get("from_node", tuple(points[0, :2])))
+        to_nodes.append(props.get("to_node", tuple(points[-1, :2])))
+        ends.append(points[[0, -1], :2].ravel())
+        length, stop_line = props.get("length"), props.get("stop_line")
+        try:
+            lengths.append(float(length) if length is not None else float(np.hypot(seg[:, 0], seg[:, 1]).sum()))
+            stop_lines.append(float(stop_line) if stop_line is not None else np.nan)
+        except (TypeError, ValueError):
+            raise ValueError(f"{path}: malformed length or stop_line of edge {len(lengths)}")
+        start_heading.append(_heading(seg[0, 0], seg[0, 1]))
+        end_heading.append(_heading(seg[-1, 0], seg[-1, 1]))
+
+    xy = np.array(ends, dtype=np.float64).reshape(-1, 4)
+    _check_nodes(path, from_nodes, to_nodes, xy[:, :2], xy[:, 2:])
+    return (
+        from_nodes, to_nodes, np.array(lengths, dtype=np.float64),
+        np.array(start_heading, dtype=np.float64), np.array(end_heading, dtype=np.float64),
+        np.array(stop_lines, dtype=np.float64),
+    )
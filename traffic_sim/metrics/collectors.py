@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable
+
+import numpy as np
+
+
+@dataclass
+class StreamingStats:
+    """
+    Running count, sum, variance and min/max of a stream of values in O(1)
+    memory.
+
+    The spread is kept as M2 (sum of squared deviations from the mean) and
+    updated with the Welford/Chan formulas, a batch at a time, so it stays
+    accurate for long runs. The mean is total / count: sums of partial
+    aggregates are the sum of the whole stream, so merging the stats of
+    several ranks or replicas gives the same count, total, min and max as
+    one stream, and the same variance up to rounding.
+    """
+    count: int = 0
+    total: float = 0.0
+    m2: float = 0.0
+    min: float = math.inf
+    max: float = -math.inf
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count > 0 else 0.0
+
+    @property
+    def variance(self) -> float:
+        """Population variance of the values seen so far."""
+        return self.m2 / self.count if self.count > 0 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def add_many(self, values: np.ndarray) -> None:
+        """Add a batch of values."""
+        n = len(values)
+        if n == 0:
+            return
+        values = np.asarray(values, dtype=np.float64)
+        total = float(values.sum())
+        m2 = float(np.square(values - total / n).sum())
+        self._combine(n, total, m2, float(values.min()), float(values.max()))
+
+    def merge(self, other: StreamingStats) -> None:
+        """Fold the aggregate of another stream into this one."""
+        if other.count == 0:
+            return
+        self._combine(other.count, other.total, other.m2, other.min, other.max)
+
+    def _combine(self, n: int, total: float, m2: float, lo: float, hi: float) -> None:
+        """Chan et al. update of (count, total, m2) with a partial aggregate."""
+        if self.count == 0:
+            self.count, self.total, self.m2 = n, total, m2
+        else:
+            delta = total / n - self.mean
+            count = self.count + n
+            self.m2 += m2 + delta * delta * self.count * n / count
+            self.count = count
+            self.total += total
+        self.min = min(self.min, lo)
+        self.max = max(self.max, hi)
+
+    @classmethod
+    def merged(cls, parts: Iterable[StreamingStats]) -> StreamingStats:
+        """New aggregate of several partial ones."""
+        out = cls()
+        for part in parts:
+            out.merge(part)
+        return out
+
+    def to_dict(self, prefix: str) -> Dict[str, float]:
+        """
+        Spread fields for extra_stats, keys prefixed with prefix. The mean
+        is left out: results already report it.
+        """
+        empty = self.count == 0
+        return {
+            f"{prefix}_std": self.std,
+            f"{prefix}_min": 0.0 if empty else self.min,
+            f"{prefix}_max": 0.0 if empty else self.max,
+        }
+
+
+# Quantiles reported in extra_stats
+REPORTED_QUANTILES = (0.50, 0.90, 0.95, 0.99)
+
+
+class QuantileSketch:
+    """
+    Fixed-memory quantile sketch with a relative error guarantee (DDSketch
+    with a fixed bucket range).
+
+    A value x > 0 is counted in bucket ceil(log(x) / log(gamma)), with
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy), and a
+    quantile is answered with the centre of its bucket, which is within
+    relative_accuracy of the true sample quantile. Values below min_value
+    (zero stops, for example) share one bucket that reads as 0, values
+    above max_value are clamped into the last bucket. The buckets are a
+    dense count array, so memory is fixed by the range and accuracy
+    (about 1100 buckets for the defaults) and merging two sketches with
+    the same parameters is an array addition. log_gamma and min_key are
+    public so that other code (the CUDA device loop) can bucket values the
+    same way.
+    """
+
+    def __init__(
+        self,
+        relative_accuracy: float = 0.01,
+        min_value: float = 1e-3,
+        max_value: float = 1e6,
+    ) -> None:
+        if not 0.0 < relative_accuracy < 1.0:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self.log_gamma = math.log((1.0 + relative_accuracy) / (1.0 - relative_accuracy))
+        self.min_key = math.ceil(math.log(min_value) / self.log_gamma)
+        max_key = math.ceil(math.log(max_value) / self.log_gamma)
+        self.counts = np.zeros(max_key - self.min_key + 1, dtype=np.int64)
+        self.zero_count = 0
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + int(self.counts.sum())
+
+    def add_many(self, values: np.ndarray) -> None:
+        """Add a batch of values (negative ones count as zero)."""
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        small = values < self.min_value
+        self.zero_count += int(small.sum())
+        keys = np.ceil(np.log(values[~small]) / self.log_gamma).astype(np.int64)
+        idx = np.clip(keys - self.min_key, 0, len(self.counts) - 1)
+        self.counts += np.bincount(idx, minlength=len(self.counts))
+
+    def add_bucket_counts(self, counts: np.ndarray, zero_count: int) -> None:
+        """
+        Add counts already bucketed elsewhere (e.g. on the GPU) with the
+        same key mapping: counts[i] is bucket min_key + i.
+        """
+        self.counts += counts
+        self.zero_count += int(zero_count)
+
+    def merge(self, other: QuantileSketch) -> None:
+        """Add the counts of another sketch with the same parameters."""
+        if (
+            other.relative_accuracy != self.relative_accuracy
+            or other.min_value != self.min_value
+            or other.max_value != self.max_value
+        ):
+            raise ValueError("Cannot merge quantile sketches with different parameters")
+        self.counts += other.counts
+        self.zero_count += other.zero_count
+
+    def quantile(self, q: float) -> float:
+        """Approximate q-quantile (0 <= q <= 1); 0.0 for an empty sketch."""
+        if not 0.0 <= q <= 1.0:
+            raise ValueError("q must be in [0, 1]")
+        total = self.count
+        if total == 0:
+            return 0.0
+        rank = q * (total - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = np.cumsum(self.counts) + self.zero_count
+        i = int(np.searchsorted(cumulative, rank, side="right"))
+        i = min(i, len(self.counts) - 1)
+        key = i + self.min_key
+        # centre of bucket (gamma^(key-1), gamma^key] in the relative sense
+        return 2.0 * math.exp(key * self.log_gamma) / (1.0 + math.exp(self.log_gamma))
+
+    def to_dict(self, prefix: str) -> Dict[str, float]:
+        """Reported quantiles for extra_stats, e.g. prefix_p95."""
+        return {
+            f"{prefix}_p{round(q * 100)}": self.quantile(q) for q in REPORTED_QUANTILES
+        }
@@ -0,0 +1,1398 @@
+"""
+Numba CPU kernels of WorldState and EnsembleWorldState, and the routing
+table builder.
+
+Kept apart from world_state so that importing the model (and running the
+sequential or numpy backend) does not import Numba; the kernels are loaded
+through traffic_sim.model.kernels.get_kernel when a world first needs them.
+"""
+import heapq
+from typing import Tuple
+
+import numpy as np
+from numba import njit, prange
+
+
+@njit(cache=True)
+def _spawn_into_lanes(
+    positions: np.ndarray,
+    speeds: np.ndarray,
+    stops: np.ndarray,
+    spawn_times: np.ndarray,
+    turns: np.ndarray,
+    vehicle_ids: np.ndarray,
+    destinations: np.ndarray,
+    heads: np.ndarray,
+    counts: np.ndarray,
+    draws: np.ndarray,
+    spawn_prob: float,
+    num_vehicles: int,
+    max_vehicles: int,
+    next_vehicle_id: int,
+    time: float,
+    max_speed: float,
+    lane_links: np.ndarray,
+    route_turns: np.ndarray,
+    reach_ptr: np.ndarray,
+    reach_dest: np.ndarray,
+) -> int:
+    """
+    Spawn step on the lane ring buffers, lane by lane.
+
+    draws[lane_idx] holds the two uniforms of that lane for this step:
+    the spawn trial and the turn choice. A full lane refuses its arrival.
+    With a routing table (route_turns not empty) the second uniform picks
+    the destination among those reachable from the lane (reach_ptr /
+    reach_dest) instead, and the turn follows the route. Returns how many
+    vehicles were pushed.
+    """
+    num_lanes = counts.shape[0]
+    capacity = positions.shape[1]
+    spawned = 0
+
+    for lane_idx in range(num_lanes):
+        if num_vehicles + spawned >= max_vehicles:
+            break
+        if draws[lane_idx, 0] >= spawn_prob or counts[lane_idx] >= capacity:
+            continue
+
+        r = draws[lane_idx, 1]
+        dest = -1
+        if route_turns.shape[0] > 0:
+            k = reach_ptr[lane_idx + 1] - reach_ptr[lane_idx]
+            if k > 0:
+                dest = reach_dest[reach_ptr[lane_idx] + min(int(r * k), k - 1)]
+        if dest >= 0:
+            turn = route_turns[dest, lane_links[lane_idx]]
+        elif r < 0.6:
+            turn = 0  # straight
+        elif r < 0.8:
+            turn = 2  # right
+        else:
+            turn = 1  # left
+
+        slot = (heads[lane_idx] + counts[lane_idx]) % capacity
+        positions[lane_idx, slot] = 0.0
+        speeds[lane_idx, slot] = max_speed
+        stops[lane_idx, slot] = 0
+        spawn_times[lane_idx, slot] = time
+        turns[lane_idx, slot] = turn
+        vehicle_ids[lane_idx, slot] = next_vehicle_id + spawned
+        destinations[lane_idx, slot] = dest
+
+        counts[lane_idx] += 1
+        spawned += 1
+
+    return spawned
+
+
+@njit(cache=True)
+def _update_lane(
+    positions: np.ndarray,
+    speeds: np.ndarray,
+    stops: np.ndarray,
+    lane_idx: int,
+    head: int,
+    n: int,
+    is_green: bool,
+    stop_line: float,
+    lane_length: float,
+    safe_gap: float,
+    dt: float,
+    max_speed: float,
+) -> None:
+    """
+    Move the n vehicles of one lane ring buffer, front to back.
+    Same rules as WorldState._update_vehicles_sequential.
+    """
+    capacity = positions.shape[1]
+    slot = head
+    front_pos = 0.0
+
+    for i in range(n):
+        old_pos = positions[lane_idx, slot]
+        old_speed = speeds[lane_idx, slot]
+
+        desired_pos = old_pos + max_speed * dt
+        new_speed = max_speed
+
+        # Collision avoidance: keep safe gap to the vehicle in front
+        if i > 0:
+            max_pos = front_pos - safe_gap
+            if desired_pos > max_pos:
+                desired_pos = max_pos
+                if desired_pos <= old_pos + 1e-3:
+                    new_speed = 0.0
+
+        # Respect red light: stop before stop line
+        if not is_green:
+            if old_pos < stop_line and desired_pos >= stop_line:
+                desired_pos = stop_line - 0.5
+                if desired_pos <= old_pos + 1e-3:
+                    new_speed = 0.0
+
+        # Count stop events (speed > 0 -> 0)
+        if old_speed > 0.1 and new_speed <= 0.1:
+            stops[lane_idx, slot] += 1
+
+        # Clamp position to reasonable bounds
+        if desired_pos < 0.0:
+            desired_pos = 0.0
+        if desired_pos > lane_length + 20.0:
+            desired_pos = lane_length + 20.0
+
+        positions[lane_idx, slot] = desired_pos
+        speeds[lane_idx, slot] = new_speed
+
+        front_pos = desired_pos
+        slot += 1
+        if slot == capacity:
+            slot = 0
+
+
+@njit(cache=True)
+def _pop_finished(
+    positions: np.ndarray,
+    stops: np.ndarray,
+    spawn_times: np.ndarray,
+    heads: np.ndarray,
+    counts: np.ndarray,
+    lane_idx: int,
+    lane_length: float,
+    t_next: float,
+    finished_tt: np.ndarray,
+    finished_stops: np.ndarray,
+    finished_counts: np.ndarray,
+) -> int:
+    """
+    Pop the vehicles at the head of one lane that reached lane_length and
+    append their travel time and stop count to the lane's finished log.
+    Returns the number of popped vehicles.
+    """
+    capacity = positions.shape[1]
+    head = heads[lane_idx]
+    n = counts[lane_idx]
+    logged = finished_counts[lane_idx]
+
+    k = 0
+    while k < n and positions[lane_idx, head] >= lane_length:
+        finished_tt[lane_idx, logged + k] = t_next - spawn_times[lane_idx, head]
+        finished_stops[lane_idx, logged + k] = stops[lane_idx, head]
+        k += 1
+        head += 1
+        if head == capacity:
+            head = 0
+
+    heads[lane_idx] = head
+    counts[lane_idx] = n - k
+    finished_counts[lane_idx] = logged + k
+    return k
+
+
+@njit(cache=True)
+def _count_exits(
+    positions: np.ndarray,
+    heads: np.ndarray,
+    counts: np.ndarray,
+    lane_idx: int,
+    lane_length: float,
+) -> int:
+    """Number of vehicles at the head of one lane that reached lane_length."""
+    capacity = positions.shape[1]
+    slot = heads[lane_idx]
+    n = counts[lane_idx]
+    k = 0
+    while k < n and positions[lane_idx, slot] >= lane_length:
+        k += 1
+        slot += 1
+        if slot == capacity:
+            slot = 0
+    return k
+
+
+# splitmix64 constants of the hop turn hash (see world_state.hop_turn_codes)
+_MIX_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_MUL1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_MUL2 = np.uint64(0x94D049BB133111EB)
+
+
+@njit(cache=True)
+def _mix64(z: np.uint64) -> np.uint64:
+    """One splitmix64 output for state z."""
+    z = z + _MIX_GAMMA
+    z = (z ^ (z >> np.uint64(30))) * _MIX_MUL1
+    z = (z ^ (z >> np.uint64(27))) * _MIX_MUL2
+    return z ^ (z >> np.uint64(31))
+
+
+@njit(cache=True)
+def _hop_turn(turn_seed: np.uint64, vehicle_id: int, link: int) -> int:
+    """
+    Turn code of a vehicle entering link, from a hash of the seed, its id
+    and the link; same values as world_state.hop_turn_codes.
+    """
+    z = _mix64(_mix64(turn_seed ^ np.uint64(vehicle_id)) ^ np.uint64(link))
+    r = np.float64(z >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+    if r < 0.6:
+        return 0  # straight
+    elif r < 0.8:
+        return 2  # right
+    return 1  # left
+
+
+@njit(cache=True)
+def _accept_transfers(
+    turns: np.ndarray,
+    heads: np.ndarray,
+    counts: np.ndarray,
+    exits: np.ndarray,
+    lane_next: np.ndarray,
+    up_ptr: np.ndarray,
+    up_lane: np.ndarray,
+    transfer_ok: np.ndarray,
+    lane_idx: int,
+) -> None:
+    """
+    First pass of the transfer into one downstream lane: walk the exiting
+    vehicles of its upstream lanes (in lane order, front to back) whose turn
+    leads here and flag the ones that still fit in transfer_ok, by slot.
+    """
+    capacity = turns.shape[1]
+    free = capacity - counts[lane_idx]
+    for j in range(up_ptr[lane_idx], up_ptr[lane_idx + 1]):
+        up = up_lane[j]
+        slot = heads[up]
+        for _ in range(exits[up]):
+            if lane_next[up, turns[up, slot]] == lane_idx:
+                transfer_ok[up, slot] = free > 0
+                if free > 0:
+                    free -= 1
+            slot += 1
+            if slot == capacity:
+                slot = 0
+
+
+@njit(cache=True)
+def _leave_count(
+    turns: np.ndarray,
+    heads: np.ndarray,
+    exits: np.ndarray,
+    lane_next: np.ndarray,
+    transfer_ok: np.ndarray,
+    lane_idx: int,
+) -> int:
+    """
+    Exiting vehicles of one lane that actually leave it: those in front of
+    the first one refused by its downstream lane (vehicles never overtake).
+    """
+    capacity = turns.shape[1]
+    slot = heads[lane_idx]
+    for k in range(exits[lane_idx]):
+        if lane_next[lane_idx, turns[lane_idx, slot]] >= 0 and not transfer_ok[lane_idx, slot]:
+            return k
+        slot += 1
+        if slot == capacity:
+            slot = 0
+    return exits[lane_idx]
+
+
+@njit(cache=True)
+def _pull_transfers(
+    positions: np.ndarray,
+    speeds: np.ndarray,
+    stops: np.ndarray,
+    spawn_times: np.ndarray,
+    turns: np.ndarray,
+    vehicle_ids: np.ndarray,
+    destinations: np.ndarray,
+    heads: np.ndarray,
+    counts: np.ndarray,
+    exits: np.ndarray,
+    lane_next: np.ndarray,
+    lane_links: np.ndarray,
+    up_ptr: np.ndarray,
+    up_lane: np.ndarray,
+    transfer_ok: np.ndarray,
+    turn_seed: np.uint64,
+    route_turns: np.ndarray,
+    lane_idx: int,
+) -> None:
+    """
+    Second pass: append the vehicles that leave the upstream lanes for this
+    one to its tail, in the order of _accept_transfers, at position 0 with
+    their speed, stops, spawn time, id and destination, and a new turn:
+    the next one of their route, or _hop_turn without a destination.
+    Only free slots of this lane are written, so lanes pull in parallel.
+    """
+    capacity = turns.shape[1]
+    tail = (heads[lane_idx] + counts[lane_idx]) % capacity
+    moved = 0
+    for j in range(up_ptr[lane_idx], up_ptr[lane_idx + 1]):
+        up = up_lane[j]
+        slot = heads[up]
+        for _ in range(_leave_count(turns, heads, exits, lane_next, transfer_ok, up)):
+            if lane_next[up, turns[up, slot]] == lane_idx:
+                positions[lane_idx, tail] = 0.0
+                speeds[lane_idx, tail] = speeds[up, slot]
+                stops[lane_idx, tail] = stops[up, slot]
+                spawn_times[lane_idx, tail] = spawn_times[up, slot]
+                vehicle_ids[lane_idx, tail] = vehicle_ids[up, slot]
+                dest = destinations[up, slot]
+                destinations[lane_idx, tail] = dest
+                turn = -1
+                if dest >= 0:
+                    turn = route_turns[dest, lane_links[lane_idx]]
+                if turn < 0:
+                    turn = _hop_turn(turn_seed, vehicle_ids[up, slot], lane_links[lane_idx])
+                turns[lane_idx, tail] = turn
+                moved += 1
+                tail += 1
+                if tail == capacity:
+                    tail = 0
+            slot += 1
+            if slot == capacity:
+                slot = 0
+    counts[lane_idx] += moved
+
+
+@njit(cache=True)
+def _pop_transferred(
+    stops: np.ndarray,
+    spawn_times: np.ndarray,
+    turns: np.ndarray,
+    heads: np.ndarray,
+    counts: np.ndarray,
+    exits: np.ndarray,
+    lane_next: np.ndarray,
+    transfer_ok: np.ndarray,
+    lane_idx: int,
+    t_next: float,
+    finished_tt: np.ndarray,
+    finished_stops: np.ndarray,
+    finished_counts: np.ndarray,
+) -> int:
+    """
+    Last pass: pop the vehicles that left one lane, logging those that left
+    the network like _pop_finished. Returns the number logged.
+    """
+    capacity = turns.shape[1]
+    leave = _leave_count(turns, heads, exits, lane_next, transfer_ok, lane_idx)
+    slot = heads[lane_idx]
+    logged = finished_counts[lane_idx]
+    done = 0
+    for _ in range(leave):
+        if lane_next[lane_idx, turns[lane_idx, slot]] < 0:
+            finished_tt[lane_idx, logged + done] = t_next - spawn_times[lane_idx, slot]
+            finished_stops[lane_idx, logged + done] = stops[lane_idx, slot]
+            done += 1
+        slot += 1
+        if slot == capacity:
+            slot = 0
+
+    heads[lane_idx] = slot
+    counts[lane_idx] -= leave
+    finished_counts[lane_idx] = logged + done
+    return done
+
+
+@njit(parallel=True, cache=True)
+def _transfer_vehicles(
+    positions: np.ndarray,
+    speeds: np.ndarray,
+    stops: np.ndarray,
+    spawn_times: np.ndarray,
+    turns: np.ndarray,
+    vehicle_ids: np.ndarray,
+    destinations: np.ndarray,
+    heads: np.ndarray,
+    counts: np.ndarray,
+    exits: np.ndarray,
+    lane_next: np.ndarray,
+    lane_links: np.ndarray,
+    up_ptr: np.ndarray,
+    up_lane: np.ndarray,
+    transfer_ok: np.ndarray,
+    turn_seed: np.uint64,
+    route_turns: np.ndarray,
+    t_next: float,
+    finished_tt: np.ndarray,
+    finished_stops: np.ndarray,
+    finished_counts: np.ndarray,
+    popped: np.ndarray,
+) -> None:
+    """
+    Hand the exits[lane] vehicles at the head of every lane that reached its
+    end to the downstream lane their turn selects (lane_next[lane, turn],
+    -1: leave the network and log as finished), in parallel over lanes.
+
+    A downstream lane takes the vehicles of its upstream lanes (up_ptr /
+    up_lane, in lane order) front to back while it has free slots, counted
+    before this step's pops; a refused vehicle waits at the head of its
+    lane with everyone behind it. Each pass only writes the lanes it runs
+    for, so the result does not depend on the thread count. Same rules as
+    WorldState._transfer_vehicles. popped[lane] receives the vehicles that
+    left the network from each lane.
+    """
+    num_lanes = counts.shape[0]
+    for lane_idx in prange(num_lanes):
+        _accept_transfers(
+            turns, heads, counts, exits, lane_next, up_ptr, up_lane, transfer_ok, lane_idx,
+        )
+    for lane_idx in prange(num_lanes):
+        _pull_transfers(
+            positions, speeds, stops, spawn_times, turns, vehicle_ids, destinations,
+            heads, counts, exits, lane_next, lane_links, up_ptr, up_lane, transfer_ok,
+            turn_seed, route_turns, lane_idx,
+        )
+    for lane_idx in prange(num_lanes):
+        popped[lane_idx] = _pop_transferred(
+            stops, spawn_times, turns, heads, counts, exits, lane_next, transfer_ok,
+            lane_idx, t_next, finished_tt, finished_stops, finished_counts,
+        )
+
+
+# Extra room (in m) required on top of safe_gap and before lane_length for
+# a lane to count as free-flowing. Repeated additions round every position
+# by up to one ulp per step, so _free_flow_steps adds one ulp of the
+# largest position (lane_length + 20) in the state dtype per step on top.
+FREE_FLOW_MARGIN = 1e-6
+# Steps to wait before checking a lane that was not free-flowing again.
+FREE_FLOW_RETRY_STEPS = 8
+
+
+@njit(cache=True)
+def _free_flow_steps(
+    positions: np.ndarray,
+    lane_idx: int,
+    head: int,
+    n: int,
+    step: int,
+    n_steps: int,
+    draws: np.ndarray,
+    spawn_prob: float,
+    is_green_steps: np.ndarray,
+    stop_line: float,
+    lane_length: float,
+    safe_gap: float,
+    dt: float,
+    max_speed: float,
+) -> int:
+    """
+    Number of steps, starting at step, during which the update of one lane
+    provably reduces to position += max_speed * dt for every vehicle:
+    - no vehicle is held by its leader (all gaps exceed safe_gap),
+    - no vehicle reaches lane_length (nothing finishes),
+    - no vehicle crosses the stop line while the light is red,
+    - no vehicle can spawn into the lane (checked from step + 1 on, since
+      the spawn of step runs before the update).
+    The horizon never goes past the end of the block. Returns 0 if the lane
+    is not free-flowing now.
+    """
+    capacity = positions.shape[1]
+    step_len = max_speed * dt
+    k = n_steps - step
+    # The front vehicle reaches lane_length within max_drift_steps free-flow
+    # steps, which bounds k and so the rounding drift
+    max_drift_steps = min(k, int((lane_length + 20.0) / step_len) + 1)
+    margin = FREE_FLOW_MARGIN + max_drift_steps * np.finfo(positions.dtype).eps * (lane_length + 20.0)
+
+    if n > 0:
+        # front vehicle must stay below lane_length
+        front = positions[lane_idx, head]
+        if front + step_len >= lane_length - margin:
+            return 0
+        k = min(k, int((lane_length - margin - front) / step_len))
+
+        # A red light only matters in a step where a vehicle behind the stop
+        # line would cross it. The first vehicle behind the line is the
+        # closest one, so nobody crosses in the next k_cross steps; after
+        # that the light has to stay green.
+        first_behind = _first_behind(positions, lane_idx, head, n, stop_line)
+        if first_behind < n:
+            pos = positions[lane_idx, (head + first_behind) % capacity]
+            k_cross = int((stop_line - margin - pos) / step_len)
+            j = 0
+            while j < k and is_green_steps[step + j, lane_idx]:
+                j += 1
+            k = min(k, max(j, k_cross))
+            if k == 0:
+                return 0
+
+        # gaps never change in free flow, so check them once
+        slot = head
+        prev = front
+        for _ in range(1, n):
+            slot += 1
+            if slot == capacity:
+                slot = 0
+            pos = positions[lane_idx, slot]
+            if prev - pos < safe_gap + margin:
+                return 0
+            prev = pos
+
+    for j in range(1, k):
+        if draws[step + j, lane_idx, 0] < spawn_prob:
+            return j
+    return k
+
+
+@njit(cache=True)
+def _advance_free_flow(
+    positions: np.ndarray,
+    speeds: np.ndarray,
+    lane_idx: int,
+    head: int,
+    n: int,
+    k: int,
+    dt: float,
+    max_speed: float,
+) -> None:
+    """
+    Apply k free-flow steps to one lane (see _free_flow_steps). Positions
+    are advanced by repeated addition and rounded to the state dtype after
+    each one, exactly as k single steps would.
+    """
+    capacity = positions.shape[1]
+    step_len = max_speed * dt
+    slot = head
+    for _ in range(n):
+        pos = positions[lane_idx, slot]
+        for _ in range(k):
+            pos = positions.dtype.type(pos + step_len)
+        positions[lane_idx, slot] = pos
+        speeds[lane_idx, slot] = max_speed
+        slot += 1
+        if slot == capacity:
+            slot = 0
+
+
+# Fewer vehicles than this to update in a step are handled by one thread:
+# starting a parallel region costs more than moving them.
+PARALLEL_MIN_VEHICLES = 512
+
+# Lanes with at least intra_lane_min vehicles are split into chunks that are
+# updated by several threads (see run_lanes_kernel). Smallest chunk of one
+# lane handed to a thread.
+INTRA_LANE_MIN_CHUNK = 256
+
+
+@njit(cache=True)
+def _binds_tighter(targets: np.ndarray, lane_idx: int, j: int, k: int, safe_gap: float) -> bool:
+    """
+    For vehicles j < k of one lane: True if the leader chain starting at j
+    (targets[j] - (i - j) * safe_gap) is below the one starting at k for
+    every vehicle i >= k. The comparison does not depend on i.
+    """
+    return targets[lane_idx, j] - (k - j) * safe_gap < targets[lane_idx, k]
+
+
+@njit(cache=True)
+def _first_behind(
+    positions: np.ndarray, lane_idx: int, head: int, n: int, stop_line: float
+) -> int:
+    """Index (from the lane head) of the first vehicle with position < stop_line."""
+    capacity = positions.shape[1]
+    lo = 0
+    hi = n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if positions[lane_idx, (head + mid) % capacity] < stop_line:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+@njit(cache=True)
+def _plan_lane_tasks(
+    positions: np.ndarray,
+    heads: np.ndarray,
+    counts: np.ndarray,
+    is_green_arr: np.ndarray,
+    stop_line_arr: np.ndarray,
+    intra_lane_min: int,
+    num_threads: int,
+    busy_until: np.ndarray,
+    step: int,
+    lane_split: np.ndarray,
+    task_lane: np.ndarray,
+    task_start: np.ndarray,
+    task_end: np.ndarray,
+) -> int:
+    """
+    Split the lane updates of one step into tasks [task_start, task_end)
+    of vehicle indices (from the lane head). Lanes still inside a
+    free-flow macro step (busy_until > step) get no task.
+
+    Short lanes get one task and lane_split = -1. Long lanes are scanned in
+    chunks; lane_split holds the index of the vehicle a red light may hold
+    (counts[lane] if green), which gets a task of its own.
+    Returns the number of tasks.
+    """
+    num_lanes = counts.shape[0]
+    n_tasks = 0
+
+    for lane_idx in range(num_lanes):
+        n = counts[lane_idx]
+        lane_split[lane_idx] = -1
+        if n == 0 or busy_until[lane_idx] > step:
+            continue
+
+        if n < intra_lane_min:
+            task_lane[n_tasks] = lane_idx
+            task_start[n_tasks] = 0
+            task_end[n_tasks] = n
+            n_tasks += 1
+            continue
+
+        split = n
+        if not is_green_arr[lane_idx]:
+            split = _first_behind(positions, lane_idx, heads[lane_idx], n, stop_line_arr[lane_idx])
+        lane_split[lane_idx] = split
+
+        chunk = max(INTRA_LANE_MIN_CHUNK, (n + 2 * num_threads - 1) // (2 * num_threads))
+        for seg_start, seg_end in ((0, split), (split, min(split + 1, n)), (split + 1, n)):
+            start = seg_start
+            while start < seg_end:
+                end = min(start + chunk, seg_end)
+                task_lane[n_tasks] = lane_idx
+                task_start[n_tasks] = start
+                task_end[n_tasks] = end
+                n_tasks += 1
+                start = end
+
+    return n_tasks
+
+
+@njit(cache=True)
+def _scan_chunk_targets(
+    positions: np.ndarray,
+    targets: np.ndarray,
+    lane_idx: int,
+    head: int,
+    start: int,
+    end: int,
+    lane_length: float,
+    safe_gap: float,
+    dt: float,
+    max_speed: float,
+) -> int:
+    """
+    Free-flow targets of vehicles [start, end) of a lane (clamped to
+    lane_length + 20) and the index of the tightest leader chain among them.
+    """
+    capacity = positions.shape[1]
+    slot = (head + start) % capacity
+    for i in range(start, end):
+        target = positions[lane_idx, slot] + max_speed * dt
+        if target > lane_length + 20.0:
+            target = lane_length + 20.0
+        targets[lane_idx, i] = target
+        slot += 1
+        if slot == capacity:
+            slot = 0
+
+    best = start
+    for k in range(start + 1, end):
+        if not _binds_tighter(targets, lane_idx, best, k, safe_gap):
+            best = k
+    return best
+
+
+@njit(cache=True)
+def _resolve_lane_carries(
+    positions: np.ndarray,
+    heads: np.ndarray,
+    lane_split: np.ndarray,
+    counts: np.ndarray,
+    n_tasks: int,
+    task_lane: np.ndarray,
+    task_start: np.ndarray,
+    task_best: np.ndarray,
+    task_carry: np.ndarray,
+    targets: np.ndarray,
+    red_hit: np.ndarray,
+    stop_line_arr: np.ndarray,
+    lane_length_arr: np.ndarray,
+    safe_gap: float,
+    dt: float,
+    max_speed: float,
+) -> None:
+    """
+    Sequential pass over the chunk results of the scanned lanes:
+    task_carry[t] becomes the tightest leader chain in front of task t.
+    The vehicle at lane_split (held by a red light) is resolved here with
+    the sequential rule, and its final position replaces its target so the
+    chain behind it restarts from there.
+    """
+    capacity = positions.shape[1]
+    carry = -1
+    prev_lane = -1
+
+    for t in range(n_tasks):
+        lane_idx = task_lane[t]
+        split = lane_split[lane_idx]
+        if split < 0:
+            continue
+        if lane_idx != prev_lane:
+            carry = -1
+            red_hit[lane_idx] = False
+            prev_lane = lane_idx
+
+        if task_start[t] == split and split < counts[lane_idx]:
+            stop_line = stop_line_arr[lane_idx]
+            lane_length = lane_length_arr[lane_idx]
+
+            old_pos = positions[lane_idx, (heads[lane_idx] + split) % capacity]
+            desired_pos = old_pos + max_speed * dt
+            if split > 0:
+                front_pos = targets[lane_idx, carry] - (split - 1 - carry) * safe_gap
+                if front_pos < 0.0:
+                    front_pos = 0.0
+                max_pos = front_pos - safe_gap
+                if desired_pos > max_pos:
+                    desired_pos = max_pos
+            if desired_pos >= stop_line:
+                desired_pos = stop_line - 0.5
+                red_hit[lane_idx] = True
+            if desired_pos < 0.0:
+                desired_pos = 0.0
+            if desired_pos > lane_length + 20.0:
+                desired_pos = lane_length + 20.0
+
+            targets[lane_idx, split] = desired_pos
+            task_carry[t] = -1
+            carry = split
+        else:
+            task_carry[t] = carry
+            best = task_best[t]
+            if carry < 0 or not _binds_tighter(targets, lane_idx, carry, best, safe_gap):
+                carry = best
+
+
+@njit(cache=True)
+def _scan_chunk_positions(
+    targets: np.ndarray,
+    new_positions: np.ndarray,
+    lane_idx: int,
+    start: int,
+    end: int,
+    carry: int,
+    safe_gap: float,
+) -> None:
+    """New positions of vehicles [start, end) given the chain in front of them."""
+    best = carry
+    for i in range(start, end):
+        if best < 0 or not _binds_tighter(targets, lane_idx, best, i, safe_gap):
+            best = i
+        pos = targets[lane_idx, best] - (i - best) * safe_gap
+        if pos < 0.0:
+            pos = 0.0
+        new_positions[lane_idx, i] = pos
+
+
+@njit(cache=True)
+def _commit_chunk(
+    positions: np.ndarray,
+    speeds: np.ndarray,
+    stops: np.ndarray,
+    new_positions: np.ndarray,
+    lane_idx: int,
+    head: int,
+    start: int,
+    end: int,
+    split: int,
+    red_hit: bool,
+    stop_line: float,
+    safe_gap: float,
+    dt: float,
+    max_speed: float,
+) -> None:
+    """
+    Speeds and stop events of vehicles [start, end) from the new positions,
+    with the same rules as _update_lane, then write the new positions.
+    """
+    capacity = positions.shape[1]
+    slot = (head + start) % capacity
+    for i in range(start, end):
+        old_pos = positions[lane_idx, slot]
+        desired_pos = old_pos + max_speed * dt
+        new_speed = max_speed
+
+        if i > 0:
+            max_pos = new_positions[lane_idx, i - 1] - safe_gap
+            if desired_pos > max_pos and max_pos <= old_pos + 1e-3:
+                new_speed = 0.0
+
+        if i == split and red_hit and stop_line - 0.5 <= old_pos + 1e-3:
+            new_speed = 0.0
+
+        if speeds[lane_idx, slot] > 0.1 and new_speed <= 0.1:
+            stops[lane_idx, slot] += 1
+
+        positions[lane_idx, slot] = new_positions[lane_idx, i]
+        speeds[lane_idx, slot] = new_speed
+
+        slot += 1
+        if slot == capacity:
+            slot = 0
+
+
+@njit(cache=True)
+def _step_short_lane(
+    positions: np.ndarray,
+    speeds: np.ndarray,
+    stops: np.ndarray,
+    spawn_times: np.ndarray,
+    heads: np.ndarray,
+    counts: np.ndarray,
+    lane_idx: int,
+    step: int,
+    n_steps: int,
+    draws: np.ndarray,
+    spawn_prob: float,
+    is_green_steps: np.ndarray,
+    stop_line_arr: np.ndarray,
+    lane_length_arr: np.ndarray,
+    safe_gap: float,
+    dt: float,
+    max_speed: float,
+    t_next: float,
+    finished_tt: np.ndarray,
+    finished_stops: np.ndarray,
+    finished_counts: np.ndarray,
+    busy_until: np.ndarray,
+    retry_at: np.ndarray,
+    macro_steps: bool,
+    pop: bool,
+) -> int:
+    """
+    Move + pop finished vehicles of one lane updated by a single thread.
+    With macro_steps, a free-flowing lane is advanced through its whole
+    horizon instead and marked busy until then; a lane that is not free is
+    only checked again at retry_at. Returns the number of finished vehicles;
+    without pop they are only counted and stay at the head of the lane
+    (see _transfer_vehicles).
+    """
+    if busy_until[lane_idx] > step:
+        return 0
+    n = counts[lane_idx]
+    lane_length = lane_length_arr[lane_idx]
+
+    if macro_steps and retry_at[lane_idx] <= step:
+        k = _free_flow_steps(
+            positions, lane_idx, heads[lane_idx], n, step, n_steps,
+            draws, spawn_prob, is_green_steps, stop_line_arr[lane_idx],
+            lane_length, safe_gap, dt, max_speed,
+        )
+        if k > 0:
+            _advance_free_flow(positions, speeds, lane_idx, heads[lane_idx], n, k, dt, max_speed)
+            busy_until[lane_idx] = step + k
+            return 0
+        # congested lanes tend to stay so: do not check again right away
+        retry_at[lane_idx] = step + FREE_FLOW_RETRY_STEPS
+
+    if n == 0:
+        return 0
+    _update_lane(
+        positions, speeds, stops, lane_idx, heads[lane_idx], n,
+        is_green_steps[step, lane_idx], stop_line_arr[lane_idx],
+        lane_length, safe_gap, dt, max_speed,
+    )
+    if not pop:
+        return _count_exits(positions, heads, counts, lane_idx, lane_length)
+    return _pop_finished(
+        positions, stops, spawn_times, heads, counts, lane_idx,
+        lane_length, t_next, finished_tt, finished_stops, finished_counts,
+    )
+
+
+@njit(parallel=True, cache=True)
+def _run_lane_tasks(
+    positions: np.ndarray,
+    speeds: np.ndarray,
+    stops: np.ndarray,
+    spawn_times: np.ndarray,
+    heads: np.ndarray,
+    counts: np.ndarray,
+    is_green_arr: np.ndarray,
+    stop_line_arr: np.ndarray,
+    lane_length_arr: np.ndarray,
+    safe_gap: float,
+    dt: float,
+    max_speed: float,
+    t_next: float,
+    finished_tt: np.ndarray,
+    finished_stops: np.ndarray,
+    finished_counts: np.ndarray,
+    scan_targets: np.ndarray,
+    scan_positions: np.ndarray,
+    intra_lane_min: int,
+    num_threads: int,
+    busy_until: np.ndarray,
+    step: int,
+    lane_split: np.ndarray,
+    red_hit: np.ndarray,
+    task_lane: np.ndarray,
+    task_start: np.ndarray,
+    task_end: np.ndarray,
+    task_best: np.ndarray,
+    task_carry: np.ndarray,
+    popped: np.ndarray,
+    pop: bool,
+) -> None:
+    """
+    Move + pop finished vehicles for one step when some lanes are long
+    enough to be split across threads (see run_lanes_kernel).
+    popped[lane_idx] receives the number of finished vehicles per lane;
+    without pop they are only counted, as in _step_short_lane.
+    """
+    num_lanes = counts.shape[0]
+
+    n_tasks = _plan_lane_tasks(
+        positions, heads, counts, is_green_arr, stop_line_arr,
+        intra_lane_min, num_threads, busy_until, step,
+        lane_split, task_lane, task_start, task_end,
+    )
+    popped[:] = 0
+
+    # 1) short lanes: full update; long lanes: chunk targets + tightest chain start
+    for t in prange(n_tasks):
+        lane_idx = task_lane[t]
+        lane_length = lane_length_arr[lane_idx]
+        if lane_split[lane_idx] < 0:
+            # whole lane in one task
+            _update_lane(
+                positions, speeds, stops, lane_idx, heads[lane_idx], counts[lane_idx],
+                is_green_arr[lane_idx], stop_line_arr[lane_idx],
+                lane_length, safe_gap, dt, max_speed,
+            )
+            if pop:
+                popped[lane_idx] = _pop_finished(
+                    positions, stops, spawn_times, heads, counts, lane_idx,
+                    lane_length, t_next, finished_tt, finished_stops, finished_counts,
+                )
+            else:
+                popped[lane_idx] = _count_exits(positions, heads, counts, lane_idx, lane_length)
+        else:
+            task_best[t] = _scan_chunk_targets(
+                positions, scan_targets, lane_idx, heads[lane_idx],
+                task_start[t], task_end[t], lane_length, safe_gap, dt, max_speed,
+            )
+
+    # 2) chain the chunk results of every long lane (sequential, one value per chunk)
+    _resolve_lane_carries(
+        positions, heads, lane_split, counts, n_tasks,
+        task_lane, task_start, task_best, task_carry,
+        scan_targets, red_hit, stop_line_arr, lane_length_arr,
+        safe_gap, dt, max_speed,
+    )
+
+    # 3) new positions of every chunk
+    for t in prange(n_tasks):
+        lane_idx = task_lane[t]
+        if lane_split[lane_idx] >= 0:
+            _scan_chunk_positions(
+                scan_targets, scan_positions, lane_idx,
+                task_start[t], task_end[t], task_carry[t], safe_gap,
+            )
+
+    # 4) speeds and stop events, then write the positions back
+    for t in prange(n_tasks):
+        lane_idx = task_lane[t]
+        if lane_split[lane_idx] >= 0:
+            _commit_chunk(
+                positions, speeds, stops, scan_positions, lane_idx,
+                heads[lane_idx], task_start[t], task_end[t],
+                lane_split[lane_idx], red_hit[lane_idx],
+                stop_line_arr[lane_idx], safe_gap, dt, max_speed,
+            )
+
+    for lane_idx in range(num_lanes):
+        if lane_split[lane_idx] < 0:
+            continue
+        if pop:
+            popped[lane_idx] = _pop_finished(
+                positions, stops, spawn_times, heads, counts, lane_idx,
+                lane_length_arr[lane_idx], t_next,
+                finished_tt, finished_stops, finished_counts,
+            )
+        else:
+            popped[lane_idx] = _count_exits(positions, heads, counts, lane_idx, lane_length_arr[lane_idx])
+
+
+@njit(parallel=True, cache=True)
+def run_lanes_kernel(
+    n_steps: int,
+    positions: np.ndarray,
+    speeds: np.ndarray,
+    stops: np.ndarray,
+    spawn_times: np.ndarray,
+    turns: np.ndarray,
+    vehicle_ids: np.ndarray,
+    destinations: np.ndarray,
+    heads: np.ndarray,
+    counts: np.ndarray,
+    draws: np.ndarray,
+    spawn_prob: float,
+    num_vehicles: int,
+    max_vehicles: int,
+    next_vehicle_id: int,
+    time: float,
+    is_green_steps: np.ndarray,
+    stop_line_arr: np.ndarray,
+    lane_length_arr: np.ndarray,
+    safe_gap: float,
+    dt: float,
+    max_speed: float,
+    finished_tt: np.ndarray,
+    finished_stops: np.ndarray,
+    finished_counts: np.ndarray,
+    scan_targets: np.ndarray,
+    scan_positions: np.ndarray,
+    intra_lane_min: int,
+    num_threads: int,
+    stop_when_empty: bool,
+    macro_steps: bool,
+    lane_next: np.ndarray,
+    lane_links: np.ndarray,
+    up_ptr: np.ndarray,
+    up_lane: np.ndarray,
+    transfer_ok: np.ndarray,
+    turn_seed: np.uint64,
+    route_turns: np.ndarray,
+    reach_ptr: np.ndarray,
+    reach_dest: np.ndarray,
+) -> Tuple[int, int, int, float]:
+    """
+    Run n_steps fused simulation steps on the lane ring buffers.
+
+    Every step:
+    1) spawn (sequential over lanes because of the global max_vehicles cap)
+    2) move + pop finished vehicles, in parallel over lanes
+    3) if any lane has a downstream lane (up_lane is not empty), hand the
+       vehicles that reached the end of their lane over to the lane their
+       turn selects instead of popping them in 2) (_transfer_vehicles)
+
+    With a routing table (route_turns, reach_ptr, reach_dest, indexed by
+    the network links lane_links) vehicles get a destination at spawn and
+    follow its route; see _spawn_into_lanes.
+
+    Lanes with at least intra_lane_min vehicles are additionally split
+    across threads. Unrolling the leader constraint gives
+    pos[i] = max(0, min over j <= i of (target[j] - (i - j) * safe_gap)),
+    so each chunk finds its tightest chain start in parallel, the chunk
+    results are chained sequentially, and every chunk then writes its
+    positions in parallel. With an integral safe_gap all these values are
+    exact in float64, so the result is bit-identical to the sequential
+    front-to-back update; otherwise every lane is updated by one thread.
+
+    With macro_steps, a short lane found free-flowing for the next k steps
+    (see _free_flow_steps) is advanced through all of them at once and left
+    alone until step + k (not with transfers: a lane cannot tell when its
+    upstream lanes will hand it a vehicle). Steps in which every lane is
+    inside such a macro step only advance the clock. The trajectories are
+    unchanged in float64 and in float32, since positions are rounded to
+    the state dtype after every step (_advance_free_flow). Steps with
+    fewer than PARALLEL_MIN_VEHICLES vehicles to move run on one thread.
+
+    draws[step] and is_green_steps[step] hold the spawn uniforms and the
+    light state of every lane for that step. Finished vehicles are appended
+    to the per-lane finished log (finished_tt, finished_stops,
+    finished_counts), which the caller drains.
+    With stop_when_empty the loop ends early after a step that leaves the
+    world empty, so the caller can skip the idle steps that follow.
+    Returns (steps run, spawned, finished, time after the last step).
+    """
+    num_lanes = counts.shape[0]
+    popped = np.zeros(num_lanes, dtype=np.int64)
+    exits = np.zeros(num_lanes, dtype=np.int64)
+    transfers = up_lane.shape[0] > 0
+    macro_steps = macro_steps and not transfers
+    total_spawned = 0
+    total_finished = 0
+
+    exact_scan = safe_gap == np.floor(safe_gap)
+    max_tasks = num_lanes * (2 * num_threads + 3)
+    task_lane = np.zeros(max_tasks, dtype=np.int64)
+    task_start = np.zeros(max_tasks, dtype=np.int64)
+    task_end = np.zeros(max_tasks, dtype=np.int64)
+    task_best = np.zeros(max_tasks, dtype=np.int64)
+    task_carry = np.zeros(max_tasks, dtype=np.int64)
+    lane_split = np.zeros(num_lanes, dtype=np.int64)
+    red_hit = np.zeros(num_lanes, dtype=np.bool_)
+    busy_until = np.zeros(num_lanes, dtype=np.int64)
+    retry_at = np.zeros(num_lanes, dtype=np.int64)
+
+    steps_run = 0
+    for step in range(n_steps):
+        t_next = time + dt
+        is_green_arr = is_green_steps[step]
+
+        # lanes not inside a macro step and their vehicles (plain loop, see longest below)
+        active = 0
+        active_vehicles = 0
+        for lane_idx in range(num_lanes):
+            if busy_until[lane_idx] <= step:
+                active += 1
+                active_vehicles += counts[lane_idx]
+        if active == 0:
+            # nobody can spawn and every lane is already advanced past this step
+            time = t_next
+            steps_run += 1
+            continue
+
+        spawned = _spawn_into_lanes(
+            positions, speeds, stops, spawn_times, turns, vehicle_ids, destinations,
+            heads, counts, draws[step], spawn_prob,
+            num_vehicles, max_vehicles, next_vehicle_id, time, max_speed,
+            lane_links, route_turns, reach_ptr, reach_dest,
+        )
+        num_vehicles += spawned
+        next_vehicle_id += spawned
+        total_spawned += spawned
+
+        # plain loop: counts.max() would become a parallel reduction here
+        longest = 0
+        for lane_idx in range(num_lanes):
+            longest = max(longest, counts[lane_idx])
+
+        if not exact_scan or longest < intra_lane_min:
+            # every lane is short: one thread per lane, unless there is too
+            # little work this step to pay for starting a parallel region
+            if active > 1 and active_vehicles >= PARALLEL_MIN_VEHICLES:
+                for lane_idx in prange(num_lanes):
+                    popped[lane_idx] = _step_short_lane(
+                        positions, speeds, stops, spawn_times, heads, counts, lane_idx,
+                        step, n_steps, draws, spawn_prob, is_green_steps,
+                        stop_line_arr, lane_length_arr, safe_gap, dt, max_speed, t_next,
+                        finished_tt, finished_stops, finished_counts, busy_until, retry_at, macro_steps,
+                        not transfers,
+                    )
+            else:
+                for lane_idx in range(num_lanes):
+                    popped[lane_idx] = _step_short_lane(
+                        positions, speeds, stops, spawn_times, heads, counts, lane_idx,
+                        step, n_steps, draws, spawn_prob, is_green_steps,
+                        stop_line_arr, lane_length_arr, safe_gap, dt, max_speed, t_next,
+                        finished_tt, finished_stops, finished_counts, busy_until, retry_at, macro_steps,
+                        not transfers,
+                    )
+        else:
+            _run_lane_tasks(
+                positions, speeds, stops, spawn_times, heads, counts,
+                is_green_arr, stop_line_arr, lane_length_arr,
+                safe_gap, dt, max_speed, t_next,
+                finished_tt, finished_stops, finished_counts,
+                scan_targets, scan_positions, intra_lane_min, num_threads,
+                busy_until, step, lane_split, red_hit, task_lane, task_start, task_end,
+                task_best, task_carry, popped, not transfers,
+            )
+
+        if transfers:
+            # popped holds the vehicles that reached the end of each lane
+            exits[:] = popped
+            _transfer_vehicles(
+                positions, speeds, stops, spawn_times, turns, vehicle_ids, destinations,
+                heads, counts, exits, lane_next, lane_links, up_ptr, up_lane,
+                transfer_ok, turn_seed, route_turns, t_next,
+                finished_tt, finished_stops, finished_counts, popped,
+            )
+
+        finished = 0
+        for lane_idx in range(num_lanes):
+            finished += popped[lane_idx]
+        num_vehicles -= finished
+        total_finished += finished
+
+        time = t_next
+        steps_run += 1
+        if stop_when_empty and num_vehicles == 0:
+            break
+
+    return steps_run, total_spawned, total_finished, time
+
+
+@njit(parallel=True, cache=True)
+def run_ensemble_kernel(
+    n_steps: int,
+    positions: np.ndarray,
+    speeds: np.ndarray,
+    stops: np.ndarray,
+    spawn_times: np.ndarray,
+    turns: np.ndarray,
+    vehicle_ids: np.ndarray,
+    destinations: np.ndarray,
+    heads: np.ndarray,
+    counts: np.ndarray,
+    draws: np.ndarray,
+    spawn_prob: float,
+    num_vehicles: np.ndarray,
+    max_vehicles: int,
+    next_vehicle_ids: np.ndarray,
+    time: float,
+    is_green_steps: np.ndarray,
+    stop_line_arr: np.ndarray,
+    lane_length_arr: np.ndarray,
+    safe_gap: float,
+    dt: float,
+    max_speed: float,
+    finished_tt: np.ndarray,
+    finished_stops: np.ndarray,
+    finished_counts: np.ndarray,
+    spawned_out: np.ndarray,
+    finished_out: np.ndarray,
+    lane_next: np.ndarray,
+    lane_links: np.ndarray,
+    up_ptr: np.ndarray,
+    up_lane: np.ndarray,
+    transfer_ok: np.ndarray,
+    turn_seeds: np.ndarray,
+    route_turns: np.ndarray,
+    reach_ptr: np.ndarray,
+    reach_dest: np.ndarray,
+) -> float:
+    """
+    Run n_steps fused steps of num_replicas independent worlds.
+
+    Vehicle columns have shape (num_replicas, num_lanes, capacity) and
+    heads/counts (num_replicas, num_lanes); every replica is the state of
+    one WorldState. Every step:
+    1) spawn, in parallel over replicas (sequential over the lanes of a
+       replica because of its max_vehicles cap)
+    2) move + pop finished vehicles, in parallel over replicas x lanes
+    3) with link-to-link transfers (up_lane not empty), hand the vehicles
+       that reached the end of their lane to the next one instead of
+       popping them in 2), in the three passes of
+       _transfer_vehicles, each over replicas x lanes
+
+    draws[step, replica] holds the spawn uniforms of that replica, so each
+    replica follows exactly the trajectory of a WorldState with the same
+    stream. All replicas share the light timeline is_green_steps[step].
+    num_vehicles and next_vehicle_ids (per replica) are updated in place;
+    spawned_out / finished_out receive the per-replica totals of the block.
+    Returns the time after the last step.
+    """
+    num_replicas = counts.shape[0]
+    num_lanes = counts.shape[1]
+    num_tasks = num_replicas * num_lanes
+    popped = np.zeros((num_replicas, num_lanes), dtype=np.int64)
+    exits = np.zeros((num_replicas, num_lanes), dtype=np.int64)
+    transfers = up_lane.shape[0] > 0
+    spawned_out[:] = 0
+    finished_out[:] = 0
+
+    for step in range(n_steps):
+        t_next = time + dt
+        is_green_arr = is_green_steps[step]
+
+        for r in prange(num_replicas):
+            spawned = _spawn_into_lanes(
+                positions[r], speeds[r], stops[r], spawn_times[r], turns[r],
+                vehicle_ids[r], destinations[r], heads[r], counts[r], draws[step, r], spawn_prob,
+                num_vehicles[r], max_vehicles, next_vehicle_ids[r], time, max_speed,
+                lane_links, route_turns, reach_ptr, reach_dest,
+            )
+            num_vehicles[r] += spawned
+            next_vehicle_ids[r] += spawned
+            spawned_out[r] += spawned
+
+        for task in prange(num_tasks):
+            r = task // num_lanes
+            lane_idx = task % num_lanes
+            popped[r, lane_idx] = 0
+            exits[r, lane_idx] = 0
+            n = counts[r, lane_idx]
+            if n == 0:
+                continue
+
+            lane_length = lane_length_arr[lane_idx]
+            _update_lane(
+                positions[r], speeds[r], stops[r], lane_idx, heads[r, lane_idx], n,
+                is_green_arr[lane_idx], stop_line_arr[lane_idx],
+                lane_length, safe_gap, dt, max_speed,
+            )
+            if transfers:
+                exits[r, lane_idx] = _count_exits(positions[r], heads[r], counts[r], lane_idx, lane_length)
+            else:
+                popped[r, lane_idx] = _pop_finished(
+                    positions[r], stops[r], spawn_times[r], heads[r], counts[r], lane_idx,
+                    lane_length, t_next, finished_tt[r], finished_stops[r], finished_counts[r],
+                )
+
+        if transfers:
+            for task in prange(num_tasks):
+                r = task // num_lanes
+                _accept_transfers(
+                    turns[r], heads[r], counts[r], exits[r], lane_next, up_ptr, up_lane,
+                    transfer_ok[r], task % num_lanes,
+                )
+            for task in prange(num_tasks):
+                r = task // num_lanes
+                _pull_transfers(
+                    positions[r], speeds[r], stops[r], spawn_times[r], turns[r], vehicle_ids[r],
+                    destinations[r], heads[r], counts[r], exits[r], lane_next, lane_links,
+                    up_ptr, up_lane, transfer_ok[r], turn_seeds[r], route_turns, task % num_lanes,
+                )
+            for task in prange(num_tasks):
+                r = task // num_lanes
+                lane_idx = task % num_lanes
+                popped[r, lane_idx] = _pop_transferred(
+                    stops[r], spawn_times[r], turns[r], heads[r], counts[r], exits[r],
+                    lane_next, transfer_ok[r], lane_idx, t_next,
+                    finished_tt[r], finished_stops[r], finished_counts[r],
+                )
+
+        # plain loops: popped.sum(axis=1) would become a parallel reduction here
+        for r in range(num_replicas):
+            finished = 0
+            for lane_idx in range(num_lanes):
+                finished += popped[r, lane_idx]
+            num_vehicles[r] -= finished
+            finished_out[r] += finished
+
+        time = t_next
+
+    return time
+
+
+@njit(parallel=True, cache=True)
+def next_hop_kernel(
+    destinations: np.ndarray,
+    exit_turns: np.ndarray,
+    link_length: np.ndarray,
+    up_ptr: np.ndarray,
+    up_link: np.ndarray,
+    up_turn: np.ndarray,
+    next_turn: np.ndarray,
+) -> None:
+    """
+    Fill next_turn[i, link] with the turn to take at the end of link on a
+    shortest route to link destinations[i] (see routing.RoutingTable), one
+    destination per thread.
+
+    Dijkstra from the destination over the upstream links (up_ptr /
+    up_link / up_turn): reaching the end of the destination from the end
+    of link costs the lengths of the links entered on the way. Ties go to
+    the link popped first, the one with the lower id among equal
+    distances, so the table does not depend on the thread count.
+    """
+    num_links = link_length.shape[0]
+    for i in prange(destinations.shape[0]):
+        dest = destinations[i]
+        dist = np.full(num_links, np.inf)
+        dist[dest] = 0.0
+        next_turn[i, dest] = exit_turns[i]
+
+        heap = [(0.0, dest)]
+        while len(heap) > 0:
+            d, link = heapq.heappop(heap)
+            if d > dist[link]:
+                continue
+            through = d + link_length[link]
+            for j in range(up_ptr[link], up_ptr[link + 1]):
+                up = up_link[j]
+                if through < dist[up]:
+                    dist[up] = through
+                    next_turn[i, up] = up_turn[j]
+                    heapq.heappush(heap, (through, up))
@@ -0,0 +1,547 @@
+"""
+Numba CUDA kernels of WorldState.step_cuda and WorldState.run_steps_cuda.
+
+Importing this module imports numba.cuda, so it is only loaded through
+traffic_sim.model.kernels.get_kernel when the CUDA backend needs it.
+"""
+import math
+
+import numpy as np
+from numba import cuda
+from numba.cuda.random import xoroshiro128p_uniform_float64
+
+# Largest block the kernels support (size of their shared-memory buffers;
+# also the CUDA limit).
+MAX_BLOCK_THREADS = 1024
+
+
+@cuda.jit(device=True)
+def _binds_tighter(targets, lane_idx, j, k, safe_gap):
+    """cpu_kernels._binds_tighter on the device."""
+    return targets[lane_idx, j] - (k - j) * safe_gap < targets[lane_idx, k]
+
+
+@cuda.jit(device=True)
+def _first_behind(positions, lane_idx, head, n, stop_line):
+    """Index (from the lane head) of the first vehicle with position < stop_line."""
+    capacity = positions.shape[1]
+    lo = 0
+    hi = n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if positions[lane_idx, (head + mid) % capacity] < stop_line:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+@cuda.jit(device=True)
+def _update_lane_sequential(
+    positions, speeds, stops, lane_idx, head, n, is_green,
+    stop_line, lane_length, safe_gap, dt, max_speed,
+):
+    """The sequential lane update (cpu_kernels._update_lane), front to back."""
+    capacity = positions.shape[1]
+    slot = head
+    front_pos = 0.0
+    for i in range(n):
+        old_pos = positions[lane_idx, slot]
+        old_speed = speeds[lane_idx, slot]
+
+        desired_pos = old_pos + max_speed * dt
+        new_speed = max_speed
+
+        # Collision avoidance: keep safe gap to the vehicle in front
+        if i > 0:
+            max_pos = front_pos - safe_gap
+            if desired_pos > max_pos:
+                desired_pos = max_pos
+                if desired_pos <= old_pos + 1e-3:
+                    new_speed = 0.0
+
+        # Respect red light: stop before stop line
+        if not is_green:
+            if old_pos < stop_line and desired_pos >= stop_line:
+                desired_pos = stop_line - 0.5
+                if desired_pos <= old_pos + 1e-3:
+                    new_speed = 0.0
+
+        # Count stop events (speed > 0 -> 0)
+        if old_speed > 0.1 and new_speed <= 0.1:
+            stops[lane_idx, slot] += 1
+
+        # Clamp position to reasonable bounds
+        if desired_pos < 0.0:
+            desired_pos = 0.0
+        if desired_pos > lane_length + 20.0:
+            desired_pos = lane_length + 20.0
+
+        positions[lane_idx, slot] = desired_pos
+        speeds[lane_idx, slot] = new_speed
+
+        front_pos = desired_pos
+
+        slot += 1
+        if slot == capacity:
+            slot = 0
+
+
+@cuda.jit(cache=True)
+def update_lanes_kernel_cuda(
+    positions,       # float[:, :]  (lane, ring slot), device resident
+    speeds,          # float[:, :]
+    stops,           # int32[:, :]
+    ctrl,            # int64[4, num_lanes]: head, count, spawn slot or -1, green
+    stop_line_arr,   # float64[:]
+    lane_length_arr, # float64[:]
+    targets,         # float64[:, :] scratch, by vehicle index from the head
+    new_positions,   # float64[:, :] scratch, by vehicle index from the head
+    safe_gap: float,
+    dt: float,
+    max_speed: float,
+):
+    """
+    CUDA kernel that updates all lanes on the device-resident ring buffers,
+    with the same results as the sequential update.
+
+    Grid:
+        blocks stride over the lanes, so any grid size covers every lane
+        threads of a block stride over the vehicles of its lane, so a lane
+        may hold any number of vehicles
+
+    A vehicle's new position depends on its leader's new position. With an
+    integral safe_gap this leader chain is resolved exactly as in the CPU
+    intra-lane scan (run_lanes_kernel): every thread finds the tightest
+    chain in a contiguous chunk of the lane, thread 0 carries the chains
+    across chunks (and resolves the vehicle a red light may hold), and
+    every thread then writes its chunk. Otherwise thread 0 updates the
+    lane front to back.
+
+    A vehicle spawned on the host this step is the last one of its lane;
+    it is initialised before the update.
+    """
+    tid = cuda.threadIdx.x
+    nthreads = cuda.blockDim.x
+    num_lanes = ctrl.shape[1]
+    capacity = positions.shape[1]
+    exact_scan = safe_gap == math.floor(safe_gap)
+
+    chunk_best_front = cuda.shared.array(MAX_BLOCK_THREADS, dtype=np.int64)
+    chunk_best_back = cuda.shared.array(MAX_BLOCK_THREADS, dtype=np.int64)
+    chunk_carry = cuda.shared.array(MAX_BLOCK_THREADS, dtype=np.int64)
+    lane_split = cuda.shared.array(2, dtype=np.int64)  # split, red hit
+
+    for lane_idx in range(cuda.blockIdx.x, num_lanes, cuda.gridDim.x):
+        n = ctrl[1, lane_idx]
+        if n == 0:
+            continue
+        head = ctrl[0, lane_idx]
+        is_green = ctrl[3, lane_idx] != 0
+        stop_line = stop_line_arr[lane_idx]
+        lane_length = lane_length_arr[lane_idx]
+
+        if tid == 0:
+            if ctrl[2, lane_idx] >= 0:
+                slot = ctrl[2, lane_idx]
+                positions[lane_idx, slot] = 0.0
+                speeds[lane_idx, slot] = max_speed
+                stops[lane_idx, slot] = 0
+            if not exact_scan:
+                _update_lane_sequential(
+                    positions, speeds, stops, lane_idx, head, n, is_green,
+                    stop_line, lane_length, safe_gap, dt, max_speed,
+                )
+            elif is_green:
+                lane_split[0] = n
+            else:
+                lane_split[0] = _first_behind(positions, lane_idx, head, n, stop_line)
+            lane_split[1] = 0
+        cuda.syncthreads()
+        if not exact_scan:
+            continue
+        split = lane_split[0]
+
+        # Free-flow targets (clamped to lane_length + 20)
+        for i in range(tid, n, nthreads):
+            target = positions[lane_idx, (head + i) % capacity] + max_speed * dt
+            if target > lane_length + 20.0:
+                target = lane_length + 20.0
+            targets[lane_idx, i] = target
+        cuda.syncthreads()
+
+        # Tightest chain of this thread's chunk, in front of and behind split
+        chunk = (n + nthreads - 1) // nthreads
+        start = min(tid * chunk, n)
+        end = min(start + chunk, n)
+        best = -1
+        for k in range(start, min(end, split)):
+            if best < 0 or not _binds_tighter(targets, lane_idx, best, k, safe_gap):
+                best = k
+        chunk_best_front[tid] = best
+        best = -1
+        for k in range(max(start, split + 1), end):
+            if best < 0 or not _binds_tighter(targets, lane_idx, best, k, safe_gap):
+                best = k
+        chunk_best_back[tid] = best
+        cuda.syncthreads()
+
+        # Carry the chains across chunks (cpu_kernels._resolve_lane_carries)
+        if tid == 0:
+            carry = -1
+            for t in range(nthreads):
+                t_start = min(t * chunk, n)
+                t_end = min(t_start + chunk, n)
+                chunk_carry[t] = carry
+                best = chunk_best_front[t]
+                if best >= 0 and (carry < 0 or not _binds_tighter(targets, lane_idx, carry, best, safe_gap)):
+                    carry = best
+                if t_start <= split and split < t_end:
+                    old_pos = positions[lane_idx, (head + split) % capacity]
+                    desired_pos = old_pos + max_speed * dt
+                    if split > 0:
+                        front_pos = targets[lane_idx, carry] - (split - 1 - carry) * safe_gap
+                        if front_pos < 0.0:
+                            front_pos = 0.0
+                        max_pos = front_pos - safe_gap
+                        if desired_pos > max_pos:
+                            desired_pos = max_pos
+                    if desired_pos >= stop_line:
+                        desired_pos = stop_line - 0.5
+                        lane_split[1] = 1
+                    if desired_pos < 0.0:
+                        desired_pos = 0.0
+                    if desired_pos > lane_length + 20.0:
+                        desired_pos = lane_length + 20.0
+                    targets[lane_idx, split] = desired_pos
+                    carry = split
+                best = chunk_best_back[t]
+                if best >= 0 and not _binds_tighter(targets, lane_idx, carry, best, safe_gap):
+                    carry = best
+        cuda.syncthreads()
+
+        # New positions of the chunk (cpu_kernels._scan_chunk_positions)
+        best = chunk_carry[tid]
+        for i in range(start, end):
+            if i == split or best < 0 or not _binds_tighter(targets, lane_idx, best, i, safe_gap):
+                best = i
+            pos = targets[lane_idx, best] - (i - best) * safe_gap
+            if pos < 0.0:
+                pos = 0.0
+            new_positions[lane_idx, i] = pos
+        cuda.syncthreads()
+
+        # Speeds, stop events and commit (cpu_kernels._commit_chunk)
+        red_hit = lane_split[1] != 0
+        for i in range(tid, n, nthreads):
+            slot = (head + i) % capacity
+            old_pos = positions[lane_idx, slot]
+            desired_pos = old_pos + max_speed * dt
+            new_speed = max_speed
+
+            if i > 0:
+                max_pos = new_positions[lane_idx, i - 1] - safe_gap
+                if desired_pos > max_pos and max_pos <= old_pos + 1e-3:
+                    new_speed = 0.0
+
+            if i == split and red_hit and stop_line - 0.5 <= old_pos + 1e-3:
+                new_speed = 0.0
+
+            if speeds[lane_idx, slot] > 0.1 and new_speed <= 0.1:
+                stops[lane_idx, slot] += 1
+
+            positions[lane_idx, slot] = new_positions[lane_idx, i]
+            speeds[lane_idx, slot] = new_speed
+        cuda.syncthreads()
+
+
+@cuda.jit(cache=True)
+def finished_lanes_kernel_cuda(
+    positions,       # float[:, :]
+    stops,           # int32[:, :]
+    ctrl,            # int64[4, num_lanes]
+    lane_length_arr, # float64[:]
+    pop_counts,      # int64[:]  out: vehicles that finished, per lane
+    pop_stops,       # int32[:, :]  out: (k, lane) stop counts of those vehicles
+):
+    """
+    One thread per lane (grid-stride): count the vehicles at the head of
+    the lane that reached its end and copy out their stop counts. The host
+    pops them.
+    """
+    capacity = positions.shape[1]
+    for lane_idx in range(cuda.grid(1), ctrl.shape[1], cuda.gridsize(1)):
+        n = ctrl[1, lane_idx]
+        slot = ctrl[0, lane_idx]
+        lane_length = lane_length_arr[lane_idx]
+
+        k = 0
+        while k < n and positions[lane_idx, slot] >= lane_length:
+            pop_stops[k, lane_idx] = stops[lane_idx, slot]
+            k += 1
+            slot += 1
+            if slot == capacity:
+                slot = 0
+        pop_counts[lane_idx] = k
+
+
+@cuda.jit
+def move_vehicles_kernel_cuda(
+    positions,       # float[:, :]
+    speeds,          # float[:, :]
+    stops,           # int32[:, :]
+    moves,           # int64[4, n]: source lane, source slot, target lane, target slot
+):
+    """
+    One thread per move (grid-stride): copy a vehicle handed to a
+    downstream lane into its new slot, at position 0. Targets are free
+    slots, so no move reads a slot another one writes.
+    """
+    for i in range(cuda.grid(1), moves.shape[1], cuda.gridsize(1)):
+        src_lane = moves[0, i]
+        src_slot = moves[1, i]
+        dst_lane = moves[2, i]
+        dst_slot = moves[3, i]
+        positions[dst_lane, dst_slot] = 0.0
+        speeds[dst_lane, dst_slot] = speeds[src_lane, src_slot]
+        stops[dst_lane, dst_slot] = stops[src_lane, src_slot]
+
+
+@cuda.jit(device=True)
+def _welford_add(acc, x):
+    """Add x to acc = (count, mean, m2)."""
+    acc[0] += 1.0
+    delta = x - acc[1]
+    acc[1] += delta / acc[0]
+    acc[2] += delta * (x - acc[1])
+
+
+@cuda.jit(device=True)
+def _welford_merge(buf, i, j):
+    """Merge the (count, mean, m2) in row j of buf into row i (Chan et al.)."""
+    nb = buf[j, 0]
+    if nb == 0.0:
+        return
+    na = buf[i, 0]
+    n = na + nb
+    delta = buf[j, 1] - buf[i, 1]
+    buf[i, 1] += delta * nb / n
+    buf[i, 2] += buf[j, 2] + delta * delta * na * nb / n
+    buf[i, 0] = n
+
+
+@cuda.jit(device=True)
+def _sketch_add(bins, x, min_value, log_gamma, min_key):
+    """QuantileSketch.add_many for one value; bins[0] is the zero bucket."""
+    if x < min_value:
+        cuda.atomic.add(bins, 0, 1)
+        return
+    idx = int(math.ceil(math.log(x) / log_gamma)) - min_key
+    if idx < 0:
+        idx = 0
+    if idx > bins.shape[0] - 2:
+        idx = bins.shape[0] - 2
+    cuda.atomic.add(bins, idx + 1, 1)
+
+
+@cuda.jit(device=True)
+def _reduce_block(buf, acc, summary, row, tid, nthreads):
+    """
+    Tree-reduce every thread's (count, mean, m2) through shared memory and
+    write the block total to summary[row, 0:3] (count, total, m2).
+    """
+    buf[tid, 0] = acc[0]
+    buf[tid, 1] = acc[1]
+    buf[tid, 2] = acc[2]
+    cuda.syncthreads()
+    s = 1
+    while s < nthreads:
+        if tid % (2 * s) == 0 and tid + s < nthreads:
+            _welford_merge(buf, tid, tid + s)
+        cuda.syncthreads()
+        s *= 2
+    if tid == 0:
+        summary[row, 0] = buf[0, 0]
+        summary[row, 1] = buf[0, 0] * buf[0, 1]
+        summary[row, 2] = buf[0, 2]
+    cuda.syncthreads()
+
+
+@cuda.jit(cache=True)
+def run_lanes_kernel_cuda(
+    n_steps,
+    positions,       # float[2, num_lanes, capacity]: double buffer
+    speeds,          # float[:, :]
+    stops,           # int32[:, :]
+    spawn_times,     # float64[:, :]
+    turns,           # int8[:, :]
+    vehicle_ids,     # int64[:, :]
+    lane_state,      # int64[2, num_lanes]: heads, counts
+    counters,        # int64[4]: num_vehicles, next vehicle id, positions buffer, spawned
+    cur,             # positions buffer holding the current positions
+    rng_states,      # one xoroshiro128p state per lane
+    spawn_prob: float,
+    max_vehicles: int,
+    time: float,
+    is_green_steps,  # bool_[n_steps, num_lanes]
+    stop_line_arr,   # float64[:]
+    lane_length_arr, # float64[:]
+    safe_gap: float,
+    dt: float,
+    max_speed: float,
+    summary,         # float64[blocks, 2, 5] out: per block travel time / stops (count, total, m2, min, max)
+    tt_bins,         # int64[:] travel time QuantileSketch buckets, zero bucket first
+    stops_bins,      # int64[:] stops QuantileSketch buckets, zero bucket first
+    sketch_min_value: float,
+    sketch_log_gamma: float,
+    sketch_min_key: int,
+):
+    """
+    n_steps steps of the whole world in one launch. Block b owns lanes
+    b, b + blocks, ... and runs the whole time loop on them.
+
+    Every step, in every block:
+    1) thread 0 spawns into the block's lanes, lane by lane, with two
+       uniforms per lane from that lane's xoroshiro128p stream
+    2) all threads move the vehicles, block-stride over each lane, reading
+       positions[cur] and writing positions[1 - cur]: a vehicle keeps its
+       gap to where its leader was at the start of the step
+    3) the threads pop the finished vehicles of the block's lanes, one lane
+       each, and add them to their running (Welford) travel-time and stop
+       stats and to the quantile buckets
+    Steps are separated by block barriers only, so lanes of different
+    blocks must not interact: the max_vehicles cap is applied in lane
+    order, which takes a single block unless it can never bind (see
+    CudaDeviceLoop.run). At the end the per-thread stats are reduced in
+    shared memory, so only summary[b] and the bucket counts leave the device.
+    """
+    tid = cuda.threadIdx.x
+    nthreads = cuda.blockDim.x
+    blk = cuda.blockIdx.x
+    nblocks = cuda.gridDim.x
+    num_lanes = lane_state.shape[1]
+    capacity = speeds.shape[1]
+
+    tt_acc = cuda.local.array(3, dtype=np.float64)
+    st_acc = cuda.local.array(3, dtype=np.float64)
+    for j in range(3):
+        tt_acc[j] = 0.0
+        st_acc[j] = 0.0
+    tt_min = math.inf
+    tt_max = -math.inf
+    st_min = math.inf
+    st_max = -math.inf
+
+    for step in range(n_steps):
+        nxt = 1 - cur
+        t_next = time + dt
+
+        if tid == 0:
+            for lane_idx in range(blk, num_lanes, nblocks):
+                u = xoroshiro128p_uniform_float64(rng_states, lane_idx)
+                r = xoroshiro128p_uniform_float64(rng_states, lane_idx)
+                if counters[0] >= max_vehicles or u >= spawn_prob:
+                    continue
+                if lane_state[1, lane_idx] >= capacity:
+                    continue
+                if r < 0.6:
+                    turn = 0  # straight
+                elif r < 0.8:
+                    turn = 2  # right
+                else:
+                    turn = 1  # left
+                slot = (lane_state[0, lane_idx] + lane_state[1, lane_idx]) % capacity
+                positions[cur, lane_idx, slot] = 0.0
+                speeds[lane_idx, slot] = max_speed
+                stops[lane_idx, slot] = 0
+                spawn_times[lane_idx, slot] = time
+                turns[lane_idx, slot] = turn
+                vehicle_ids[lane_idx, slot] = cuda.atomic.add(counters, 1, 1)
+                lane_state[1, lane_idx] += 1
+                cuda.atomic.add(counters, 0, 1)
+                cuda.atomic.add(counters, 3, 1)
+        cuda.syncthreads()
+
+        for lane_idx in range(blk, num_lanes, nblocks):
+            head = lane_state[0, lane_idx]
+            n = lane_state[1, lane_idx]
+            is_green = is_green_steps[step, lane_idx]
+            stop_line = stop_line_arr[lane_idx]
+            lane_length = lane_length_arr[lane_idx]
+            for i in range(tid, n, nthreads):
+                slot = (head + i) % capacity
+                old_pos = positions[cur, lane_idx, slot]
+                old_speed = speeds[lane_idx, slot]
+
+                desired_pos = old_pos + max_speed * dt
+                new_speed = max_speed
+
+                # Collision avoidance: keep safe gap to the vehicle in front
+                if i > 0:
+                    max_pos = positions[cur, lane_idx, (head + i - 1) % capacity] - safe_gap
+                    if desired_pos > max_pos:
+                        desired_pos = max_pos
+                        if desired_pos <= old_pos + 1e-3:
+                            new_speed = 0.0
+
+                # Respect red light: stop before stop line
+                if not is_green:
+                    if old_pos < stop_line and desired_pos >= stop_line:
+                        desired_pos = stop_line - 0.5
+                        if desired_pos <= old_pos + 1e-3:
+                            new_speed = 0.0
+
+                # Count stop events (speed > 0 -> 0)
+                if old_speed > 0.1 and new_speed <= 0.1:
+                    stops[lane_idx, slot] += 1
+
+                # Clamp position to reasonable bounds
+                if desired_pos < 0.0:
+                    desired_pos = 0.0
+                if desired_pos > lane_length + 20.0:
+                    desired_pos = lane_length + 20.0
+
+                positions[nxt, lane_idx, slot] = desired_pos
+                speeds[lane_idx, slot] = new_speed
+        cuda.syncthreads()
+
+        for lane_idx in range(blk + tid * nblocks, num_lanes, nthreads * nblocks):
+            head = lane_state[0, lane_idx]
+            n = lane_state[1, lane_idx]
+            lane_length = lane_length_arr[lane_idx]
+            k = 0
+            while k < n and positions[nxt, lane_idx, head] >= lane_length:
+                tt = t_next - spawn_times[lane_idx, head]
+                st = float(stops[lane_idx, head])
+                _welford_add(tt_acc, tt)
+                _welford_add(st_acc, st)
+                tt_min = min(tt_min, tt)
+                tt_max = max(tt_max, tt)
+                st_min = min(st_min, st)
+                st_max = max(st_max, st)
+                _sketch_add(tt_bins, tt, sketch_min_value, sketch_log_gamma, sketch_min_key)
+                _sketch_add(stops_bins, st, sketch_min_value, sketch_log_gamma, sketch_min_key)
+                k += 1
+                head += 1
+                if head == capacity:
+                    head = 0
+            if k > 0:
+                lane_state[0, lane_idx] = head
+                lane_state[1, lane_idx] = n - k
+                cuda.atomic.sub(counters, 0, k)
+        cuda.syncthreads()
+
+        cur = nxt
+        time = t_next
+
+    if tid == 0 and blk == 0:
+        counters[2] = cur
+
+    buf = cuda.shared.array((MAX_BLOCK_THREADS, 3), dtype=np.float64)
+    _reduce_block(buf, tt_acc, summary[blk], 0, tid, nthreads)
+    _reduce_block(buf, st_acc, summary[blk], 1, tid, nthreads)
+    if tt_acc[0] > 0.0:
+        cuda.atomic.min(summary, (blk, 0, 3), tt_min)
+        cuda.atomic.max(summary, (blk, 0, 4), tt_max)
+        cuda.atomic.min(summary, (blk, 1, 3), st_min)
+        cuda.atomic.max(summary, (blk, 1, 4), st_max)
@@ -0,0 +1,327 @@
+"""
+Device-resident vehicle state of a WorldState for the CUDA backend.
+
+Importing this module imports numba.cuda; WorldState only loads it when it
+first steps on the GPU.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Tuple
+
+import numpy as np
+from numba import cuda
+
+from ..metrics.collectors import StreamingStats
+from .kernels import get_kernel
+
+if TYPE_CHECKING:
+    from .world_state import WorldState
+
+# Fallbacks for devices that do not report their limits (the simulator)
+WARP_SIZE = 32
+DEFAULT_SM_COUNT = 1
+DEFAULT_THREADS_PER_SM = 2048
+
+
+def block_threads(block_size: int, work: int) -> int:
+    """
+    Threads per block for at most work items per block: block_size,
+    shrunk to the whole warps the work fills, so short lanes do not
+    launch idle warps. Raises ValueError if block_size is above what the
+    kernels (or the device) support.
+    """
+    from .cuda_kernels import MAX_BLOCK_THREADS
+    device = cuda.current_context().device
+    limit = min(MAX_BLOCK_THREADS, getattr(device, "MAX_THREADS_PER_BLOCK", MAX_BLOCK_THREADS))
+    if not 1 <= block_size <= limit:
+        raise ValueError(f"gpu block size must be in [1, {limit}], got {block_size}")
+    warps = (max(work, 1) + WARP_SIZE - 1) // WARP_SIZE
+    return min(block_size, warps * WARP_SIZE)
+
+
+def grid_blocks(threads: int, work_blocks: int) -> int:
+    """
+    Blocks to launch for work_blocks blocks of work with grid-stride
+    kernels: no more than fit on the device at once (full occupancy),
+    the kernels loop over the rest.
+    """
+    device = cuda.current_context().device
+    sm_count = getattr(device, "MULTIPROCESSOR_COUNT", DEFAULT_SM_COUNT)
+    per_sm = getattr(device, "MAX_THREADS_PER_MULTI_PROCESSOR", DEFAULT_THREADS_PER_SM)
+    resident = sm_count * max(1, per_sm // threads)
+    return max(1, min(work_blocks, resident))
+
+
+class CudaWorldBuffers:
+    """
+    Persistent device copies of a world's positions, speeds and stops, plus
+    pinned host staging buffers for the small per-step transfers.
+
+    Spawning, the lights and the ring buffer bookkeeping (heads, counts,
+    spawn times) stay on the host; per step only the (4, num_lanes) control
+    block goes to the device and the per-lane finished counts, with the
+    stop counts of the finished vehicles, come back. Vehicles handed to a
+    downstream lane are moved on the device by move_vehicles. The vehicle columns
+    are copied back only by copy_to_host.
+    """
+
+    def __init__(self, world: WorldState) -> None:
+        num_lanes = len(world.directions_order)
+        self.positions = cuda.to_device(world.positions)
+        self.speeds = cuda.to_device(world.speeds)
+        self.stops = cuda.to_device(world.stops)
+        self.positions_host = cuda.pinned_array(world.positions.shape, dtype=world.positions.dtype)
+        self.speeds_host = cuda.pinned_array(world.speeds.shape, dtype=world.speeds.dtype)
+        self.stop_line = cuda.to_device(world.stop_line_arr)
+        self.lane_length = cuda.to_device(world.lane_length_arr)
+        self.block_size = world.gpu_block_size
+        # scratch of the leader chain scan, by vehicle index from the head;
+        # float64 like the sequential chain, whatever the state precision
+        self.targets = cuda.device_array(world.positions.shape, dtype=np.float64)
+        self.new_positions = cuda.device_array(world.positions.shape, dtype=np.float64)
+
+        # head, count, spawn slot (-1: none), green; uploaded every step
+        self.ctrl_host = cuda.pinned_array((4, num_lanes), dtype=np.int64)
+        self.ctrl = cuda.device_array((4, num_lanes), dtype=np.int64)
+
+        # (k, lane) layout, so the first kmax rows are one contiguous copy
+        self.pop_counts_host = cuda.pinned_array(num_lanes, dtype=np.int64)
+        self.pop_counts = cuda.device_array(num_lanes, dtype=np.int64)
+        self.pop_stops_host = cuda.pinned_array((world.capacity, num_lanes), dtype=np.int32)
+        self.pop_stops = cuda.device_array((world.capacity, num_lanes), dtype=np.int32)
+
+    def step(
+        self,
+        heads: np.ndarray,
+        counts: np.ndarray,
+        spawn_slots: np.ndarray,
+        is_green_arr: np.ndarray,
+        safe_gap: float,
+        dt: float,
+        max_speed: float,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Run one step: update_lanes_kernel_cuda, then finished_lanes_kernel_cuda.
+        counts already include the vehicles spawned this step, at
+        spawn_slots (-1 for lanes without).
+        Returns the per-lane finished counts and the (k, lane) stop counts
+        of the finished vehicles, both views of pinned host buffers.
+        """
+        update_lanes_kernel_cuda = get_kernel("update_lanes_kernel_cuda")
+        finished_lanes_kernel_cuda = get_kernel("finished_lanes_kernel_cuda")
+
+        self.ctrl_host[0] = heads
+        self.ctrl_host[1] = counts
+        self.ctrl_host[2] = spawn_slots
+        self.ctrl_host[3] = is_green_arr
+        self.ctrl.copy_to_device(self.ctrl_host)
+
+        # Blocks stride over the lanes, their threads over the vehicles
+        num_lanes = len(counts)
+        threads = block_threads(self.block_size, int(counts.max()))
+        update_lanes_kernel_cuda[grid_blocks(threads, num_lanes), threads](
+            self.positions,
+            self.speeds,
+            self.stops,
+            self.ctrl,
+            self.stop_line,
+            self.lane_length,
+            self.targets,
+            self.new_positions,
+            safe_gap,
+            dt,
+            max_speed,
+        )
+        # One thread per lane
+        threads = block_threads(self.block_size, num_lanes)
+        blocks = grid_blocks(threads, (num_lanes + threads - 1) // threads)
+        finished_lanes_kernel_cuda[blocks, threads](
+            self.positions,
+            self.stops,
+            self.ctrl,
+            self.lane_length,
+            self.pop_counts,
+            self.pop_stops,
+        )
+
+        self.pop_counts.copy_to_host(self.pop_counts_host)
+        k_max = int(self.pop_counts_host.max())
+        if k_max > 0:
+            self.pop_stops[:k_max].copy_to_host(self.pop_stops_host[:k_max])
+        return self.pop_counts_host, self.pop_stops_host[:k_max]
+
+    def move_vehicles(
+        self,
+        src_lanes: np.ndarray,
+        src_slots: np.ndarray,
+        dst_lanes: np.ndarray,
+        dst_slots: np.ndarray,
+    ) -> None:
+        """
+        Move the device columns of vehicles handed to downstream lanes
+        (planned on the host by WorldState._transfer_vehicles).
+        """
+        move_vehicles_kernel_cuda = get_kernel("move_vehicles_kernel_cuda")
+        moves = cuda.to_device(np.stack([src_lanes, src_slots, dst_lanes, dst_slots]))
+        n = len(src_lanes)
+        threads = block_threads(self.block_size, n)
+        move_vehicles_kernel_cuda[grid_blocks(threads, (n + threads - 1) // threads), threads](
+            self.positions, self.speeds, self.stops, moves,
+        )
+
+    def motion_to_host(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Copy only the device positions and speeds into pinned host buffers and return them."""
+        self.positions.copy_to_host(self.positions_host)
+        self.speeds.copy_to_host(self.speeds_host)
+        return self.positions_host, self.speeds_host
+
+    def copy_to_host(self, world: WorldState) -> None:
+        """Copy the device vehicle columns back into the world's host arrays."""
+        self.positions.copy_to_host(world.positions)
+        self.speeds.copy_to_host(world.speeds)
+        self.stops.copy_to_host(world.stops)
+
+
+class CudaDeviceLoop:
+    """
+    The whole world on the device, for run_lanes_kernel_cuda: vehicle
+    columns (positions double-buffered), lane heads/counts and the
+    num_vehicles / next id / spawned counters.
+
+    Per launch only the light states go up; the counters, a (2, 5)
+    travel-time/stop summary per block and the quantile bucket counts come back and
+    are folded into world.metrics_raw. The vehicle columns and lane state
+    are copied back only by copy_to_host.
+    """
+
+    def __init__(self, world: WorldState, rng_states) -> None:
+        num_lanes = len(world.directions_order)
+        self.rng_states = rng_states
+
+        positions = np.zeros((2,) + world.positions.shape, dtype=world.positions.dtype)
+        positions[0] = world.positions
+        self.positions = cuda.to_device(positions)
+        self.speeds = cuda.to_device(world.speeds)
+        self.stops = cuda.to_device(world.stops)
+        self.spawn_times = cuda.to_device(world.spawn_times)
+        self.turns = cuda.to_device(world.turns)
+        self.vehicle_ids = cuda.to_device(world.vehicle_ids)
+        self.stop_line = cuda.to_device(world.stop_line_arr)
+        self.lane_length = cuda.to_device(world.lane_length_arr)
+        self.lane_state = cuda.to_device(np.stack([world.heads, world.counts]))
+
+        # num_vehicles, next vehicle id, current positions buffer, spawned
+        self.counters_host = cuda.pinned_array(4, dtype=np.int64)
+        self.counters_host[:] = (world.num_vehicles, world._next_vehicle_id, 0, 0)
+        self.counters = cuda.to_device(self.counters_host)
+
+        # Lanes only interact through the max_vehicles cap, which the kernel
+        # applies in lane order; when the lanes cannot hold more vehicles
+        # than the cap together it never binds and they can be split over
+        # blocks, otherwise the loop runs in a single block
+        self.threads = 0
+        self.blocks = 1
+        self.lanes_independent = num_lanes * world.capacity <= world.max_vehicles
+        self.summary_host = cuda.pinned_array((1, 2, 5), dtype=np.float64)
+        self.summary = cuda.device_array((1, 2, 5), dtype=np.float64)
+        # bucket 0 is the sketch's zero bucket, then its counts array
+        num_bins = len(world.metrics_raw.travel_time_quantiles.counts) + 1
+        self.bins_host = cuda.pinned_array((2, num_bins), dtype=np.int64)
+        self.bins = cuda.device_array((2, num_bins), dtype=np.int64)
+
+    def run(
+        self,
+        world: WorldState,
+        n_steps: int,
+        is_green_steps: np.ndarray,
+        dt: float,
+        block_size: int,
+    ) -> None:
+        """
+        Run n_steps steps of world from world.time in one launch with
+        blocks of (up to) block_size threads and fold the finished vehicles
+        and counters into world (not its clock). The lanes are split over
+        grid_blocks blocks when they are independent (see __init__),
+        otherwise one block runs them all.
+        """
+        run_lanes_kernel_cuda = get_kernel("run_lanes_kernel_cuda")
+
+        num_lanes = len(world.directions_order)
+        # Threads cover the vehicles of a lane and the lanes of a block
+        threads = block_threads(block_size, max(world.capacity, num_lanes))
+        if threads != self.threads:
+            self.threads = threads
+            self.blocks = grid_blocks(threads, num_lanes) if self.lanes_independent else 1
+            self.summary_host = cuda.pinned_array((self.blocks, 2, 5), dtype=np.float64)
+            self.summary = cuda.device_array((self.blocks, 2, 5), dtype=np.float64)
+
+        self.summary_host[:, :, :3] = 0.0
+        self.summary_host[:, :, 3] = np.inf
+        self.summary_host[:, :, 4] = -np.inf
+        self.summary.copy_to_device(self.summary_host)
+        self.bins_host[:] = 0
+        self.bins.copy_to_device(self.bins_host)
+        spawned_before = int(self.counters_host[3])
+
+        sketch = world.metrics_raw.travel_time_quantiles
+        run_lanes_kernel_cuda[self.blocks, threads](
+            n_steps,
+            self.positions,
+            self.speeds,
+            self.stops,
+            self.spawn_times,
+            self.turns,
+            self.vehicle_ids,
+            self.lane_state,
+            self.counters,
+            int(self.counters_host[2]),
+            self.rng_states,
+            world.spawn_rate * dt,
+            world.max_vehicles,
+            world.time,
+            cuda.to_device(is_green_steps),
+            self.stop_line,
+            self.lane_length,
+            world.safe_gap,
+            dt,
+            world.max_speed,
+            self.summary,
+            self.bins[0],
+            self.bins[1],
+            sketch.min_value,
+            sketch.log_gamma,
+            sketch.min_key,
+        )
+
+        self.counters.copy_to_host(self.counters_host)
+        self.summary.copy_to_host(self.summary_host)
+        world.num_vehicles = int(self.counters_host[0])
+        world._next_vehicle_id = int(self.counters_host[1])
+        spawned = int(self.counters_host[3]) - spawned_before
+        if spawned > 0:
+            world.metrics_raw.record_spawned(spawned)
+
+        if self.summary_host[:, 0, 0].sum() > 0:
+            self.bins.copy_to_host(self.bins_host)
+            metrics = world.metrics_raw
+            for summary in self.summary_host:
+                if summary[0, 0] == 0:
+                    continue
+                for stats, row in ((metrics.travel_times, 0), (metrics.stops, 1)):
+                    count, total, m2, lo, hi = summary[row]
+                    stats.merge(StreamingStats(int(count), float(total), float(m2), float(lo), float(hi)))
+            metrics.travel_time_quantiles.add_bucket_counts(self.bins_host[0, 1:], self.bins_host[0, 0])
+            metrics.stops_quantiles.add_bucket_counts(self.bins_host[1, 1:], self.bins_host[1, 0])
+
+    def copy_to_host(self, world: WorldState) -> None:
+        """Copy the device vehicle columns and lane state back into world."""
+        cur = int(self.counters_host[2])
+        self.positions[cur].copy_to_host(world.positions)
+        self.speeds.copy_to_host(world.speeds)
+        self.stops.copy_to_host(world.stops)
+        self.spawn_times.copy_to_host(world.spawn_times)
+        self.turns.copy_to_host(world.turns)
+        self.vehicle_ids.copy_to_host(world.vehicle_ids)
+        lane_state = self.lane_state.copy_to_host()
+        world.heads[:] = lane_state[0]
+        world.counts[:] = lane_state[1]
@@ -0,0 +1,59 @@
+"""
+On-disk cache of arrays that are slow to derive (routing tables, compiled
+network files). Every entry is one uncompressed .npz file named after its
+kind, a format version and a content hash of its input, so a changed
+input or format never picks up a stale file.
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+import zipfile
+from typing import Dict
+
+import numpy as np
+
+# Environment variable overriding the default cache directory
+CACHE_DIR_ENV = "TRAFFIC_SIM_CACHE_DIR"
+
+
+def default_cache_dir() -> str:
+    """$TRAFFIC_SIM_CACHE_DIR, or ~/.cache/traffic_sim."""
+    return os.environ.get(CACHE_DIR_ENV) or os.path.join(
+        os.path.expanduser("~"), ".cache", "traffic_sim"
+    )
+
+
+def cache_path(cache_dir: str | None, kind: str, version: int, key: str) -> str:
+    """Path of the cache entry kind/version/key in cache_dir (default_cache_dir() if None)."""
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    return os.path.join(cache_dir, f"{kind}-v{version}-{key}.npz")
+
+
+def load_arrays(path: str) -> Dict[str, np.ndarray] | None:
+    """Arrays of the cache entry at path, or None if it is missing or unreadable."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+    except (OSError, ValueError, zipfile.BadZipFile):
+        return None  # unreadable: the caller rebuilds and overwrites it
+
+
+def save_arrays(path: str, arrays: Dict[str, np.ndarray]) -> None:
+    """
+    Write arrays as the cache entry at path. The file is written under a
+    temporary name and renamed, so concurrent runs never read a partial one.
+    """
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".npz.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from ..metrics.timers import Timer
+
+from .road_network import RoadNetwork
+from .routing import RoutingTable
+from .traffic_lights import TrafficLightsController
+from .vehicles import Direction
+from .kernels import get_kernel
+from .world_state import (
+    Precision,
+    SimulationMetricsRaw,
+    SpawnUniformStream,
+    block_steps_for,
+    lane_transfer_tables,
+    log_entries_per_step,
+    route_tables,
+    state_dtype,
+    step_times,
+    turn_seed_for,
+)
+
+
+# Longest block of steps handed to the kernel at once. Bounds the memory of
+# the per-block spawn uniforms and finished logs, which grow with
+# num_replicas * num_lanes * steps.
+ENSEMBLE_MAX_BLOCK_STEPS = 1024
+
+
+class EnsembleWorldState:
+    """
+    num_replicas independent worlds with the same geometry, lights and
+    parameters, simulated together. Replica r behaves exactly like a
+    WorldState with random_seed=seeds[r] advanced with run_steps: it has its
+    own RNG stream, vehicle ids and max_vehicles cap.
+
+    Vehicle columns carry a replica dimension, (num_replicas, num_lanes,
+    capacity), with the same per-lane FIFO ring buffers as WorldState, so a
+    single kernel call advances every replica and the parallel loop runs
+    over replicas x lanes instead of the handful of lanes of one world.
+    Memory grows as num_replicas * num_lanes * capacity (max_vehicles, or
+    lane_capacity if smaller); with precision="float32" positions and
+    speeds take half of it.
+    """
+
+    def __init__(
+        self,
+        road_network: RoadNetwork,
+        lights: TrafficLightsController,
+        spawn_rate: float,
+        max_vehicles: int,
+        seeds: Sequence[int],
+        max_speed: float = 13.9,  # ~50 km/h
+        safe_gap: float = 5.0,    # minimum distance between vehicles
+        precision: Precision = "float64",
+        lane_capacity: int | None = None,
+        routing: RoutingTable | None = None,
+    ) -> None:
+
+        self.road_network = road_network
+        self.lights = lights
+        self.spawn_rate = spawn_rate
+        self.max_vehicles = max_vehicles
+        self.max_speed = max_speed
+        self.safe_gap = safe_gap
+        self.seeds: List[int] = list(seeds)
+
+        # Every network link is a lane, in link order (see WorldState)
+        self.lane_directions = road_network.link_direction
+        self.directions_order: List[Direction] = [Direction(d) for d in self.lane_directions.tolist()]
+        num_lanes = len(self.directions_order)
+        num_replicas = len(self.seeds)
+        self.num_replicas = num_replicas
+
+        # Lane geometry indexed by lane_idx, shared by all replicas
+        self.stop_line_arr = road_network.link_stop_line
+        self.lane_length_arr = road_network.link_length
+        self.lane_links = np.arange(num_lanes)
+        self.lane_next, self.up_ptr, self.up_lane = lane_transfer_tables(road_network, self.lane_links)
+        self.has_transfers = len(self.up_lane) > 0
+        self.turn_seeds = np.array([turn_seed_for(seed) for seed in self.seeds], dtype=np.uint64)
+        self.routing = routing
+        self.route_turns, self.reach_ptr, self.reach_dest = route_tables(routing, self.lane_links)
+
+        self.time: float = 0.0
+        self.steps_executed: int = 0
+        self.next_vehicle_ids = np.zeros(num_replicas, dtype=np.int64)
+
+        # Per-replica, per-lane ring buffers, capacity as in WorldState
+        if lane_capacity is not None and lane_capacity < 1:
+            raise ValueError("lane_capacity must be at least 1")
+        capacity = max_vehicles if lane_capacity is None else min(lane_capacity, max_vehicles)
+        self.capacity = capacity
+        shape = (num_replicas, num_lanes, capacity)
+        self.heads = np.zeros((num_replicas, num_lanes), dtype=np.int64)
+        self.counts = np.zeros((num_replicas, num_lanes), dtype=np.int64)
+        self.num_vehicles = np.zeros(num_replicas, dtype=np.int64)
+
+        self.precision = precision
+        dtype = state_dtype(precision)
+        self.positions = np.zeros(shape, dtype=dtype)
+        self.speeds = np.zeros(shape, dtype=dtype)
+        self.stops = np.zeros(shape, dtype=np.int32)
+        self.spawn_times = np.zeros(shape, dtype=np.float64)
+        self.turns = np.zeros(shape, dtype=np.int8)
+        self.vehicle_ids = np.zeros(shape, dtype=np.int64)
+        self.destinations = np.full(shape, -1, dtype=np.int32)
+        self._transfer_ok = np.zeros(
+            (num_replicas, num_lanes, capacity if self.has_transfers else 0), dtype=np.bool_
+        )
+
+        # Per-replica, per-lane log of finished vehicles filled by the kernel
+        self._finished_tt = np.zeros(shape, dtype=np.float64)
+        self._finished_stops = np.zeros(shape, dtype=np.int32)
+        self._finished_counts = np.zeros((num_replicas, num_lanes), dtype=np.int64)
+        self._spawned_out = np.zeros(num_replicas, dtype=np.int64)
+        self._log_entries_per_step = log_entries_per_step(capacity, safe_gap, self.has_transfers)
+        self._finished_out = np.zeros(num_replicas, dtype=np.int64)
+
+        self.metrics_raw: List[SimulationMetricsRaw] = [
+            SimulationMetricsRaw() for _ in range(num_replicas)
+        ]
+
+        self.spawn_uniforms: List[SpawnUniformStream] = [
+            SpawnUniformStream(seed, num_lanes) for seed in self.seeds
+        ]
+
+    # ------------------------ PUBLIC API ------------------------
+
+    def run_steps(
+        self,
+        n_steps: int,
+        dt: float,
+        sync_interval: int | None = None,
+        on_sync: Callable[[EnsembleWorldState], None] | None = None,
+    ) -> None:
+        """
+        Advance every replica by n_steps steps.
+
+        Same contract as WorldState.run_steps: the per-replica metrics and
+        counters are up to date, and on_sync(self) is called, every
+        sync_interval steps (or once at the end). Internally the kernel is
+        called on blocks of at most ENSEMBLE_MAX_BLOCK_STEPS steps.
+        """
+        sync_block = n_steps if not sync_interval else sync_interval
+        done = 0
+        while done < n_steps:
+            k = min(sync_block, n_steps - done)
+            done_in_sync = 0
+            while done_in_sync < k:
+                b = block_steps_for(
+                    self.num_replicas * len(self.directions_order) * self._log_entries_per_step,
+                    min(ENSEMBLE_MAX_BLOCK_STEPS, k - done_in_sync),
+                )
+                self._run_block(b, dt)
+                done_in_sync += b
+            done += k
+            if on_sync is not None:
+                on_sync(self)
+
+    def warmup(self, dt: float) -> float:
+        """
+        Compile run_ensemble_kernel for this ensemble's precision on a
+        throwaway one-replica ensemble and return the time it took in
+        seconds. The ensemble itself is left untouched.
+        """
+        with Timer() as t:
+            EnsembleWorldState(
+                road_network=self.road_network,
+                lights=self.lights,
+                spawn_rate=self.spawn_rate,
+                max_vehicles=1,
+                seeds=self.seeds[:1],
+                max_speed=self.max_speed,
+                safe_gap=self.safe_gap,
+                precision=self.precision,
+                lane_capacity=self.capacity,
+                routing=self.routing,
+            ).run_steps(1, dt)
+        return t.elapsed
+
+    def get_metrics_summary(
+        self, replica: int, total_sim_time: float
+    ) -> Tuple[int, float, float, float]:
+        """Return the aggregated simulation metrics of one replica."""
+        return self.metrics_raw[replica].compute_summary(total_sim_time)
+
+    def get_debug_stats(self, replica: int) -> Dict[str, int]:
+        """
+        Debug stats of one replica, same keys as WorldState.get_debug_stats.
+        Every replica runs every step: arrivals are Bernoulli trials, so no
+        step is skipped as idle.
+        """
+        return {
+            "total_spawned": self.metrics_raw[replica].total_spawned,
+            "vehicles_in_world_end": int(self.num_vehicles[replica]),
+            "steps_executed": self.steps_executed,
+            "steps_skipped": 0,
+            **self.metrics_raw[replica].distribution_stats(),
+        }
+
+    # ------------------------ INTERNAL LOGIC ------------------------
+
+    def _draw_spawn_uniforms(self, dt: float, n_steps: int) -> np.ndarray:
+        """
+        Spawn uniforms of n_steps steps, shape (n_steps, num_replicas, num_lanes, 2).
+        Every replica draws from its own stream in the WorldState order.
+        """
+        num_lanes = len(self.directions_order)
+        draws = np.empty((n_steps, self.num_replicas, num_lanes, 2), dtype=np.float64)
+        for r, stream in enumerate(self.spawn_uniforms):
+            draws[:, r] = stream.take(self.time, dt, n_steps)
+        return draws
+
+    def _run_block(self, n_steps: int, dt: float) -> None:
+        """Run n_steps steps in run_ensemble_kernel and sync the per-replica metrics."""
+        num_lanes = len(self.directions_order)
+        is_green_steps = self.lights.get_states(
+            step_times(self.time, dt, n_steps), self.lane_directions
+        )
+
+        # A lane can finish at most its current vehicles plus a few per step
+        log_size = int(self.counts.max()) + n_steps * self._log_entries_per_step
+        if self._finished_tt.shape[2] < log_size:
+            shape = (self.num_replicas, num_lanes, log_size)
+            self._finished_tt = np.zeros(shape, dtype=np.float64)
+            self._finished_stops = np.zeros(shape, dtype=np.int32)
+
+        run_ensemble_kernel = get_kernel("run_ensemble_kernel")
+        self.time = run_ensemble_kernel(
+            n_steps,
+            self.positions,
+            self.speeds,
+            self.stops,
+            self.spawn_times,
+            self.turns,
+            self.vehicle_ids,
+            self.destinations,
+            self.heads,
+            self.counts,
+            self._draw_spawn_uniforms(dt, n_steps),
+            self.spawn_rate * dt,
+            self.num_vehicles,
+            self.max_vehicles,
+            self.next_vehicle_ids,
+            self.time,
+            is_green_steps,
+            self.stop_line_arr,
+            self.lane_length_arr,
+            self.safe_gap,
+            dt,
+            self.max_speed,
+            self._finished_tt,
+            self._finished_stops,
+            self._finished_counts,
+            self._spawned_out,
+            self._finished_out,
+            self.lane_next,
+            self.lane_links,
+            self.up_ptr,
+            self.up_lane,
+            self._transfer_ok,
+            self.turn_seeds,
+            self.route_turns,
+            self.reach_ptr,
+            self.reach_dest,
+        )
+        self.steps_executed += n_steps
+
+        for r, metrics in enumerate(self.metrics_raw):
+            spawned = int(self._spawned_out[r])
+            if spawned > 0:
+                metrics.record_spawned(spawned)
+            if self._finished_out[r] == 0:
+                continue
+            for lane_idx in range(num_lanes):
+                k = self._finished_counts[r, lane_idx]
+                if k == 0:
+                    continue
+                metrics.record_finished_many(
+                    self._finished_tt[r, lane_idx, :k],
+                    self._finished_stops[r, lane_idx, :k],
+                )
+        self._finished_counts[:] = 0
@@ -0,0 +1,32 @@
+"""
+Lazy registry of the compiled kernels.
+
+Importing Numba, and numba.cuda even more, is a large part of the start-up
+time of a short run, and the sequential and numpy backends need neither.
+Kernels are therefore looked up by name here and their module (and Numba
+with it) is imported the first time one of them is requested.
+"""
+from importlib import import_module
+from typing import Any, Dict
+
+# kernel name -> module in traffic_sim.model that defines it
+KERNEL_MODULES: Dict[str, str] = {
+    "run_lanes_kernel": "cpu_kernels",
+    "run_ensemble_kernel": "cpu_kernels",
+    "next_hop_kernel": "cpu_kernels",
+    "update_lanes_kernel_cuda": "cuda_kernels",
+    "finished_lanes_kernel_cuda": "cuda_kernels",
+    "move_vehicles_kernel_cuda": "cuda_kernels",
+    "run_lanes_kernel_cuda": "cuda_kernels",
+}
+
+
+def get_kernel(name: str) -> Any:
+    """Return the compiled kernel called name, importing its module if needed."""
+    try:
+        module_name = KERNEL_MODULES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown kernel '{name}'. Available: {', '.join(KERNEL_MODULES.keys())}"
+        ) from None
+    return getattr(import_module(f"{__package__}.{module_name}"), name)
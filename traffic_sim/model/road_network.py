@@ -1,7 +1,10 @@
+import hashlib
 from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, Iterable, Tuple
 
-from .vehicles import Direction
+import numpy as np
+
+from .vehicles import Direction, TURN_CHOICES
 
 
 @dataclass(frozen=True)
@@ -12,10 +15,50 @@ class LaneGeometry:
     intersection_end: float      # intersection end position [m]
 
 
+# Grid step (row, col) of a vehicle heading in each direction; rows grow
+# southwards, columns eastwards
+_HEADING_STEP: Dict[Direction, Tuple[int, int]] = {
+    Direction.NORTH: (-1, 0),
+    Direction.EAST: (0, 1),
+    Direction.SOUTH: (1, 0),
+    Direction.WEST: (0, -1),
+}
+
+# Heading change of each turn (index in TURN_CHOICES), in clockwise
+# quarter turns (Direction is in clockwise order)
+_TURN_QUARTERS = {"straight": 0, "left": 3, "right": 1}
+
+# The arrays that define a network (see RoadNetwork)
+LINK_ARRAYS = (
+    "link_length", "link_stop_line", "link_signal", "link_direction",
+    "downstream_ptr", "downstream_link", "downstream_turn",
+)
+
+
 class RoadNetwork:
     """
-    Simple 1D road network:
-    one lane per direction, vehicles travel from position=0 to position=length.
+    Grid road network of rows x cols signalised intersections, spaced
+    lane_length apart, with one lane per direction through each of them.
+    The default 1 x 1 grid is the single intersection: vehicles travel from
+    position=0 to position=length in each of the four directions.
+
+    A link is the lane that crosses one intersection in one direction: it
+    starts half-way from the previous intersection and ends half-way to the
+    next one, with the stop line and the intersection in its middle. The
+    network is stored as flat arrays indexed by link id
+    (intersection * 4 + direction):
+    - link_length, link_stop_line: geometry [m]
+    - link_signal: the intersection (signal) that controls the link
+    - link_direction: Direction code of travel on the link
+    and the downstream adjacency in CSR form: the links a vehicle can enter
+    at the end of link l are downstream_link[downstream_ptr[l]:downstream_ptr[l + 1]],
+    reached with the turn (index in TURN_CHOICES) in downstream_turn. A turn
+    that would leave the grid has no entry: the vehicle leaves the network.
+
+    Networks that are not grids (e.g. loaded from a file, see
+    traffic_sim.io.network_loader) are built from these arrays with
+    from_links; the grid-only attributes (lane_length, rows, cols, lanes)
+    are then None or empty.
     """
 
     def __init__(
@@ -23,8 +66,14 @@ class RoadNetwork:
         lane_length: float = 100.0,
         stop_line_from_center: float = 5.0,
         intersection_width: float = 10.0,
+        rows: int = 1,
+        cols: int = 1,
     ) -> None:
+        if rows < 1 or cols < 1:
+            raise ValueError("grid must have at least one row and one column")
         self.lane_length = lane_length
+        self.rows = rows
+        self.cols = cols
 
         center = lane_length / 2.0
         stop_line_pos = center - stop_line_from_center
@@ -43,6 +92,125 @@ class RoadNetwork:
             d: geom for d in Direction
         }
 
+        num_directions = len(Direction)
+        num_links = rows * cols * num_directions
+        self.link_length = np.full(num_links, geom.length, dtype=np.float64)
+        self.link_stop_line = np.full(num_links, geom.stop_line_pos, dtype=np.float64)
+        self.link_signal = np.repeat(np.arange(rows * cols, dtype=np.int64), num_directions)
+        self.link_direction = np.tile(np.arange(num_directions, dtype=np.int8), rows * cols)
+        self.downstream_ptr, self.downstream_link, self.downstream_turn = self._grid_downstream()
+
+    @classmethod
+    def from_links(
+        cls,
+        link_length: np.ndarray,
+        link_stop_line: np.ndarray,
+        link_signal: np.ndarray,
+        link_direction: np.ndarray,
+        downstream_ptr: np.ndarray,
+        downstream_link: np.ndarray,
+        downstream_turn: np.ndarray,
+        check: bool = True,
+    ) -> "RoadNetwork":
+        """
+        Network with the given link arrays and CSR downstream adjacency
+        (see the class docstring), checked for consistency unless check
+        is False (arrays that were checked before, e.g. from a cache).
+        """
+        net = cls.__new__(cls)
+        net.lane_length = None
+        net.rows = None
+        net.cols = None
+        net.lanes = {}
+
+        net.link_length = np.ascontiguousarray(link_length, dtype=np.float64)
+        net.link_stop_line = np.ascontiguousarray(link_stop_line, dtype=np.float64)
+        net.link_signal = np.ascontiguousarray(link_signal, dtype=np.int64)
+        net.link_direction = np.ascontiguousarray(link_direction, dtype=np.int8)
+        net.downstream_ptr = np.ascontiguousarray(downstream_ptr, dtype=np.int64)
+        net.downstream_link = np.ascontiguousarray(downstream_link, dtype=np.int64)
+        net.downstream_turn = np.ascontiguousarray(downstream_turn, dtype=np.int8)
+
+        if check:
+            net._check_links()
+        return net
+
+    def _check_links(self) -> None:
+        """Raise ValueError if the link arrays are inconsistent."""
+        num_links = self.num_links
+        if not (len(self.link_stop_line) == len(self.link_signal) == len(self.link_direction) == num_links):
+            raise ValueError("link arrays must all have one entry per link")
+        if np.any(self.link_length <= 0.0) or np.any(self.link_stop_line < 0.0) \
+                or np.any(self.link_stop_line >= self.link_length):
+            raise ValueError("every link needs a positive length and a stop line on it")
+        if np.any(self.link_signal < 0) or np.any(self.link_direction < 0) \
+                or np.any(self.link_direction >= len(Direction)):
+            raise ValueError("invalid link signal or direction")
+        ptr = self.downstream_ptr
+        if len(ptr) != num_links + 1 or ptr[0] != 0 or np.any(np.diff(ptr) < 0) \
+                or ptr[-1] != len(self.downstream_link) or len(self.downstream_turn) != ptr[-1]:
+            raise ValueError("downstream_ptr does not match downstream_link/downstream_turn")
+        if np.any(self.downstream_link < 0) or np.any(self.downstream_link >= num_links) \
+                or np.any(self.downstream_turn < 0) or np.any(self.downstream_turn >= len(TURN_CHOICES)):
+            raise ValueError("invalid downstream link or turn")
+        # At most one downstream link per (link, turn)
+        from_link = np.repeat(np.arange(num_links), np.diff(ptr))
+        keys = from_link * len(TURN_CHOICES) + self.downstream_turn
+        if len(np.unique(keys)) != len(keys):
+            raise ValueError("a link has two downstream links for the same turn")
+
+    @property
+    def num_links(self) -> int:
+        return len(self.link_length)
+
+    @property
+    def num_intersections(self) -> int:
+        return int(self.link_signal.max()) + 1 if self.num_links > 0 else 0
+
     def get_lane(self, direction: Direction) -> LaneGeometry:
         """Return lane geometry for the given direction."""
         return self.lanes[direction]
+
+    def links_for_directions(self, directions: Iterable[Direction]) -> np.ndarray:
+        """Ids of the links travelled in one of directions, in link order."""
+        codes = np.array([int(d) for d in directions], dtype=np.int8)
+        return np.flatnonzero(np.isin(self.link_direction, codes))
+
+    def content_hash(self) -> str:
+        """
+        SHA-256 (hex) of the link arrays and the adjacency. Networks with
+        the same hash simulate the same way, so it keys on-disk caches of
+        data derived from the network (see routing.build_routing_table).
+        """
+        h = hashlib.sha256()
+        for name in LINK_ARRAYS:
+            arr = getattr(self, name)
+            h.update(f"{arr.dtype.str}{arr.shape}".encode())
+            h.update(np.ascontiguousarray(arr).tobytes())
+        return h.hexdigest()
+
+    def _grid_downstream(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        CSR downstream adjacency of the grid. A vehicle on link
+        (intersection, heading) turns inside the intersection and continues
+        on the link of the neighbouring intersection in its new heading.
+        """
+        num_directions = len(Direction)
+        row, col = np.divmod(self.link_signal, self.cols)
+        heading = self.link_direction.astype(np.int64)
+        step = np.array([_HEADING_STEP[d] for d in Direction], dtype=np.int64)
+
+        # (link, turn) -> downstream link, -1 where the turn leaves the grid
+        next_link = np.full((self.num_links, len(TURN_CHOICES)), -1, dtype=np.int64)
+        for turn_code, turn in enumerate(TURN_CHOICES):
+            new_heading = (heading + _TURN_QUARTERS[turn]) % num_directions
+            r = row + step[new_heading, 0]
+            c = col + step[new_heading, 1]
+            inside = (r >= 0) & (r < self.rows) & (c >= 0) & (c < self.cols)
+            next_link[inside, turn_code] = (r * self.cols + c)[inside] * num_directions + new_heading[inside]
+
+        valid = next_link >= 0
+        ptr = np.zeros(self.num_links + 1, dtype=np.int64)
+        np.cumsum(valid.sum(axis=1), out=ptr[1:])
+        turns = np.nonzero(valid)[1].astype(np.int8)
+        return ptr, next_link[valid], turns
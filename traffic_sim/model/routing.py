@@ -0,0 +1,155 @@
+"""
+Next-hop routing of origin-destination trips.
+
+A routed vehicle only carries a destination id. The turn it takes at the
+end of every link is looked up in a dense (num_destinations, num_links)
+int8 table, so memory does not grow with the number or the length of the
+routes. The table is built once per network, one destination per thread
+(next_hop_kernel), and cached on disk under the network's content hash,
+so later runs and sweep workers only load it. Backends that do not load
+Numba build it with the same Dijkstra in plain Python (next_hops), which
+gives the same table.
+"""
+from __future__ import annotations
+
+import heapq
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+from .disk_cache import cache_path, load_arrays, save_arrays
+from .kernels import get_kernel
+from .road_network import RoadNetwork
+from .vehicles import TURN_CHOICES
+
+# Part of the cache file name; bump it when the table layout or the
+# routing rules change so that old files are not picked up
+ROUTING_CACHE_VERSION = 1
+
+
+@dataclass(frozen=True)
+class RoutingTable:
+    """
+    Shortest routes (by length) to every destination of a network.
+
+    - destinations: link id of every destination, the links a vehicle can
+      leave the network from; a destination id is an index in it
+    - next_turn: int8 (num_destinations, num_links), the turn code (index in
+      TURN_CHOICES) to take at the end of each link towards each
+      destination; on the destination itself the turn that leaves the
+      network, and -1 where the destination cannot be reached
+    """
+    destinations: np.ndarray
+    next_turn: np.ndarray
+
+    @property
+    def num_destinations(self) -> int:
+        return len(self.destinations)
+
+    def reachable(self, links: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Destinations reachable from each of links, in CSR form:
+        dests[ptr[i]:ptr[i + 1]] for links[i], in destination order.
+        """
+        starts, dests = np.nonzero(self.next_turn[:, links].T >= 0)
+        ptr = np.zeros(len(links) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(starts, minlength=len(links)), out=ptr[1:])
+        return ptr, dests.astype(np.int64)
+
+
+def exit_links(road_network: RoadNetwork) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Links with a turn that leaves the network, and for each the first such
+    turn code (in TURN_CHOICES order).
+    """
+    has_next = np.zeros((road_network.num_links, len(TURN_CHOICES)), dtype=np.bool_)
+    from_link = np.repeat(np.arange(road_network.num_links), np.diff(road_network.downstream_ptr))
+    has_next[from_link, road_network.downstream_turn] = True
+    links = np.flatnonzero(~has_next.all(axis=1))
+    return links, np.argmin(has_next[links], axis=1).astype(np.int8)
+
+
+def upstream_links(road_network: RoadNetwork) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The links feeding every link, in link order, and the turn they take
+    into it, in CSR form (link[ptr[l]:ptr[l + 1]], turn[ptr[l]:ptr[l + 1]]).
+    """
+    from_link = np.repeat(np.arange(road_network.num_links), np.diff(road_network.downstream_ptr))
+    order = np.lexsort((from_link, road_network.downstream_link))
+    ptr = np.zeros(road_network.num_links + 1, dtype=np.int64)
+    np.cumsum(np.bincount(road_network.downstream_link, minlength=road_network.num_links), out=ptr[1:])
+    return ptr, from_link[order], road_network.downstream_turn[order]
+
+
+def next_hops(
+    dest: int,
+    exit_turn: int,
+    link_length: np.ndarray,
+    up_ptr: np.ndarray,
+    up_link: np.ndarray,
+    up_turn: np.ndarray,
+    next_turn: np.ndarray,
+) -> None:
+    """
+    Fill next_turn[link] with the turn to take at the end of link towards
+    dest: the Dijkstra of next_hop_kernel for one destination, in plain
+    Python, with the same order of operations and so the same ties.
+    """
+    dist = np.full(len(link_length), np.inf)
+    dist[dest] = 0.0
+    next_turn[dest] = exit_turn
+
+    heap = [(0.0, int(dest))]
+    while heap:
+        d, link = heapq.heappop(heap)
+        if d > dist[link]:
+            continue
+        through = d + float(link_length[link])
+        for j in range(up_ptr[link], up_ptr[link + 1]):
+            up = int(up_link[j])
+            if through < dist[up]:
+                dist[up] = through
+                next_turn[up] = up_turn[j]
+                heapq.heappush(heap, (through, up))
+
+
+def compute_routing_table(road_network: RoadNetwork, compiled: bool = True) -> RoutingTable:
+    """
+    Build the routing table of road_network (no cache), with next_hop_kernel
+    or, if compiled is False, with next_hops one destination at a time.
+    """
+    destinations, exit_turns = exit_links(road_network)
+    up_ptr, up_link, up_turn = upstream_links(road_network)
+    next_turn = np.full((len(destinations), road_network.num_links), -1, dtype=np.int8)
+    if compiled:
+        next_hop_kernel = get_kernel("next_hop_kernel")
+        next_hop_kernel(
+            destinations, exit_turns, road_network.link_length, up_ptr, up_link, up_turn, next_turn,
+        )
+    else:
+        for i, dest in enumerate(destinations):
+            next_hops(dest, exit_turns[i], road_network.link_length, up_ptr, up_link, up_turn, next_turn[i])
+    return RoutingTable(destinations=destinations, next_turn=next_turn)
+
+
+def build_routing_table(
+    road_network: RoadNetwork,
+    cache_dir: str | None = None,
+    compiled: bool = True,
+) -> RoutingTable:
+    """
+    Routing table of road_network, loaded from cache_dir (see
+    disk_cache.cache_path) when it holds the table of a network with the
+    same content hash, otherwise computed and saved there. compiled=False
+    computes it without Numba (see compute_routing_table), for the
+    backends that never load it.
+    """
+    path = cache_path(cache_dir, "routes", ROUTING_CACHE_VERSION, road_network.content_hash())
+    data = load_arrays(path)
+    if data is not None and {"destinations", "next_turn"} <= data.keys():
+        return RoutingTable(destinations=data["destinations"], next_turn=data["next_turn"])
+
+    table = compute_routing_table(road_network, compiled)
+    save_arrays(path, {"destinations": table.destinations, "next_turn": table.next_turn})
+    return table
@@ -1,5 +1,8 @@
+from bisect import bisect_right
 from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, Sequence
+
+import numpy as np
 
 from .vehicles import Direction
 
@@ -28,34 +31,55 @@ class TrafficLightsController:
             self.config.all_red
         )
 
+        # Phase table: phase k lasts until phase_ends[k] (time within the
+        # cycle) and phase_green[k, d] tells whether direction d is green.
+        # The ends are accumulated in the same order get_state always used,
+        # so the phase boundaries fall on exactly the same times.
+        ns_end = self.config.green_ns
+        red1_end = ns_end + self.config.all_red
+        ew_end = red1_end + self.config.green_ew
+        self.phase_ends = np.array([ns_end, red1_end, ew_end], dtype=np.float64)
+
+        self.phase_green = np.zeros((4, len(Direction)), dtype=np.bool_)
+        self.phase_green[0, [Direction.NORTH, Direction.SOUTH]] = True  # phase 1: NS green
+        self.phase_green[2, [Direction.EAST, Direction.WEST]] = True    # phase 2: EW green
+        # phases 1 and 3 are all-red
+
     def get_state(self, t: float) -> Dict[Direction, bool]:
         """
         :param t: simulation time [s]
         :return: dict Direction -> True (green) / False (red)
         """
-        phase = t % self.cycle_duration
-
-        green_ns = False
-        green_ew = False
-
-        if phase < self.config.green_ns:
-            # phase 1: NS green
-            green_ns = True
-        elif phase < self.config.green_ns + self.config.all_red:
-            # all-red
-            green_ns = False
-            green_ew = False
-        elif phase < self.config.green_ns + self.config.all_red + self.config.green_ew:
-            # phase 2: EW green
-            green_ew = True
-        else:
-            # all-red
-            green_ns = False
-            green_ew = False
-
-        return {
-            Direction.NORTH: green_ns,
-            Direction.SOUTH: green_ns,
-            Direction.EAST: green_ew,
-            Direction.WEST: green_ew,
-        }
+        phase = bisect_right(self.phase_ends.tolist(), t % self.cycle_duration)
+        green = self.phase_green[phase].tolist()
+        return {d: green[d] for d in Direction}
+
+    def time_to_next_change(self, t: float) -> float:
+        """
+        :param t: simulation time [s]
+        :return: time [s] from t until the next phase boundary
+        """
+        phase_time = t % self.cycle_duration
+        phase = bisect_right(self.phase_ends.tolist(), phase_time)
+        if phase < len(self.phase_ends):
+            return float(self.phase_ends[phase]) - phase_time
+        return self.cycle_duration - phase_time
+
+    def get_states(
+        self, times: np.ndarray, directions: Sequence[Direction] | None = None
+    ) -> np.ndarray:
+        """
+        Vectorized get_state for a block of steps.
+
+        :param times: simulation times [s], shape (steps,)
+        :param directions: lane_idx -> Direction (all directions by default);
+            a Direction code array also works, e.g. for thousands of links
+        :return: bool array (steps, lanes), True where the lane is green
+        """
+        if directions is None:
+            directions = list(Direction)
+        phase = np.searchsorted(
+            self.phase_ends, np.remainder(times, self.cycle_duration), side="right"
+        )
+        # pick the lanes first: indexing rows last keeps the result C-contiguous
+        return self.phase_green[:, np.asarray(directions, dtype=np.intp)][phase]
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from enum import IntEnum
-from typing import Literal
+from typing import Literal, Tuple
 
 
 class Direction(IntEnum):
@@ -12,21 +12,40 @@ class Direction(IntEnum):
 
 TurnChoice = Literal["straight", "left", "right"]
 
+# index in this tuple is the turn code stored in WorldState arrays
+TURN_CHOICES: Tuple[TurnChoice, ...] = ("straight", "left", "right")
 
-@dataclass
+
+@dataclass(slots=True)
 class Vehicle:
+    """
+    One vehicle as seen by user code. The simulation itself keeps vehicles
+    as columns in WorldState and only builds these on request, so the
+    object stays small: __slots__ instead of a __dict__, and direction and
+    turn as the same small integer codes the arrays use (int8 there).
+    """
     id: int
-    direction: Direction
-    turn_choice: TurnChoice      # turning decision
+    direction_code: int          # Direction value
+    turn_code: int               # index in TURN_CHOICES
     position: float              # [m] from the start of the lane
     speed: float                 # [m/s]
     max_speed: float             # [m/s]
     spawn_time: float            # time when the vehicle entered the world
 
     stops_count: int = 0         # how many times the vehicle had to stop
+    destination: int = -1        # routing destination id, -1: random turns
     finished: bool = False
     finish_time: float | None = None
 
+    @property
+    def direction(self) -> Direction:
+        return Direction(self.direction_code)
+
+    @property
+    def turn_choice(self) -> TurnChoice:
+        """Turning decision."""
+        return TURN_CHOICES[self.turn_code]
+
     def mark_finished(self, t: float) -> None:
         self.finished = True
         self.finish_time = t
@@ -1,36 +1,57 @@
 from __future__ import annotations
 
-import random
 from dataclasses import dataclass, field
-from typing import Dict, List, Tuple, Iterable
+from typing import Callable, Dict, List, Literal, Tuple, Iterable
 
 import numpy as np
-from numba import njit, prange, cuda
+
+from ..metrics.collectors import QuantileSketch, StreamingStats
+from ..metrics.timers import Timer
 
 from .road_network import RoadNetwork
+from .routing import RoutingTable
+from .kernels import get_kernel
 from .traffic_lights import TrafficLightsController
-from .vehicles import Vehicle, Direction, TurnChoice
+from .vehicles import Vehicle, Direction, TURN_CHOICES
 
 
 @dataclass
 class SimulationMetricsRaw:
-    finished_travel_times: List[float] = field(default_factory=list)
-    finished_stops: List[int] = field(default_factory=list)
-    finished_count: int = 0
+    """
+    Running aggregates of the finished vehicles, constant in memory however
+    many vehicles finish: moments in StreamingStats and quantiles in
+    QuantileSketch. Aggregates of several worlds (MPI ranks, ensemble
+    replicas) combine with merge.
+    """
+    travel_times: StreamingStats = field(default_factory=StreamingStats)
+    stops: StreamingStats = field(default_factory=StreamingStats)
+    travel_time_quantiles: QuantileSketch = field(default_factory=QuantileSketch)
+    stops_quantiles: QuantileSketch = field(default_factory=QuantileSketch)
 
     total_spawned: int = 0  # number of vehicles spawned in total
 
+    @property
+    def finished_count(self) -> int:
+        return self.travel_times.count
+
     def record_spawned(self, n: int = 1) -> None:
         """Increment the count of spawned vehicles."""
         self.total_spawned += n
 
-    def record_finished(self, v: Vehicle) -> None:
-        """Store metrics for a vehicle that finished its trip."""
-        if v.finish_time is None:
-            return
-        self.finished_count += 1
-        self.finished_travel_times.append(v.finish_time - v.spawn_time)
-        self.finished_stops.append(v.stops_count)
+    def record_finished_many(self, travel_times: np.ndarray, stops: np.ndarray) -> None:
+        """Add a batch of vehicles that finished their trip to the aggregates."""
+        self.travel_times.add_many(travel_times)
+        self.stops.add_many(stops)
+        self.travel_time_quantiles.add_many(travel_times)
+        self.stops_quantiles.add_many(stops)
+
+    def merge(self, other: SimulationMetricsRaw) -> None:
+        """Fold the metrics of another world into these."""
+        self.travel_times.merge(other.travel_times)
+        self.stops.merge(other.stops)
+        self.travel_time_quantiles.merge(other.travel_time_quantiles)
+        self.stops_quantiles.merge(other.stops_quantiles)
+        self.total_spawned += other.total_spawned
 
     def compute_summary(self, total_sim_time: float) -> Tuple[int, float, float, float]:
         """
@@ -43,150 +64,449 @@ class SimulationMetricsRaw:
         if self.finished_count == 0:
             return 0, 0.0, 0.0, 0.0
 
-        avg_travel = sum(self.finished_travel_times) / self.finished_count
-        avg_stops = sum(self.finished_stops) / self.finished_count
+        avg_travel = self.travel_times.mean
+        avg_stops = self.stops.mean
         throughput_per_min = self.finished_count / (total_sim_time / 60.0)
 
         return self.finished_count, avg_travel, avg_stops, throughput_per_min
 
+    def distribution_stats(self) -> Dict[str, float]:
+        """Spread and quantiles of travel times and stops, for extra_stats."""
+        return {
+            **self.travel_times.to_dict("travel_time"),
+            **self.travel_time_quantiles.to_dict("travel_time"),
+            **self.stops.to_dict("stops"),
+            **self.stops_quantiles.to_dict("stops"),
+        }
 
-@njit(parallel=True)
-def update_lanes_kernel(
-    positions: np.ndarray,
-    speeds: np.ndarray,
-    stops: np.ndarray,
-    counts: np.ndarray,
-    is_green_arr: np.ndarray,
-    stop_line_arr: np.ndarray,
-    lane_length_arr: np.ndarray,
-    safe_gap: float,
-    dt: float,
-    max_speed: float,
-) -> None:
+
+# Turn uniform -> turn code (index in TURN_CHOICES), as in _spawn_into_lanes
+SPAWN_TURN_EDGES = np.array([0.6, 0.8])
+SPAWN_TURN_CODES = np.array([0, 2, 1], dtype=np.int8)  # straight, right, left
+
+# splitmix64 constants of the hop turn hash (same as cpu_kernels._hop_turn)
+_MIX_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_MUL1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_MUL2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix64(z: np.ndarray) -> np.ndarray:
+    """splitmix64 output of every state in z (uint64, wrapping arithmetic)."""
+    z = z + _MIX_GAMMA
+    z = (z ^ (z >> np.uint64(30))) * _MIX_MUL1
+    z = (z ^ (z >> np.uint64(27))) * _MIX_MUL2
+    return z ^ (z >> np.uint64(31))
+
+
+def turn_seed_for(seed: int) -> np.uint64:
+    """Key of the hop turn hash of a world with this random seed."""
+    return np.uint64(seed % (1 << 64))
+
+
+def hop_turn_codes(turn_seed: np.uint64, vehicle_ids: np.ndarray, links: np.ndarray) -> np.ndarray:
+    """
+    Turn code of every vehicle entering a link from an upstream one, with
+    the spawn turn probabilities. The uniform is a hash of the seed, the
+    vehicle id and the link rather than a draw from a stream, so it does
+    not depend on the order in which a backend moves the vehicles.
     """
-    Numba-parallel kernel that updates all lanes.
+    z = _mix64(_mix64(turn_seed ^ vehicle_ids.astype(np.uint64)) ^ links.astype(np.uint64))
+    r = (z >> np.uint64(11)).astype(np.float64) * (1.0 / 9007199254740992.0)
+    return SPAWN_TURN_CODES[np.searchsorted(SPAWN_TURN_EDGES, r, side="right")]
 
-    positions, speeds, stops have shape (num_lanes, max_n_per_lane)
-    counts[lane_idx] says how many vehicles are valid in that lane.
+
+def lane_transfer_tables(
+    road_network: RoadNetwork, lane_links: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Transfer tables of a world whose lanes are the links lane_links:
+    - lane_next (num_lanes, len(TURN_CHOICES)): the lane a vehicle enters at
+      the end of each lane with each turn, -1 if it leaves the network (no
+      downstream link, or one that is not a lane of this world)
+    - up_ptr, up_lane: the lanes feeding every lane, in lane order, in CSR
+      form (up_lane[up_ptr[l]:up_ptr[l + 1]])
     """
-    num_lanes = counts.shape[0]
+    num_lanes = len(lane_links)
+    lane_of_link = np.full(road_network.num_links, -1, dtype=np.int64)
+    lane_of_link[lane_links] = np.arange(num_lanes)
 
-    for lane_idx in prange(num_lanes):
-        n = counts[lane_idx]
-        if n == 0:
-            continue
-
-        is_green = is_green_arr[lane_idx]
-        stop_line = stop_line_arr[lane_idx]
-        lane_length = lane_length_arr[lane_idx]
-
-        for i in range(n):
-            old_pos = positions[lane_idx, i]
-            old_speed = speeds[lane_idx, i]
-
-            desired_pos = old_pos + max_speed * dt
-            new_speed = max_speed
-
-            # Collision avoidance: keep safe gap to the vehicle in front
-            if i > 0:
-                front_pos = positions[lane_idx, i - 1]
-                max_pos = front_pos - safe_gap
-                if desired_pos > max_pos:
-                    desired_pos = max_pos
-                    if desired_pos <= old_pos + 1e-3:
-                        new_speed = 0.0
-
-            # Respect red light: stop before stop line
-            if not is_green:
-                if old_pos < stop_line and desired_pos >= stop_line:
-                    desired_pos = stop_line - 0.5
-                    if desired_pos <= old_pos + 1e-3:
-                        new_speed = 0.0
-
-            # Count stop events (speed > 0 -> 0)
-            if old_speed > 0.1 and new_speed <= 0.1:
-                stops[lane_idx, i] += 1
-
-            # Clamp position to reasonable bounds
-            if desired_pos < 0.0:
-                desired_pos = 0.0
-            if desired_pos > lane_length + 20.0:
-                desired_pos = lane_length + 20.0
-
-            positions[lane_idx, i] = desired_pos
-            speeds[lane_idx, i] = new_speed
-
-
-@cuda.jit
-def update_lanes_kernel_cuda(
-    old_positions,   # float64[:, :]
-    old_speeds,      # float64[:, :]
-    stops,           # int32[:, :]
-    counts,          # int32[:]
-    is_green_arr,    # bool_[:]
-    stop_line_arr,   # float64[:]
-    lane_length_arr, # float64[:]
-    safe_gap: float,
-    dt: float,
-    max_speed: float,
-):
+    from_link = np.repeat(np.arange(road_network.num_links), np.diff(road_network.downstream_ptr))
+    src = lane_of_link[from_link]
+    dst = lane_of_link[road_network.downstream_link]
+    valid = (src >= 0) & (dst >= 0)
+    src, dst = src[valid], dst[valid]
+
+    lane_next = np.full((num_lanes, len(TURN_CHOICES)), -1, dtype=np.int64)
+    lane_next[src, road_network.downstream_turn[valid]] = dst
+
+    pairs = np.unique(dst * num_lanes + src)
+    up_lane = pairs % num_lanes
+    up_ptr = np.zeros(num_lanes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pairs // num_lanes, minlength=num_lanes), out=up_ptr[1:])
+    return lane_next, up_ptr, up_lane
+
+
+def route_tables(
+    routing: RoutingTable | None, lane_links: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
-    CUDA kernel that updates all lanes in parallel.
+    Routing arrays of a world whose lanes are the links lane_links:
+    route_turns (the table's next_turn, by link) and the destinations
+    reachable from every lane in CSR form (reach_ptr, reach_dest). Without
+    routing, route_turns has no rows and no destination is reachable.
+    """
+    if routing is None:
+        return (
+            np.zeros((0, 0), dtype=np.int8),
+            np.zeros(len(lane_links) + 1, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+        )
+    reach_ptr, reach_dest = routing.reachable(lane_links)
+    return routing.next_turn, reach_ptr, reach_dest
+
 
-    Grid:
-        blockIdx.x -> lane index
-        threadIdx.x -> vehicle index in that lane
+def log_entries_per_step(capacity: int, safe_gap: float, transfers: bool) -> int:
     """
-    lane_idx = cuda.blockIdx.x
-    i = cuda.threadIdx.x
+    Most vehicles a lane adds to its finished log per step, on top of the
+    ones it holds: its one spawn without transfers; with them, everyone
+    that fits safe_gap apart between lane_length and the lane_length + 20
+    clamp (plus one for rounding), since refused vehicles wait there.
+    """
+    if not transfers:
+        return 1
+    if safe_gap <= 0.0:
+        return capacity
+    return min(capacity, int(20.0 // safe_gap) + 2)
+
+
+def _rank_in_groups(keys: np.ndarray) -> np.ndarray:
+    """Index of every element within its run of equal values in keys."""
+    n = len(keys)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+
+
+# Spawn uniforms are drawn from the Generator this many steps at a time,
+# fewer in networks with so many lanes that a block would exceed
+# SPAWN_BLOCK_LANE_STEPS lane-steps.
+SPAWN_BLOCK_STEPS = 10_000
+SPAWN_BLOCK_LANE_STEPS = 40_000
+
+# Longest block of steps handed to a compiled kernel, in lane-steps: bounds
+# the per-block spawn uniforms, light states and finished-vehicle logs of
+# networks with many lanes.
+MAX_BLOCK_LANE_STEPS = 1 << 20
+
+
+def block_steps_for(num_lanes: int, max_steps: int) -> int:
+    """Steps per block for num_lanes lanes: at most max_steps, at least 1."""
+    return max(1, min(max_steps, MAX_BLOCK_LANE_STEPS // max(num_lanes, 1)))
+
+
+class SpawnUniformStream:
+    """
+    Spawn uniforms of a world, pre-drawn from a numpy.random.Generator in
+    blocks of (block_steps, num_lanes, 2): the spawn trial and the turn
+    choice of every lane for every step. Blocks are always drawn whole, so
+    the values handed out only depend on the seed, never on how many steps
+    are taken at a time (nor on block_steps: the Generator fills blocks
+    from one continuous stream).
+    """
+
+    def __init__(self, seed: int, num_lanes: int, block_steps: int | None = None) -> None:
+        self.rng = np.random.default_rng(seed)
+        self.num_lanes = num_lanes
+        if block_steps is None:
+            block_steps = max(1, min(SPAWN_BLOCK_STEPS, SPAWN_BLOCK_LANE_STEPS // max(num_lanes, 1)))
+        self.block_steps = block_steps
+        self._block = np.empty((0, num_lanes, 2), dtype=np.float64)
+        self._cursor = 0
+
+    def take(self, time: float, dt: float, n_steps: int) -> np.ndarray:
+        """
+        Uniforms of the next n_steps steps, shape (n_steps, num_lanes, 2).
+        time and dt are not needed here; they keep the signature of
+        PoissonArrivalStream.take.
+        """
+        if self._cursor + n_steps <= self._block.shape[0]:
+            out = self._block[self._cursor:self._cursor + n_steps]
+            self._cursor += n_steps
+            return out
+
+        out = np.empty((n_steps, self.num_lanes, 2), dtype=np.float64)
+        filled = 0
+        while filled < n_steps:
+            if self._cursor == self._block.shape[0]:
+                self._block = self.rng.random((self.block_steps, self.num_lanes, 2))
+                self._cursor = 0
+            k = min(n_steps - filled, self._block.shape[0] - self._cursor)
+            out[filled:filled + k] = self._block[self._cursor:self._cursor + k]
+            self._cursor += k
+            filled += k
+        return out
+
 
-    num_lanes = counts.shape[0]
-    if lane_idx >= num_lanes:
-        return
+ArrivalProcess = Literal["bernoulli", "poisson"]
 
-    n = counts[lane_idx]
-    if i >= n:
-        return
+# Floating-point type of the vehicle positions and speeds. Times, travel
+# times and every sum stay in float64 whatever the state precision.
+Precision = Literal["float64", "float32"]
+STATE_DTYPES: Dict[str, type] = {"float64": np.float64, "float32": np.float32}
 
-    is_green = is_green_arr[lane_idx]
-    stop_line = stop_line_arr[lane_idx]
-    lane_length = lane_length_arr[lane_idx]
 
-    old_pos = old_positions[lane_idx, i]
-    old_speed = old_speeds[lane_idx, i]
+def state_dtype(precision: Precision) -> type:
+    """NumPy dtype of the vehicle state for a precision name."""
+    try:
+        return STATE_DTYPES[precision]
+    except KeyError:
+        raise ValueError(f"Unknown precision '{precision}'") from None
 
-    desired_pos = old_pos + max_speed * dt
-    new_speed = max_speed
 
-    # Collision avoidance: use old_positions to avoid data races
-    if i > 0:
-        front_pos = old_positions[lane_idx, i - 1]
-        max_pos = front_pos - safe_gap
-        if desired_pos > max_pos:
-            desired_pos = max_pos
-            if desired_pos <= old_pos + 1e-3:
-                new_speed = 0.0
+# Time differences below this are treated as zero by adaptive stepping.
+ADAPTIVE_TIME_EPS = 1e-9
+# Distance before the stop line at which the movement rules hold a vehicle
+# on red (desired_pos = stop_line - 0.5).
+RED_HOLD_DISTANCE = 0.5
 
-    # Respect red light: stop before stop line
+# Longest kernel block with Poisson arrivals. Blocks usually end early,
+# when the world empties, so long ones would mostly prepare unused steps.
+EVENT_BLOCK_STEPS = 1024
+
+# Draw values that make _spawn_into_lanes spawn / skip a lane for any spawn_prob
+_ARRIVAL = -1.0
+_NO_ARRIVAL = np.inf
+
+
+class PoissonArrivalStream:
+    """
+    Event-driven arrivals: every lane has its own Generator (spawned from
+    the seed) with exponential inter-arrival times of mean 1 / spawn_rate
+    and one turn uniform per arrival.
+
+    Arrivals are turned into spawn draws for a block of steps, in the
+    (n_steps, num_lanes, 2) layout of SpawnUniformStream, so every backend
+    spawns them with its usual code. A vehicle enters at the step whose
+    interval contains its arrival time; a lane takes at most one vehicle
+    per step, so arrivals closer than dt queue up for the next steps.
+    peek() and commit() let a caller run only part of a block.
+    """
+
+    def __init__(self, seed: int, num_lanes: int, spawn_rate: float, chunk: int = 1024) -> None:
+        self.rngs = [
+            np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(num_lanes)
+        ]
+        self.num_lanes = num_lanes
+        self.spawn_rate = spawn_rate
+        self.chunk = chunk
+        # Per lane: arrival times and turn uniforms drawn so far, and how
+        # many of them have been spawned (or dropped at the max_vehicles cap)
+        self._times = [np.empty(0, dtype=np.float64) for _ in range(num_lanes)]
+        self._turns = [np.empty(0, dtype=np.float64) for _ in range(num_lanes)]
+        self._cursor = [0] * num_lanes
+        self._peeked: List[np.ndarray] = []
+
+    def take(self, time: float, dt: float, n_steps: int) -> np.ndarray:
+        """Spawn draws of the next n_steps steps starting at time."""
+        draws = self.peek(time, dt, n_steps)
+        self.commit(n_steps)
+        return draws
+
+    def peek(self, time: float, dt: float, n_steps: int) -> np.ndarray:
+        """Spawn draws of the next n_steps steps, without consuming them."""
+        bounds = step_times(time, dt, n_steps + 1)
+        draws = np.empty((n_steps, self.num_lanes, 2), dtype=np.float64)
+        draws[:, :, 0] = _NO_ARRIVAL
+        draws[:, :, 1] = 0.0
+        self._peeked = []
+
+        for lane_idx in range(self.num_lanes):
+            self._draw_until(lane_idx, bounds[-1])
+            cursor = self._cursor[lane_idx]
+            pending = self._times[lane_idx][cursor:]
+            pending = pending[:np.searchsorted(pending, bounds[-1], side="left")]
+
+            # Step of every arrival, then delay queued arrivals one step each
+            arrival_step = np.maximum(np.searchsorted(bounds, pending, side="right") - 1, 0)
+            queue = np.arange(len(pending))
+            spawn_step = np.maximum.accumulate(arrival_step - queue) + queue
+            spawn_step = spawn_step[spawn_step < n_steps]
+
+            k = len(spawn_step)
+            draws[spawn_step, lane_idx, 0] = _ARRIVAL
+            draws[spawn_step, lane_idx, 1] = self._turns[lane_idx][cursor:cursor + k]
+            self._peeked.append(spawn_step)
+
+        return draws
+
+    def commit(self, n_steps: int) -> None:
+        """Consume the arrivals spawned in the first n_steps steps of the last peek()."""
+        for lane_idx, spawn_step in enumerate(self._peeked):
+            self._cursor[lane_idx] += int(np.searchsorted(spawn_step, n_steps, side="left"))
+        self._peeked = []
+
+    def steps_until_next_arrival(self, time: float, dt: float, max_steps: int) -> int:
+        """
+        Number of steps from time (at most max_steps) before the step in
+        which the next pending arrival happens.
+        """
+        if self.spawn_rate <= 0.0:
+            return max_steps
+
+        next_arrival = self.next_arrival_time(time)
+
+        # Guess from the division, then count on the exact clock grid
+        guess = int(min(max((next_arrival - time) / dt, 0.0), max_steps))
+        bounds = step_times(time, dt, guess + 2)
+        steps = int(np.searchsorted(bounds, next_arrival, side="right")) - 1
+        return min(max(steps, 0), max_steps)
+
+    def next_arrival_time(self, time: float) -> float:
+        """Time of the earliest pending arrival (at or after time if none is queued)."""
+        next_arrival = np.inf
+        for lane_idx in range(self.num_lanes):
+            self._draw_until(lane_idx, time)
+            if self._cursor[lane_idx] < len(self._times[lane_idx]):
+                next_arrival = min(next_arrival, self._times[lane_idx][self._cursor[lane_idx]])
+        return float(next_arrival)
+
+    def _draw_until(self, lane_idx: int, t: float) -> None:
+        """Draw arrivals of one lane until a pending one lies at or after t."""
+        if self.spawn_rate <= 0.0:
+            return
+        times = self._times[lane_idx]
+        while len(times) == self._cursor[lane_idx] or times[-1] < t:
+            rng = self.rngs[lane_idx]
+            gaps = rng.exponential(1.0 / self.spawn_rate, self.chunk)
+            turns = rng.random(self.chunk)
+
+            # Arrival times by repeated addition, as one long chain
+            last = times[-1] if len(times) else 0.0
+            new_times = np.add.accumulate(np.concatenate(([last], gaps)))[1:]
+
+            cursor = self._cursor[lane_idx]
+            times = np.concatenate((times[cursor:], new_times))
+            self._turns[lane_idx] = np.concatenate((self._turns[lane_idx][cursor:], turns))
+            self._cursor[lane_idx] = 0
+            self._times[lane_idx] = times
+
+
+def step_times(time: float, dt: float, n_steps: int) -> np.ndarray:
+    """
+    Start times of n_steps steps from time, accumulated one dt at a time
+    exactly like the simulation clock (time = time + dt), so they match it
+    bit for bit.
+    """
+    increments = np.full(n_steps, dt, dtype=np.float64)
+    increments[:1] = time
+    return np.add.accumulate(increments)
+
+
+def leader_chain_prefix_min(first: np.ndarray, safe_gap: float) -> np.ndarray:
+    """
+    Solve P[0] = max(0, first[0]), P[i] = max(0, min(first[i], P[i-1] - safe_gap))
+    without a Python loop.
+
+    Unrolled, P[i] = min over j <= i of (first[j] - (i - j) * safe_gap), i.e. a
+    cumulative minimum of the gap-shifted values first[j] + j * safe_gap. The
+    shifted sums round differently than the repeated subtraction of the
+    sequential loop, so the scan result is then swept with the recurrence
+    itself until it is a fixed point, which makes it bit-identical. The scan
+    is already exact or off in the last bits, so this takes one or two sweeps.
+    """
+    n = first.shape[0]
+    offsets = np.arange(n) * safe_gap
+    chain = np.minimum.accumulate(first + offsets) - offsets
+    np.maximum(chain, 0.0, out=chain)
+
+    fixed = np.empty_like(chain)
+    while True:
+        fixed[0] = max(first[0], 0.0)
+        np.minimum(first[1:], chain[:-1] - safe_gap, out=fixed[1:])
+        np.maximum(fixed, 0.0, out=fixed)
+        if np.array_equal(fixed, chain):
+            return chain
+        chain, fixed = fixed, chain
+
+
+def update_lane_numpy(
+    old_pos: np.ndarray,
+    old_speed: np.ndarray,
+    stops: np.ndarray,
+    is_green: bool,
+    stop_line: float,
+    lane_length: float,
+    safe_gap: float,
+    dt: float,
+    max_speed: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Vectorized lane update with the same results as the sequential loop.
+    Inputs are ordered front to back; returns new (positions, speeds, stops).
+
+    Positions follow leader_chain_prefix_min on the free-flow targets
+    (clamped to lane_length + 20). A red light only ever acts on the first
+    vehicle behind the stop line: everyone behind it ends up at least
+    safe_gap further back, i.e. before the stop line. The chain is therefore
+    split at that vehicle, whose position is computed on its own.
+
+    Like the sequential loop, everything is computed in float64 and only
+    the results are rounded to the dtype of the inputs.
+    """
+    pos_dtype, speed_dtype = old_pos.dtype, old_speed.dtype
+    old_pos = old_pos.astype(np.float64)
+    old_speed = old_speed.astype(np.float64)
+    n = old_pos.shape[0]
+    desired = old_pos + max_speed * dt
+    target = np.minimum(desired, lane_length + 20.0)
+
+    red_idx = n
     if not is_green:
-        if old_pos < stop_line and desired_pos >= stop_line:
-            desired_pos = stop_line - 0.5
-            if desired_pos <= old_pos + 1e-3:
-                new_speed = 0.0
+        # positions are non-increasing, so this is the first index with old_pos < stop_line
+        red_idx = int(np.searchsorted(-old_pos, -stop_line, side="right"))
+
+    red_hit = False
+    if red_idx < n:
+        pos = np.empty(n, dtype=old_pos.dtype)
+        if red_idx > 0:
+            pos[:red_idx] = leader_chain_prefix_min(target[:red_idx], safe_gap)
+
+        d = desired[red_idx]
+        if red_idx > 0:
+            d = min(d, pos[red_idx - 1] - safe_gap)
+        red_hit = d >= stop_line
+        if red_hit:
+            d = stop_line - 0.5
+        d = min(max(d, 0.0), lane_length + 20.0)
+
+        rest = target[red_idx:].copy()
+        rest[0] = d
+        pos[red_idx:] = leader_chain_prefix_min(rest, safe_gap)
+    else:
+        pos = leader_chain_prefix_min(target, safe_gap)
+
+    # Speeds: stopped when held back by the leader or the stop line
+    new_speed = np.full(n, max_speed, dtype=old_speed.dtype)
+    if n > 1:
+        max_pos = pos[:-1] - safe_gap
+        held = (desired[1:] > max_pos) & (max_pos <= old_pos[1:] + 1e-3)
+        new_speed[1:][held] = 0.0
+    if red_hit and stop_line - 0.5 <= old_pos[red_idx] + 1e-3:
+        new_speed[red_idx] = 0.0
 
     # Count stop events (speed > 0 -> 0)
-    if old_speed > 0.1 and new_speed <= 0.1:
-        stops[lane_idx, i] += 1
+    new_stops = stops + ((old_speed > 0.1) & (new_speed <= 0.1))
+
+    return pos.astype(pos_dtype), new_speed.astype(speed_dtype), new_stops.astype(stops.dtype)
 
-    # Clamp position to reasonable bounds
-    if desired_pos < 0.0:
-        desired_pos = 0.0
-    if desired_pos > lane_length + 20.0:
-        desired_pos = lane_length + 20.0
 
-    # Write results back to old_positions / old_speeds arrays (they will be copied back)
-    old_positions[lane_idx, i] = desired_pos
-    old_speeds[lane_idx, i] = new_speed
+# Lanes with at least this many vehicles are split into chunks that are
+# updated by several threads (see run_lanes_kernel); shorter lanes are
+# updated by one thread each.
+INTRA_LANE_MIN_VEHICLES = 2048
+
+# Longest launch of the on-device time loop (run_steps_cuda); bounds the
+# light states uploaded per launch.
+DEVICE_LOOP_BLOCK_STEPS = 4096
 
 
 class WorldState:
@@ -197,6 +517,23 @@ class WorldState:
     - traffic lights
     - spawning
     - movement logic (sequential, OpenMP-like)
+
+    Every link of the road network travelled in an active direction is one
+    lane. Vehicles are stored as NumPy columns of shape (num_lanes, capacity)
+    (position, speed, stops, spawn_time, turn, id, destination). Each lane
+    row is a FIFO
+    ring buffer: vehicles enter at the tail at position 0 and leave from the
+    head at lane.length, and never overtake each other, so slot order from
+    the head is always the front-to-back order.
+
+    A vehicle leaving a lane enters the downstream lane its turn selects
+    (lane_next), with a new turn (hop_turn_codes), or leaves the network
+    and is recorded as finished when there is none. Links outside this
+    world (directions of other MPI ranks) count as leaving the network.
+
+    With a routing table, a vehicle instead gets a destination at spawn,
+    uniformly among the exits reachable from its lane, and takes the turns
+    of the shortest route to it; it carries only the destination id.
     """
 
     def __init__(
@@ -209,6 +546,10 @@ class WorldState:
         max_speed: float = 13.9,  # ~50 km/h
         safe_gap: float = 5.0,    # minimum distance between vehicles
         active_directions: Iterable[Direction] | None = None,
+        arrival_process: ArrivalProcess = "bernoulli",
+        precision: Precision = "float64",
+        lane_capacity: int | None = None,
+        routing: RoutingTable | None = None,
     ) -> None:
 
         self.road_network = road_network
@@ -224,16 +565,102 @@ class WorldState:
         else:
             self.active_directions = list(active_directions)
 
-        # Fixed order of directions used by the OpenMP-like kernel
-        self.directions_order: List[Direction] = list(self.active_directions)
+        # Lanes are the network links travelled in the active directions,
+        # in link order: lane_idx -> link id and direction
+        self.lane_links = road_network.links_for_directions(self.active_directions)
+        self.lane_directions = road_network.link_direction[self.lane_links]
+        self.directions_order: List[Direction] = [Direction(d) for d in self.lane_directions.tolist()]
+        num_lanes = len(self.directions_order)
+
+        # Lane geometry indexed by lane_idx
+        self.stop_line_arr = road_network.link_stop_line[self.lane_links]
+        self.lane_length_arr = road_network.link_length[self.lane_links]
 
         self.time: float = 0.0
         self._next_vehicle_id: int = 0
-        self.vehicles: List[Vehicle] = []
+
+        # Per-lane ring buffers. max_vehicles is a global cap, so a single
+        # lane never needs more than that; a smaller lane_capacity bounds
+        # the memory of large networks, and a full lane refuses spawns.
+        if lane_capacity is not None and lane_capacity < 1:
+            raise ValueError("lane_capacity must be at least 1")
+        capacity = max_vehicles if lane_capacity is None else min(lane_capacity, max_vehicles)
+        self.capacity = capacity
+        self.heads = np.zeros(num_lanes, dtype=np.int64)
+        self.counts = np.zeros(num_lanes, dtype=np.int64)
+        self.num_vehicles: int = 0
+
+        # Positions and speeds are stored in the state precision; the
+        # compiled kernels are specialised on it
+        self.precision = precision
+        dtype = state_dtype(precision)
+        self.positions = np.zeros((num_lanes, capacity), dtype=dtype)
+        self.speeds = np.zeros((num_lanes, capacity), dtype=dtype)
+        # Distances below this count as zero in choose_dt: a few ulps of
+        # the longest lane, since a vehicle held at safe_gap in float32 is
+        # only there up to rounding
+        lane_ulp = float(np.finfo(dtype).eps) * float(self.lane_length_arr.max(initial=1.0))
+        self._position_tol = max(ADAPTIVE_TIME_EPS, 4.0 * lane_ulp)
+        self.stops = np.zeros((num_lanes, capacity), dtype=np.int32)
+        self.spawn_times = np.zeros((num_lanes, capacity), dtype=np.float64)
+        self.turns = np.zeros((num_lanes, capacity), dtype=np.int8)
+        self.vehicle_ids = np.zeros((num_lanes, capacity), dtype=np.int64)
+        self.destinations = np.full((num_lanes, capacity), -1, dtype=np.int32)
+
+        # Advance free-flowing lanes several steps at a time in run_lanes_kernel
+        self.free_flow_macro_steps = True
+
+        # Scratch space for lanes updated by several threads; float64 in any
+        # precision, since the sequential leader chain is not rounded to
+        # the state dtype between vehicles
+        self.intra_lane_min_vehicles = INTRA_LANE_MIN_VEHICLES
+        self._scan_targets = np.zeros((num_lanes, capacity), dtype=np.float64)
+        self._scan_positions = np.zeros((num_lanes, capacity), dtype=np.float64)
+
+        # Link-to-link transfers (see _transfer_vehicles); a single
+        # intersection has none and pops finished vehicles directly
+        self.lane_next, self.up_ptr, self.up_lane = lane_transfer_tables(road_network, self.lane_links)
+        self.has_transfers = len(self.up_lane) > 0
+        self.turn_seed = turn_seed_for(random_seed)
+        self._transfer_ok = np.zeros((num_lanes, capacity if self.has_transfers else 0), dtype=np.bool_)
+
+        # Origin-destination routing (see route_tables); None: random turns
+        self.routing = routing
+        self.route_turns, self.reach_ptr, self.reach_dest = route_tables(routing, self.lane_links)
+
+        # Per-lane log of finished vehicles filled by the fused kernel
+        self._finished_tt = np.zeros((num_lanes, capacity), dtype=np.float64)
+        self._finished_stops = np.zeros((num_lanes, capacity), dtype=np.int32)
+        self._finished_counts = np.zeros(num_lanes, dtype=np.int64)
 
         self.metrics_raw = SimulationMetricsRaw()
 
-        self.rng = random.Random(random_seed)
+        # Spawn draws: a Bernoulli trial per lane and step, or Poisson
+        # arrival events. With the latter, steps in which the world is
+        # empty and nobody arrives are skipped instead of simulated.
+        self.arrival_process = arrival_process
+        self.random_seed = random_seed
+        if arrival_process == "bernoulli":
+            self.spawn_uniforms = SpawnUniformStream(random_seed, num_lanes)
+        elif arrival_process == "poisson":
+            self.spawn_uniforms = PoissonArrivalStream(random_seed, num_lanes, spawn_rate)
+        else:
+            raise ValueError(f"Unknown arrival process '{arrival_process}'")
+        self.steps_executed: int = 0
+        self.steps_skipped: int = 0
+
+        # Device copies of the vehicle columns while stepping with step_cuda
+        # (a CudaWorldBuffers) or run_steps_cuda (a CudaDeviceLoop); the
+        # host columns are stale while _host_stale is set, until sync_host
+        # copies them back
+        self._cuda = None
+        self._host_stale = False
+        # Threads per block of the CUDA kernels (at most 1024); launches
+        # use fewer when there is less work
+        self.gpu_block_size = 256
+        # Per-lane spawn RNG of run_steps_cuda, created on first use and
+        # kept across launches
+        self._device_rng = None
 
     # ------------------------ PUBLIC API ------------------------
 
@@ -244,48 +671,327 @@ class WorldState:
         2) update movement of all vehicles in pure Python
         3) remove finished vehicles + collect metrics
         """
+        self._leave_device()
         t_next = self.time + dt
-        light_state = self.lights.get_state(self.time)
+        is_green_arr = self._green_steps(1, dt)[0]
 
-        self._spawn_vehicles(dt)
-        self._update_vehicles_sequential(dt, light_state)
+        self._spawn_vehicles(dt, self._draw_spawn_uniforms(dt)[0])
+        self._update_vehicles_sequential(dt, is_green_arr)
         self._remove_finished_and_update_metrics(t_next)
 
         self.time = t_next
+        self.steps_executed += 1
 
     def step_openmp(self, dt: float) -> None:
         """
-        OpenMP-like step:
+        OpenMP-like step: spawning, movement (parallel over lanes),
+        finish detection and metric collection all run in one fused
+        Numba kernel on the lane ring buffers.
+        """
+        self._run_block(1, dt)
+
+    def run_steps(
+        self,
+        n_steps: int,
+        dt: float,
+        sync_interval: int | None = None,
+        on_sync: Callable[[WorldState], None] | None = None,
+    ) -> None:
+        """
+        Run n_steps OpenMP-like steps with the time loop inside compiled code.
+
+        Control comes back to Python only every sync_interval steps (or once,
+        at the end, if it is None). At those points metrics_raw and the
+        counters are up to date and on_sync(self) is called, if given.
+        The vehicle trajectories are identical to calling step_openmp
+        n_steps times; within a block finished vehicles are recorded lane
+        by lane rather than step by step. Idle steps are skipped as in
+        skip_idle_steps.
+        """
+        block = n_steps if not sync_interval else sync_interval
+        done = 0
+        while done < n_steps:
+            k = min(block, n_steps - done)
+            advanced = 0
+            while advanced < k:
+                advanced += self.skip_idle_steps(dt, k - advanced)
+                if advanced < k:
+                    advanced += self._run_block(k - advanced, dt)
+            done += k
+            if on_sync is not None:
+                on_sync(self)
+
+    def skip_idle_steps(self, dt: float, max_steps: int) -> int:
+        """
+        With Poisson arrivals, jump over the steps (at most max_steps) in
+        which the world stays empty: nothing moves and the lights are a pure
+        function of time, so only the clock advances. It is advanced one dt
+        at a time, so it lands on exactly the value the skipped steps would
+        have produced. Returns the number of skipped steps (always 0 for
+        Bernoulli arrivals).
+        """
+        if self.arrival_process != "poisson" or self.num_vehicles > 0 or max_steps <= 0:
+            return 0
+
+        k = self.spawn_uniforms.steps_until_next_arrival(self.time, dt, max_steps)
+        if k > 0:
+            self.time = float(step_times(self.time, dt, k + 1)[-1])
+            self.steps_skipped += k
+        return k
+
+    def run_adaptive(
+        self,
+        end_time: float,
+        dt_min: float,
+        dt_max: float,
+        step_fn: Callable[[float], None],
+    ) -> None:
+        """
+        Advance the world with step_fn (e.g. self.step) until end_time,
+        choosing every step with choose_dt(dt_min, dt_max).
+        """
+        while end_time - self.time > ADAPTIVE_TIME_EPS:
+            dt = min(self.choose_dt(dt_min, dt_max), end_time - self.time)
+            step_fn(dt)
+
+    def choose_dt(self, dt_min: float, dt_max: float) -> float:
+        """
+        Next time step for adaptive stepping, in [dt_min, dt_max], except
+        that an empty world with Poisson arrivals jumps straight to the next
+        arrival, however far away it is.
+
+        The step ends no later than:
+        - the next traffic-light transition, so a step never straddles a
+          phase change,
+        - the time a vehicle needs to close the smallest free gap (gap
+          beyond safe_gap) to a leader that moves slower than it, at the
+          closing speed max_speed - leader speed,
+        - the time a vehicle behind a red stop line needs to reach it,
+        - the next Poisson arrival (an empty world jumps straight to it).
+        Pairs already at safe_gap, pairs whose leader moves at max_speed
+        (their gap does not shrink) and vehicles already held at the line
+        do not shrink the step. A leader at full speed only slows down when
+        its own leader or a red line holds it, which bounds the step itself.
+
+        dt_min must allow a full-speed move of RED_HOLD_DISTANCE (ValueError
+        otherwise): a vehicle held at a red light waits RED_HOLD_DISTANCE
+        before the stop line and only stays there if a step would carry it
+        across. Shorter steps let it creep forward and be sent back,
+        counting a stop each time.
+        """
+        dt_floor = RED_HOLD_DISTANCE / self.max_speed
+        if dt_min < dt_floor:
+            raise ValueError(
+                f"dt_min must be at least {dt_floor:.4g} s (RED_HOLD_DISTANCE at max_speed)"
+            )
+        if dt_max < dt_min:
+            raise ValueError("dt_max must not be smaller than dt_min")
+        next_arrival = np.inf
+        if self.arrival_process == "poisson":
+            next_arrival = self.spawn_uniforms.next_arrival_time(self.time) - self.time
+            if self.num_vehicles == 0:
+                # nothing moves until then; lights only matter for vehicles
+                return max(next_arrival, dt_min)
+
+        bound = min(dt_max, self.lights.time_to_next_change(self.time))
+        if next_arrival > 0.0:
+            bound = min(bound, next_arrival)
+
+        is_green_arr = self._green_steps(1, dt_max)[0]
+        positions, speeds = self._read_motion()
+        full_speed = speeds.dtype.type(self.max_speed)
+        for lane_idx in range(len(self.directions_order)):
+            if self.counts[lane_idx] == 0:
+                continue
+            slots = self._lane_slots(lane_idx)
+            pos = positions[lane_idx, slots]
+            leader_speed = speeds[lane_idx, slots][:-1]
+
+            free_gaps = pos[:-1] - pos[1:] - self.safe_gap
+            closing = (free_gaps > self._position_tol) & (leader_speed < full_speed)
+            if np.any(closing):
+                closing_speed = self.max_speed - leader_speed[closing].astype(np.float64)
+                bound = min(bound, float((free_gaps[closing] / closing_speed).min()))
+
+            if not is_green_arr[lane_idx]:
+                to_line = self.stop_line_arr[lane_idx] - pos
+                to_line = to_line[to_line > RED_HOLD_DISTANCE + self._position_tol]
+                if len(to_line) > 0:
+                    bound = min(bound, float(to_line.min()) / self.max_speed)
+
+        return min(max(bound, dt_min), dt_max)
+
+    def step_numpy(self, dt: float) -> None:
+        """
+        NumPy step:
         1) spawn new vehicles
-        2) update movement using a Numba-parallel kernel
+        2) update movement lane by lane with a vectorized prefix-min scan
         3) remove finished vehicles + collect metrics
+
+        Same results as step(), with no Numba compilation involved.
         """
+        self._leave_device()
         t_next = self.time + dt
-        light_state = self.lights.get_state(self.time)
+        is_green_arr = self._green_steps(1, dt)[0]
 
-        self._spawn_vehicles(dt)
-        self._update_vehicles_openmp(dt, light_state)
+        self._spawn_vehicles(dt, self._draw_spawn_uniforms(dt)[0])
+        self._update_vehicles_numpy(dt, is_green_arr)
         self._remove_finished_and_update_metrics(t_next)
 
         self.time = t_next
+        self.steps_executed += 1
 
     def step_cuda(self, dt: float) -> None:
         """
         CUDA-like step:
-        1) spawn new vehicles
+        1) spawn new vehicles (decided on the host)
         2) update movement using a Numba CUDA kernel
-        3) remove finished vehicles + collect metrics
+        3) detect finished vehicles on the device, pop + collect metrics
+           (transfers are planned on the host and moved on the device)
 
-        NOTE: this requires a CUDA-capable GPU and proper driver setup.
+        Positions, speeds and stops stay on the device between steps
+        (see CudaWorldBuffers); only a small control block and the finished
+        vehicles' stop counts cross PCIe per step. Call sync_host before
+        reading the vehicle columns directly.
+
+        NOTE: this requires a CUDA-capable GPU and proper driver setup
+        (or NUMBA_ENABLE_CUDASIM=1).
         """
+        from .cuda_state import CudaDeviceLoop
+        if isinstance(self._cuda, CudaDeviceLoop):
+            self._leave_device()
         t_next = self.time + dt
-        light_state = self.lights.get_state(self.time)
+        is_green_arr = self._green_steps(1, dt)[0]
 
-        self._spawn_vehicles(dt)
-        self._update_vehicles_cuda(dt, light_state)
-        self._remove_finished_and_update_metrics(t_next)
+        lanes, slots = self._spawn_vehicles(dt, self._draw_spawn_uniforms(dt)[0])
+        if self.num_vehicles > 0:
+            self._step_vehicles_cuda(dt, is_green_arr, lanes, slots, t_next)
 
         self.time = t_next
+        self.steps_executed += 1
+
+
+    def run_steps_cuda(
+        self,
+        n_steps: int,
+        dt: float,
+        sync_interval: int | None = None,
+        on_sync: Callable[[WorldState], None] | None = None,
+        block_size: int | None = None,
+    ) -> None:
+        """
+        Run n_steps steps with the whole time loop on the GPU
+        (run_lanes_kernel_cuda): spawning, movement, finish detection and
+        the metric reductions all stay on the device, and per launch only
+        the light states go up and a few counters, the travel-time/stop
+        summaries and the quantile bucket counts come back.
+
+        Control comes back to Python every sync_interval steps (and at
+        least every DEVICE_LOOP_BLOCK_STEPS steps); there metrics_raw,
+        num_vehicles and the clock are current and on_sync(self) is
+        called, if given. Call sync_host before reading the vehicle columns.
+
+        Spawn draws come from per-lane xoroshiro128p streams seeded with
+        random_seed, not from the host spawn stream, and a vehicle keeps
+        its gap to where its leader was at the start of the step (the
+        other backends use the leader's new position). Results therefore
+        agree with the other backends statistically, not bit for bit.
+        Only Bernoulli arrivals are supported, and only networks without
+        link-to-link transfers or routing. The loop runs in blocks of
+        block_size threads (gpu_block_size if None): one per group of
+        lanes when they cannot hold more than max_vehicles together,
+        otherwise a single block (see CudaDeviceLoop).
+        """
+        if self.arrival_process != "bernoulli":
+            raise ValueError("run_steps_cuda supports only the 'bernoulli' arrival process")
+        if self.has_transfers:
+            raise ValueError("run_steps_cuda does not transfer vehicles between links")
+        if self.routing is not None:
+            raise ValueError("run_steps_cuda does not route vehicles")
+        if block_size is None:
+            block_size = self.gpu_block_size
+
+        from .cuda_state import CudaDeviceLoop
+        if not isinstance(self._cuda, CudaDeviceLoop):
+            self._leave_device()
+            if self._device_rng is None:
+                from numba.cuda.random import create_xoroshiro128p_states
+                self._device_rng = create_xoroshiro128p_states(
+                    len(self.directions_order), seed=self.random_seed
+                )
+            self._cuda = CudaDeviceLoop(self, self._device_rng)
+
+        block = n_steps if not sync_interval else sync_interval
+        done = 0
+        while done < n_steps:
+            k = min(block, n_steps - done)
+            advanced = 0
+            while advanced < k:
+                m = min(k - advanced, DEVICE_LOOP_BLOCK_STEPS)
+                m = block_steps_for(len(self.directions_order), m)
+                self._cuda.run(self, m, self._green_steps(m, dt), dt, block_size)
+                self._host_stale = True
+                self.time = float(step_times(self.time, dt, m + 1)[-1])
+                self.steps_executed += m
+                advanced += m
+            done += k
+            if on_sync is not None:
+                on_sync(self)
+
+
+    def sync_host(self) -> None:
+        """
+        Copy the device-resident vehicle columns back to the host arrays
+        after step_cuda or run_steps_cuda. A no-op when the host arrays
+        are current.
+        """
+        if self._host_stale:
+            self._cuda.copy_to_host(self)
+            self._host_stale = False
+
+
+    def warmup(self, dt: float, use_cuda: bool = False) -> float:
+        """
+        Compile the kernels this world runs, for its precision, and return
+        the time it took in seconds.
+
+        The world itself is left untouched (clock, RNG streams, vehicles):
+        run_lanes_kernel is called on a throwaway empty world with the same
+        geometry and dtypes, and with use_cuda the CUDA step kernels and
+        the device time loop are launched on its empty lanes. The kernels
+        are cached on disk, so after the first process this mostly loads
+        the compiled code.
+        """
+        with Timer() as t:
+            scratch = WorldState(
+                road_network=self.road_network,
+                lights=self.lights,
+                spawn_rate=self.spawn_rate,
+                max_vehicles=1,
+                max_speed=self.max_speed,
+                safe_gap=self.safe_gap,
+                active_directions=self.active_directions,
+                arrival_process=self.arrival_process,
+                precision=self.precision,
+                lane_capacity=self.capacity,
+                routing=self.routing,
+            )
+            scratch._run_block(1, dt)
+            if use_cuda:
+                from .cuda_state import CudaWorldBuffers
+                none = np.full(len(self.directions_order), -1, dtype=np.int64)
+                CudaWorldBuffers(scratch).step(
+                    scratch.heads, scratch.counts, none, none,
+                    self.safe_gap, dt, self.max_speed,
+                )
+                if (
+                    self.arrival_process == "bernoulli"
+                    and not self.has_transfers
+                    and self.routing is None
+                ):
+                    scratch.spawn_rate = 0.0
+                    scratch.run_steps_cuda(1, dt)
+        return t.elapsed
 
 
     def get_metrics_summary(self, total_sim_time: float) -> Tuple[int, float, float, float]:
@@ -298,307 +1004,535 @@ class WorldState:
         Return simple debug stats:
         - total spawned vehicles
         - how many vehicles are still in the world
+        - how many time steps were simulated / skipped as idle
         """
         return {
             "total_spawned": self.metrics_raw.total_spawned,
-            "vehicles_in_world_end": len(self.vehicles),
+            "vehicles_in_world_end": self.num_vehicles,
+            "steps_executed": self.steps_executed,
+            "steps_skipped": self.steps_skipped,
+            **self.metrics_raw.distribution_stats(),
         }
 
 
-    # ------------------------ INTERNAL LOGIC ------------------------
-
-    def _spawn_vehicles(self, dt: float) -> None:
+    @property
+    def vehicles(self) -> List[Vehicle]:
         """
-        Spawn new vehicles based on spawn_rate probability.
-        For each active direction:
-        - probability = spawn_rate * dt
-        - cap at max_vehicles
+        Snapshot of the vehicles currently in the world as Vehicle objects,
+        lane by lane, front to back. Built on demand from the ring buffers;
+        changes to it are not written back.
         """
-        if len(self.vehicles) >= self.max_vehicles:
-            return
+        self.sync_host()
+        snapshot: List[Vehicle] = []
+        for lane_idx in range(len(self.directions_order)):
+            sel = self._lane_slots(lane_idx)
+            for slot in np.arange(self.capacity)[sel].tolist():
+                snapshot.append(self._vehicle_at(lane_idx, slot))
+        return snapshot
 
-        spawn_prob = self.spawn_rate * dt
-        spawned_now = 0
 
-        for direction in self.active_directions:
-            if len(self.vehicles) >= self.max_vehicles:
-                break
+    def get_vehicle(self, vehicle_id: int) -> Vehicle | None:
+        """
+        The vehicle with this id as a Vehicle object, or None if it is not
+        in the world (not spawned yet, or already finished).
+
+        Ids are handed out in spawn order and vehicles never overtake, so
+        without transfers the ids of a lane increase from front to back and
+        each lane is a binary search; with them it is a linear scan. Like
+        vehicles, the object is a detached copy.
+        """
+        self.sync_host()
+        for lane_idx in range(len(self.directions_order)):
+            ids = self.vehicle_ids[lane_idx, self._lane_slots(lane_idx)]
+            if self.has_transfers:
+                i = int(np.argmax(ids == vehicle_id)) if len(ids) else 0
+            else:
+                i = int(np.searchsorted(ids, vehicle_id))
+            if i < len(ids) and ids[i] == vehicle_id:
+                slot = (int(self.heads[lane_idx]) + i) % self.capacity
+                return self._vehicle_at(lane_idx, slot)
+        return None
 
-            if self.rng.random() < spawn_prob:
-                v = self._create_vehicle(direction)
-                self.vehicles.append(v)
-                spawned_now += 1
 
-        if spawned_now > 0:
-            self.metrics_raw.record_spawned(spawned_now)
+    # ------------------------ INTERNAL LOGIC ------------------------
 
+    def _vehicle_at(self, lane_idx: int, slot: int) -> Vehicle:
+        """Build the Vehicle object of one ring buffer slot."""
+        return Vehicle(
+            id=int(self.vehicle_ids[lane_idx, slot]),
+            direction_code=int(self.directions_order[lane_idx]),
+            turn_code=int(self.turns[lane_idx, slot]),
+            position=float(self.positions[lane_idx, slot]),
+            speed=float(self.speeds[lane_idx, slot]),
+            max_speed=self.max_speed,
+            spawn_time=float(self.spawn_times[lane_idx, slot]),
+            stops_count=int(self.stops[lane_idx, slot]),
+            destination=int(self.destinations[lane_idx, slot]),
+        )
 
-    def _create_vehicle(self, direction: Direction) -> Vehicle:
+
+    def _lane_slots(self, lane_idx: int) -> slice | np.ndarray:
         """
-        Create a new vehicle entering from the given direction.
-        Turning behavior is randomly chosen.
+        Ring buffer slots of one lane, front to back.
+        A plain slice unless the occupied region wraps around.
         """
-        r = self.rng.random()
-        if r < 0.6:
-            turn: TurnChoice = "straight"
-        elif r < 0.8:
-            turn = "right"
-        else:
-            turn = "left"
+        head = int(self.heads[lane_idx])
+        end = head + int(self.counts[lane_idx])
+        if end <= self.capacity:
+            return slice(head, end)
+        return np.r_[head:self.capacity, 0:end - self.capacity]
 
-        vid = self._next_vehicle_id
-        self._next_vehicle_id += 1
 
-        return Vehicle(
-            id=vid,
-            direction=direction,
-            turn_choice=turn,
-            position=0.0,
-            speed=self.max_speed,
-            max_speed=self.max_speed,
-            spawn_time=self.time,
+    def _green_steps(self, n_steps: int, dt: float) -> np.ndarray:
+        """Light state of every lane for the next n_steps steps, shape (n_steps, num_lanes)."""
+        return self.lights.get_states(
+            step_times(self.time, dt, n_steps), self.lane_directions
         )
 
 
+    def _draw_spawn_uniforms(self, dt: float, n_steps: int = 1) -> np.ndarray:
+        """
+        Random numbers used by the next n_steps spawn steps, shape
+        (n_steps, num_lanes, 2): the spawn trial and the turn choice of every lane.
+        Always drawn in full, so every backend consumes the stream the same way.
+        """
+        return self.spawn_uniforms.take(self.time, dt, n_steps)
+
+
+    def _spawn_vehicles(self, dt: float, draws: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Spawn new vehicles based on spawn_rate probability.
+        For each active direction:
+        - probability = spawn_rate * dt
+        - a full lane (capacity) refuses the arrival
+        - cap at max_vehicles (lanes are filled in lane order)
+        - with routing, the turn uniform picks the destination instead
+        All arrivals of the step are pushed onto the lane tails at once.
+        Returns the lanes that received a vehicle and its ring buffer slot.
+        """
+        spawn_prob = self.spawn_rate * dt
+        lanes = np.flatnonzero((draws[:, 0] < spawn_prob) & (self.counts < self.capacity))
+        lanes = lanes[:max(self.max_vehicles - self.num_vehicles, 0)]
+        n = len(lanes)
+        if n == 0:
+            return lanes, lanes
+
+        # Turning behavior: straight < 0.6 <= right < 0.8 <= left
+        turns = SPAWN_TURN_CODES[np.searchsorted(SPAWN_TURN_EDGES, draws[lanes, 1], side="right")]
+        dests = np.full(n, -1, dtype=np.int32)
+        if self.routing is not None:
+            # Destination uniform among those reachable from the lane
+            start = self.reach_ptr[lanes]
+            k = self.reach_ptr[lanes + 1] - start
+            routed = k > 0
+            pick = np.minimum((draws[lanes[routed], 1] * k[routed]).astype(np.int64), k[routed] - 1)
+            dests[routed] = self.reach_dest[start[routed] + pick]
+            turns[routed] = self.route_turns[dests[routed], self.lane_links[lanes[routed]]]
+
+        slots = (self.heads[lanes] + self.counts[lanes]) % self.capacity
+        self.positions[lanes, slots] = 0.0
+        self.speeds[lanes, slots] = self.max_speed
+        self.stops[lanes, slots] = 0
+        self.spawn_times[lanes, slots] = self.time
+        self.turns[lanes, slots] = turns
+        self.vehicle_ids[lanes, slots] = self._next_vehicle_id + np.arange(n)
+        self.destinations[lanes, slots] = dests
+
+        self.counts[lanes] += 1
+        self.num_vehicles += n
+        self._next_vehicle_id += n
+        self.metrics_raw.record_spawned(n)
+        return lanes, slots
+
+
     # ---------- Sequential update (used by SequentialBackend and MPI ranks) ----------
 
 
-    def _update_vehicles_sequential(self, dt: float, light_state: Dict[Direction, bool]) -> None:
+    def _update_vehicles_sequential(self, dt: float, is_green_arr: np.ndarray) -> None:
         """
         Pure Python sequential update of vehicle movement.
         This is the reference implementation.
         """
-        by_dir: Dict[Direction, List[Vehicle]] = {d: [] for d in self.active_directions}
-        for v in self.vehicles:
-            by_dir[v.direction].append(v)
+        max_speed = self.max_speed
 
-        for d in self.active_directions:
-            vehicles = by_dir[d]
-            if not vehicles:
+        for lane_idx in range(len(self.directions_order)):
+            if self.counts[lane_idx] == 0:
                 continue
 
-            lane = self.road_network.get_lane(d)
-            is_green = light_state[d]
+            stop_line = float(self.stop_line_arr[lane_idx])
+            lane_length = float(self.lane_length_arr[lane_idx])
+            is_green = is_green_arr[lane_idx]
 
-            vehicles.sort(key=lambda v: v.position, reverse=True)
+            sel = self._lane_slots(lane_idx)
+            positions = self.positions[lane_idx, sel].tolist()
+            speeds = self.speeds[lane_idx, sel].tolist()
+            stops = self.stops[lane_idx, sel].tolist()
 
-            front_vehicle: Vehicle | None = None
-            for v in vehicles:
-                desired_pos = v.position + v.max_speed * dt
-                new_speed = v.max_speed
+            front_pos: float | None = None
+            for i in range(len(positions)):
+                old_pos = positions[i]
+                desired_pos = old_pos + max_speed * dt
+                new_speed = max_speed
 
-                if front_vehicle is not None:
-                    max_pos = front_vehicle.position - self.safe_gap
+                if front_pos is not None:
+                    max_pos = front_pos - self.safe_gap
                     if desired_pos > max_pos:
                         desired_pos = max_pos
-                        if desired_pos <= v.position + 1e-3:
+                        if desired_pos <= old_pos + 1e-3:
                             new_speed = 0.0
 
                 if not is_green:
-                    stop_line = lane.stop_line_pos
-                    if v.position < stop_line and desired_pos >= stop_line:
+                    if old_pos < stop_line and desired_pos >= stop_line:
                         desired_pos = stop_line - 0.5
-                        if desired_pos <= v.position + 1e-3:
+                        if desired_pos <= old_pos + 1e-3:
                             new_speed = 0.0
 
-                if v.speed > 0.1 and new_speed <= 0.1:
-                    v.stops_count += 1
+                if speeds[i] > 0.1 and new_speed <= 0.1:
+                    stops[i] += 1
 
                 if desired_pos < 0.0:
                     desired_pos = 0.0
-                if desired_pos > lane.length + 20.0:
-                    desired_pos = lane.length + 20.0
+                if desired_pos > lane_length + 20.0:
+                    desired_pos = lane_length + 20.0
 
-                v.position = desired_pos
-                v.speed = new_speed
+                positions[i] = desired_pos
+                speeds[i] = new_speed
 
-                front_vehicle = v
+                front_pos = desired_pos
 
+            self.positions[lane_idx, sel] = positions
+            self.speeds[lane_idx, sel] = speeds
+            self.stops[lane_idx, sel] = stops
 
-    # ---------- OpenMP-like update using Numba ----------
 
+    # ---------- Vectorized NumPy update ----------
 
-    def _update_vehicles_openmp(self, dt: float, light_state: Dict[Direction, bool]) -> None:
-        """
-        Update vehicle movement using a Numba-parallel kernel.
-        The logic is equivalent to the sequential version, but operates
-        on NumPy arrays for better performance and easier parallelization.
-        """
-        directions_order = self.directions_order
-        num_lanes = len(directions_order)
 
-        # Group vehicles by direction and sort by position descending
-        vehicles_per_lane: List[List[Vehicle]] = []
-        max_n = 0
+    def _update_vehicles_numpy(self, dt: float, is_green_arr: np.ndarray) -> None:
+        """Update vehicle movement with update_lane_numpy, one call per lane."""
+        for lane_idx in range(len(self.directions_order)):
+            if self.counts[lane_idx] == 0:
+                continue
 
-        for d in directions_order:
-            lane_vehicles = [v for v in self.vehicles if v.direction == d]
-            lane_vehicles.sort(key=lambda v: v.position, reverse=True)
-            vehicles_per_lane.append(lane_vehicles)
-            if len(lane_vehicles) > max_n:
-                max_n = len(lane_vehicles)
+            sel = self._lane_slots(lane_idx)
+            pos, speed, stops = update_lane_numpy(
+                self.positions[lane_idx, sel],
+                self.speeds[lane_idx, sel],
+                self.stops[lane_idx, sel],
+                is_green_arr[lane_idx],
+                self.stop_line_arr[lane_idx],
+                self.lane_length_arr[lane_idx],
+                self.safe_gap,
+                dt,
+                self.max_speed,
+            )
+            self.positions[lane_idx, sel] = pos
+            self.speeds[lane_idx, sel] = speed
+            self.stops[lane_idx, sel] = stops
 
-        if max_n == 0:
-            return
 
-        # Allocate arrays for positions, speeds, stops
-        positions = np.zeros((num_lanes, max_n), dtype=np.float64)
-        speeds = np.zeros((num_lanes, max_n), dtype=np.float64)
-        stops = np.zeros((num_lanes, max_n), dtype=np.int32)
-        counts = np.zeros(num_lanes, dtype=np.int32)
-
-        is_green_arr = np.zeros(num_lanes, dtype=np.bool_)
-        stop_line_arr = np.zeros(num_lanes, dtype=np.float64)
-        lane_length_arr = np.zeros(num_lanes, dtype=np.float64)
-
-        # Fill arrays from current vehicle objects
-        for lane_idx, d in enumerate(directions_order):
-            lane_vehicles = vehicles_per_lane[lane_idx]
-            n = len(lane_vehicles)
-            counts[lane_idx] = n
-
-            lane = self.road_network.get_lane(d)
-            is_green_arr[lane_idx] = light_state[d]
-            stop_line_arr[lane_idx] = lane.stop_line_pos
-            lane_length_arr[lane_idx] = lane.length
-
-            for i, v in enumerate(lane_vehicles):
-                positions[lane_idx, i] = v.position
-                speeds[lane_idx, i] = v.speed
-                stops[lane_idx, i] = v.stops_count
-
-        # Run Numba kernel
-        update_lanes_kernel(
-            positions,
-            speeds,
-            stops,
-            counts,
-            is_green_arr,
-            stop_line_arr,
-            lane_length_arr,
-            self.safe_gap,
-            dt,
-            self.max_speed,
-        )
+    # ---------- CUDA update ----------
 
-        # Write back updated values to vehicle objects
-        for lane_idx, d in enumerate(directions_order):
-            lane_vehicles = vehicles_per_lane[lane_idx]
-            n = counts[lane_idx]
-            for i in range(n):
-                v = lane_vehicles[i]
-                v.position = float(positions[lane_idx, i])
-                v.speed = float(speeds[lane_idx, i])
-                v.stops_count = int(stops[lane_idx, i])
 
+    def _step_vehicles_cuda(
+        self,
+        dt: float,
+        is_green_arr: np.ndarray,
+        spawn_lanes: np.ndarray,
+        spawn_slots: np.ndarray,
+        t_next: float,
+    ) -> None:
+        """
+        Move all vehicles and detect finished ones on the device, then pop
+        the finished vehicles from the host heads/counts and record them.
+        The device buffers are created (and the host columns uploaded) on
+        the first call after a host-side step.
+        """
+        if self._cuda is None:
+            from .cuda_state import CudaWorldBuffers
+            self._cuda = CudaWorldBuffers(self)
+
+        slots = np.full(len(self.directions_order), -1, dtype=np.int64)
+        slots[spawn_lanes] = spawn_slots
+        pop_counts, pop_stops = self._cuda.step(
+            self.heads, self.counts, slots, is_green_arr,
+            self.safe_gap, dt, self.max_speed,
+        )
+        self._host_stale = True
 
-    def _update_vehicles_cuda(self, dt: float, light_state: Dict[Direction, bool]) -> None:
+        if self.has_transfers:
+            self._transfer_vehicles(t_next, pop_counts, pop_stops)
+            return
+        for lane_idx in np.flatnonzero(pop_counts).tolist():
+            k = int(pop_counts[lane_idx])
+            head = int(self.heads[lane_idx])
+            done = (head + np.arange(k)) % self.capacity
+            self.metrics_raw.record_finished_many(
+                t_next - self.spawn_times[lane_idx, done],
+                pop_stops[:k, lane_idx],
+            )
+            self.heads[lane_idx] = (head + k) % self.capacity
+            self.counts[lane_idx] -= k
+            self.num_vehicles -= k
+
+
+    def _read_motion(self) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Update vehicle movement using a Numba CUDA kernel.
+        Current vehicle positions and speeds, for reading only. After
+        step_cuda only these two come back from the device (lane heads and
+        counts are kept on the host), so the other columns stay resident there.
+        """
+        if not self._host_stale:
+            return self.positions, self.speeds
+        from .cuda_state import CudaWorldBuffers
+        if isinstance(self._cuda, CudaWorldBuffers):
+            return self._cuda.motion_to_host()
+        self.sync_host()
+        return self.positions, self.speeds
+
 
-        This is similar to the OpenMP-like implementation, but the core
-        update loop runs on the GPU.
+    def _leave_device(self) -> None:
+        """
+        Bring the vehicle columns back to the host and drop the device
+        buffers before a host-side step modifies them; the next step_cuda
+        uploads them again.
         """
-        directions_order = self.directions_order
-        num_lanes = len(directions_order)
+        if self._cuda is not None:
+            self.sync_host()
+            self._cuda = None
 
-        # Group vehicles by direction and sort by position descending
-        vehicles_per_lane: List[List[Vehicle]] = []
-        max_n = 0
 
-        for d in directions_order:
-            lane_vehicles = [v for v in self.vehicles if v.direction == d]
-            lane_vehicles.sort(key=lambda v: v.position, reverse=True)
-            vehicles_per_lane.append(lane_vehicles)
-            if len(lane_vehicles) > max_n:
-                max_n = len(lane_vehicles)
+    # ---------- Finish handling ----------
 
-        if max_n == 0:
+    def _remove_finished_and_update_metrics(self, t_next: float) -> None:
+        """
+        Pop vehicles that have reached the end of their lane.
+        A vehicle is considered finished if: position >= lane.length.
+        Finished vehicles are always at the head of their lane, so this
+        costs O(finished) rather than a pass over every vehicle. With
+        link-to-link transfers they go to _transfer_vehicles instead.
+        """
+        if self.has_transfers:
+            self._transfer_vehicles(t_next, self._exit_counts())
             return
+        capacity = self.capacity
+
+        for lane_idx in range(len(self.directions_order)):
+            n = int(self.counts[lane_idx])
+            head = int(self.heads[lane_idx])
+            lane_length = self.lane_length_arr[lane_idx]
+            positions = self.positions[lane_idx]
+
+            k = 0
+            while k < n and positions[(head + k) % capacity] >= lane_length:
+                k += 1
+            if k == 0:
+                continue
 
-        # Allocate host arrays
-        old_positions = np.zeros((num_lanes, max_n), dtype=np.float64)
-        old_speeds = np.zeros((num_lanes, max_n), dtype=np.float64)
-        stops = np.zeros((num_lanes, max_n), dtype=np.int32)
-        counts = np.zeros(num_lanes, dtype=np.int32)
-
-        is_green_arr = np.zeros(num_lanes, dtype=np.bool_)
-        stop_line_arr = np.zeros(num_lanes, dtype=np.float64)
-        lane_length_arr = np.zeros(num_lanes, dtype=np.float64)
-
-        # Fill arrays from vehicles and lane geometry
-        for lane_idx, d in enumerate(directions_order):
-            lane_vehicles = vehicles_per_lane[lane_idx]
-            n = len(lane_vehicles)
-            counts[lane_idx] = n
-
-            lane = self.road_network.get_lane(d)
-            is_green_arr[lane_idx] = light_state[d]
-            stop_line_arr[lane_idx] = lane.stop_line_pos
-            lane_length_arr[lane_idx] = lane.length
-
-            for i, v in enumerate(lane_vehicles):
-                old_positions[lane_idx, i] = v.position
-                old_speeds[lane_idx, i] = v.speed
-                stops[lane_idx, i] = v.stops_count
-
-        # Transfer data to GPU
-        d_old_positions = cuda.to_device(old_positions)
-        d_old_speeds = cuda.to_device(old_speeds)
-        d_stops = cuda.to_device(stops)
-        d_counts = cuda.to_device(counts)
-        d_is_green = cuda.to_device(is_green_arr)
-        d_stop_line = cuda.to_device(stop_line_arr)
-        d_lane_length = cuda.to_device(lane_length_arr)
-
-        # Configure CUDA grid: one block per lane, max_n threads per block (clamped)
-        threads_per_block = min(256, max_n)
-        blocks_per_grid = num_lanes
-
-        update_lanes_kernel_cuda[blocks_per_grid, threads_per_block](
-            d_old_positions,
-            d_old_speeds,
-            d_stops,
-            d_counts,
-            d_is_green,
-            d_stop_line,
-            d_lane_length,
-            self.safe_gap,
-            dt,
-            self.max_speed,
-        )
+            done = (head + np.arange(k)) % capacity
+            self.metrics_raw.record_finished_many(
+                t_next - self.spawn_times[lane_idx, done],
+                self.stops[lane_idx, done],
+            )
 
-        # Copy results back to host
-        d_old_positions.copy_to_host(old_positions)
-        d_old_speeds.copy_to_host(old_speeds)
-        d_stops.copy_to_host(stops)
+            self.heads[lane_idx] = (head + k) % capacity
+            self.counts[lane_idx] = n - k
+            self.num_vehicles -= k
 
-        # Write back to vehicle objects
-        for lane_idx, d in enumerate(directions_order):
-            lane_vehicles = vehicles_per_lane[lane_idx]
-            n = counts[lane_idx]
-            for i in range(n):
-                v = lane_vehicles[i]
-                v.position = float(old_positions[lane_idx, i])
-                v.speed = float(old_speeds[lane_idx, i])
-                v.stops_count = int(stops[lane_idx, i])
 
+    def _exit_counts(self) -> np.ndarray:
+        """
+        Number of vehicles at the head of every lane that reached its end,
+        one vectorized pass over the lanes per vehicle depth.
+        """
+        exits = np.zeros(len(self.directions_order), dtype=np.int64)
+        lanes = np.flatnonzero(self.counts)
+        while len(lanes) > 0:
+            slots = (self.heads[lanes] + exits[lanes]) % self.capacity
+            lanes = lanes[self.positions[lanes, slots] >= self.lane_length_arr[lanes]]
+            exits[lanes] += 1
+            lanes = lanes[exits[lanes] < self.counts[lanes]]
+        return exits
 
-    # ---------- Finish handling ----------
 
-    def _remove_finished_and_update_metrics(self, t_next: float) -> None:
+    def _transfer_vehicles(
+        self,
+        t_next: float,
+        exits: np.ndarray,
+        exit_stops: np.ndarray | None = None,
+    ) -> None:
         """
-        Remove vehicles that have reached the end of their lane.
-        A vehicle is considered finished if: position >= lane.length.
+        Hand the exits[lane] vehicles at the head of every lane that reached
+        its end over to the lane their turn selects (lane_next), all lanes at
+        once with array operations; vehicles with no downstream lane leave
+        the network and are recorded as finished.
+
+        Every downstream lane takes the vehicles of its upstream lanes in
+        lane order, front to back, while it has free slots (counted before
+        this step's pops). A refused vehicle waits at the head of its lane
+        and holds up everyone behind it. Transferred vehicles enter at
+        position 0 with their speed, stops, spawn time and id, and a new
+        turn. Same rules as cpu_kernels._transfer_vehicles.
+
+        On the device path (step_cuda) exit_stops holds the (k, lane) stop
+        counts of the exiting vehicles and the moves of the device-resident
+        columns are done by the CUDA buffers.
         """
-        remaining: List[Vehicle] = []
-
-        for v in self.vehicles:
-            lane = self.road_network.get_lane(v.direction)
-            if v.position >= lane.length:
-                v.mark_finished(t_next)
-                self.metrics_raw.record_finished(v)
+        capacity = self.capacity
+        num_lanes = len(exits)
+        lanes = np.repeat(np.arange(num_lanes), exits)
+        k = np.arange(len(lanes)) - np.repeat(np.cumsum(exits) - exits, exits)
+        slots = (self.heads[lanes] + k) % capacity
+        dest = self.lane_next[lanes, self.turns[lanes, slots]]
+
+        # Pull order of every downstream lane, then who fits
+        moving = np.flatnonzero(dest >= 0)
+        moving = moving[np.argsort(dest[moving], kind="stable")]
+        free = capacity - self.counts
+        ok = dest < 0
+        ok[moving] = _rank_in_groups(dest[moving]) < free[dest[moving]]
+
+        # Vehicles never overtake: a lane empties only up to its first refusal
+        leave = exits.copy()
+        np.minimum.at(leave, lanes[~ok], k[~ok])
+        leaves = k < leave[lanes]
+
+        done = leaves & (dest < 0)
+        if done.any():
+            stops = (
+                self.stops[lanes[done], slots[done]] if exit_stops is None
+                else exit_stops[k[done], lanes[done]]
+            )
+            self.metrics_raw.record_finished_many(
+                t_next - self.spawn_times[lanes[done], slots[done]], stops
+            )
+            self.num_vehicles -= int(done.sum())
+
+        moving = moving[leaves[moving]]
+        if len(moving) > 0:
+            src_lanes, src_slots = lanes[moving], slots[moving]
+            dst_lanes = dest[moving]
+            dst_slots = (
+                self.heads[dst_lanes] + self.counts[dst_lanes] + _rank_in_groups(dst_lanes)
+            ) % capacity
+
+            # Next turn of the route, or a hop turn for unrouted vehicles
+            ids = self.vehicle_ids[src_lanes, src_slots]
+            dests = self.destinations[src_lanes, src_slots]
+            links = self.lane_links[dst_lanes]
+            turns = hop_turn_codes(self.turn_seed, ids, links)
+            routed = np.flatnonzero(dests >= 0)
+            route = self.route_turns[dests[routed], links[routed]]
+            turns[routed] = np.where(route >= 0, route, turns[routed])
+
+            self.spawn_times[dst_lanes, dst_slots] = self.spawn_times[src_lanes, src_slots]
+            self.vehicle_ids[dst_lanes, dst_slots] = ids
+            self.destinations[dst_lanes, dst_slots] = dests
+            self.turns[dst_lanes, dst_slots] = turns
+            if exit_stops is None:
+                self.positions[dst_lanes, dst_slots] = 0.0
+                self.speeds[dst_lanes, dst_slots] = self.speeds[src_lanes, src_slots]
+                self.stops[dst_lanes, dst_slots] = self.stops[src_lanes, src_slots]
             else:
-                remaining.append(v)
+                self._cuda.move_vehicles(src_lanes, src_slots, dst_lanes, dst_slots)
+            self.counts += np.bincount(dst_lanes, minlength=num_lanes)
+
+        self.heads[:] = (self.heads + leave) % capacity
+        self.counts -= leave
 
-        self.vehicles = remaining
+
+    def _run_block(self, n_steps: int, dt: float) -> int:
+        """
+        Run up to n_steps steps in run_lanes_kernel and sync the Python-side
+        state. With Poisson arrivals the block ends early once the world is
+        empty (see skip_idle_steps). Returns the number of steps run.
+        """
+        self._leave_device()
+        per_step = log_entries_per_step(self.capacity, self.safe_gap, self.has_transfers)
+        n_steps = block_steps_for(len(self.directions_order) * per_step, n_steps)
+        event_driven = self.arrival_process == "poisson"
+        if event_driven:
+            n_steps = min(n_steps, EVENT_BLOCK_STEPS)
+            draws = self.spawn_uniforms.peek(self.time, dt, n_steps)
+        else:
+            draws = self._draw_spawn_uniforms(dt, n_steps)
+        is_green_steps = self._green_steps(n_steps, dt)
+
+        # A lane can finish at most its current vehicles plus per_step per step
+        log_size = int(self.counts.max()) + n_steps * per_step
+        if self._finished_tt.shape[1] < log_size:
+            num_lanes = len(self.directions_order)
+            self._finished_tt = np.zeros((num_lanes, log_size), dtype=np.float64)
+            self._finished_stops = np.zeros((num_lanes, log_size), dtype=np.int32)
+
+        from numba import get_num_threads
+        run_lanes_kernel = get_kernel("run_lanes_kernel")
+
+        steps_run, spawned, finished, t_end = run_lanes_kernel(
+            n_steps,
+            self.positions,
+            self.speeds,
+            self.stops,
+            self.spawn_times,
+            self.turns,
+            self.vehicle_ids,
+            self.destinations,
+            self.heads,
+            self.counts,
+            draws,
+            self.spawn_rate * dt,
+            self.num_vehicles,
+            self.max_vehicles,
+            self._next_vehicle_id,
+            self.time,
+            is_green_steps,
+            self.stop_line_arr,
+            self.lane_length_arr,
+            self.safe_gap,
+            dt,
+            self.max_speed,
+            self._finished_tt,
+            self._finished_stops,
+            self._finished_counts,
+            self._scan_targets,
+            self._scan_positions,
+            self.intra_lane_min_vehicles,
+            get_num_threads(),
+            event_driven,
+            self.free_flow_macro_steps,
+            self.lane_next,
+            self.lane_links,
+            self.up_ptr,
+            self.up_lane,
+            self._transfer_ok,
+            self.turn_seed,
+            self.route_turns,
+            self.reach_ptr,
+            self.reach_dest,
+        )
+        if event_driven:
+            self.spawn_uniforms.commit(steps_run)
+
+        self._next_vehicle_id += spawned
+        self.num_vehicles += spawned - finished
+        if spawned > 0:
+            self.metrics_raw.record_spawned(spawned)
+        if finished > 0:
+            self._drain_finished_log()
+
+        self.time = t_end
+        self.steps_executed += steps_run
+        return steps_run
+
+
+    def _drain_finished_log(self) -> None:
+        """Move the finished-vehicle log written by the kernel into metrics_raw."""
+        for lane_idx in range(len(self.directions_order)):
+            k = self._finished_counts[lane_idx]
+            if k == 0:
+                continue
+            self.metrics_raw.record_finished_many(
+                self._finished_tt[lane_idx, :k],
+                self._finished_stops[lane_idx, :k],
+            )
+        self._finished_counts[:] = 0